@@ -1,35 +1,199 @@
-from llm import *
-from util.request import get_yesterday_arxiv_papers
+from llm import get_model
+from llm.batch import Batch
+from util.request import ArxivFetcher
 from util.construct_email import *
-from tqdm import tqdm
+from util.mailer import Mailer
+from util.journal import RunJournal
+from util.prefilter import BM25Index, extract_terms, keyword_scores
+from util.tokens import estimate_tokens
+from util.records import AbstractSpill, PaperRecord, TopK
+from util.pdf import PdfFetcher
+from util.workqueue import Broker
+from util.interest import InterestProfiles
+from util.dedup import NearDuplicateIndex
+from util import profiler
+import hashlib
 import json
 import os
+from collections import Counter, OrderedDict
 from datetime import datetime
 import time
-import random
-import smtplib
-from email.header import Header
-from email.utils import parseaddr, formataddr
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import threading
 
 
+class RunCancelled(Exception):
+    pass
+
+
+class CascadeStats:
+    """模型级联的统计：初筛数、升级数，以及升级论文上小模型与主模型评分的一致性。"""
+
+    def __init__(self, agree_within: float = 1.5):
+        self.agree_within = agree_within
+        self.triaged = 0
+        self.escalated = 0
+        self.compared = 0
+        self.agreed = 0
+        self.total_diff = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, triage: dict, escalated: bool, final: dict = None):
+        """
+        triage: 小模型结果（失败为 None）；escalated: 是否决定交给主模型，
+        主模型随后失败也计为升级；final: 主模型的结果，未升级或失败时为 None
+        """
+        with self.lock:
+            self.triaged += 1
+            if not escalated:
+                return
+            self.escalated += 1
+            if triage is not None and final is not None:
+                diff = abs(triage["relevance_score"] - final["relevance_score"])
+                self.compared += 1
+                self.total_diff += diff
+                self.agreed += diff <= self.agree_within
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "triaged": self.triaged,
+                "escalated": self.escalated,
+                "agreement": self.agreed / self.compared if self.compared else None,
+                "mean_abs_diff": self.total_diff / self.compared if self.compared else None,
+            }
+
+
+class RunContext:
+    """
+    一次运行的输入与状态（研究描述、语言、进度回调、取消信号）。
+    ArxivDaily 本身只保存可复用的长期资源，因此同一个实例可以服务多次运行。
+    """
+
+    def __init__(
+        self,
+        description: str,
+        language: str = "zh",
+        on_event=None,
+        cancel_event: threading.Event = None,
+        journal: RunJournal = None,
+        deadline: float = None,
+        interest: str = None,
+    ):
+        """
+        on_event: 可选回调，接收进度事件 dict（阶段切换、单篇评分、当前 top-K）
+        cancel_event: 可选 threading.Event，被 set 后运行会尽快以 RunCancelled 终止
+        journal: 可选 RunJournal，记录已完成的论文与阶段，用于崩溃后续跑
+        deadline: 可选，评分阶段的截止时间（time.monotonic() 时间点）
+        interest: 可选，已编译的兴趣画像，逐篇评分的提示词用它代替完整描述
+        """
+        self.description = description
+        self.interest = interest
+        self.journal = journal
+        self.language = language
+        self.on_event = on_event
+        self.cancel_event = cancel_event
+        self.summary = ""
+        self.cascade = CascadeStats()
+        self.stats = Counter()  # 评分、缓存命中、重试、超时等计数，用于运行总结
+        self.stats_lock = threading.Lock()
+        self.user_prompt, self.zotero_analysis = ArxivDaily.parse_description(description)
+        self.user_prompt_weight = ArxivDaily.compute_user_prompt_weight(self.user_prompt)
+        self.zotero_weight = 1 - self.user_prompt_weight
+        self.deadline = deadline
+        if self.user_prompt or self.zotero_analysis:
+            self.terms = extract_terms(self.user_prompt, self.zotero_analysis, self.user_prompt_weight)
+        else:
+            self.terms = extract_terms(description, "", 1.0)
+        # 同一描述与语言下的评分结果可以跨运行复用
+        self.profile_key = hashlib.sha256(
+            f"{language}\n{description}".encode("utf-8")
+        ).hexdigest()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def time_left(self):
+        if self.deadline is None:
+            return float("inf")
+        return self.deadline - time.monotonic()
+
+    def wait_timeout(self):
+        """等待在途任务的超时：到截止时间为止，没有截止时间时定期醒来检查取消。"""
+        return max(0.0, min(self.time_left(), 1.0))
+
+    def emit(self, event_type: str, **data):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event({"type": event_type, **data})
+        except Exception as e:
+            print(f"进度回调出错: {e}")
+
+    def count(self, key: str, n: int = 1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise RunCancelled("Run cancelled.")
+
+
 class ArxivDaily:
     def __init__(
         self,
-        categories: list[str],
-        max_entries: int,
         max_paper_num: int,
         provider: str,
         model: str,
         base_url: None,
         api_key: None,
-        description: str,
         num_workers: int,
         temperature: float,
-        save_dir: None,
-        language: str = "zh",
+        save_dir: None = None,
+        fetcher: ArxivFetcher = None,
+        llm=None,
+        max_cache_size: int = 20000,
+        max_email_bytes: int = DEFAULT_MAX_BYTES,
+        plain_text: bool = False,
+        pdf_fetcher: PdfFetcher = None,
+        full_text_top: int = 10,
+        triage_llm=None,
+        escalate_min: float = 4.0,
+        escalate_max: float = 10.0,
+        paper_timeout: float = None,
+        broker: Broker = None,
+        interest_budget: int = 300,
+        interest_dir: str = None,
+        dedup_threshold: float = 0.8,
+        batch: Batch = None,
+        prefilter_keep: float = None,
     ):
+        """
+        长期存活的推荐引擎：持有模型客户端、线程池和评分缓存，可在多次运行、多个用户描述之间复用。
+        fetcher: 论文抓取组件，默认为 ArxivFetcher，可注入以便测试或替换数据源
+        llm: 可选，直接注入已构造好的模型对象（需实现 inference）
+        max_email_bytes: 邮件 HTML 的字节上限，超出时缩短 TLDR 或折叠靠后的论文；None 表示不限制
+        plain_text: 发送邮件时是否附带纯文本备选正文
+        pdf_fetcher: 可选 util.pdf.PdfFetcher；给出时排名前 full_text_top 的论文会根据
+            PDF 的引言与结论重新总结。评分期间进入前列的论文会提前在后台下载
+        triage_llm: 可选的小模型，负责逐篇初筛评分；初筛得分在 [escalate_min, escalate_max]
+            内的论文再交给主模型重新评分和总结，主模型同时负责总体总结
+        paper_timeout: 单篇论文（含重试）的时间上限（秒），从工作线程开始处理时计时，超时的论文被放弃，
+            不再占用调度名额。截止时间同时传给模型，单次请求的超时不超过剩余时间
+        broker: 可选 util.workqueue.Broker；给出时评分任务提交到共享队列，由 worker.py 启动的
+            进程（SQLite 队列限于同一台机器）完成，本进程只负责收集结果
+        interest_budget: 逐篇评分提示词中兴趣画像的 token 预算；描述超出预算时由主模型编译为
+            紧凑画像（每个描述只编译一次）。0 或 None 表示嵌入完整描述
+        interest_dir: 可选，编译好的画像按描述哈希缓存在该目录
+        dedup_threshold: 标题加摘要的估计 Jaccard 相似度达到该值的论文视为近重复，
+            直接继承已评分论文的结果（包括之前运行评过的），邮件中归到原论文下。0 或 None 表示关闭
+        batch: 可选 llm.batch.Batch；给出时逐篇评分请求通过 Batch API 一次提交，
+            延迟换成本和速率限制余量，适合回填和周报等不着急的运行
+        prefilter_keep: 可选，BM25 预筛保留的比例：当天论文按与描述中英文关键词的匹配度排序，
+            只有前 prefilter_keep 比例（至少 max_paper_num 篇）交给 LLM；描述中写成 "-term" 的词扣分。
+            描述中没有英文关键词时不过滤
+        """
         self.model_name = model
         self.base_url = base_url
         self.api_key = api_key
@@ -37,38 +201,72 @@ class ArxivDaily:
         self.save_dir = save_dir
         self.num_workers = num_workers
         self.temperature = temperature
-        self.language = language
-        self.papers = {}
-        for category in categories:
-            self.papers[category] = get_yesterday_arxiv_papers(category, max_entries)
+        self.max_email_bytes = max_email_bytes
+        self.plain_text = plain_text
+        self.pdf_fetcher = pdf_fetcher
+        self.full_text_top = full_text_top
+        self.triage_model = triage_llm
+        self.escalate_min = escalate_min
+        self.escalate_max = escalate_max
+        self.paper_timeout = paper_timeout
+        self.full_text_latency = 0.0  # 全文总结单次 LLM 调用的平滑延迟，用于判断剩余时间是否够用
+        self.broker = broker
+        self.batch = batch
+        self.prefilter_keep = prefilter_keep
+        self.interests = InterestProfiles(interest_dir, interest_budget) if interest_budget else None
+        self.dedup = NearDuplicateIndex(dedup_threshold, max_size=max_cache_size) if dedup_threshold else None
+        self.fetcher = fetcher if fetcher is not None else ArxivFetcher()
+
+        if llm is None:
+            provider = provider.lower()
+            llm = get_model(provider, model, base_url, api_key)
             print(
-                "{} papers on arXiv for {} are fetched.".format(
-                    len(self.papers[category]), category
+                "Model initialized successfully. Using {} provided by {}.".format(
+                    model, provider
                 )
             )
-            # avoid being blocked
-            sleep_time = random.randint(5, 15)
-            time.sleep(sleep_time)
-
-        provider = provider.lower()
-        if provider == "ollama":
-            self.model = Ollama(model)
-        elif provider == "openai" or provider == "siliconflow":
-            self.model = GPT(model, base_url, api_key)
-        else:
-            assert False, "Model not supported."
-        print(
-            "Model initialized successfully. Using {} provided by {}.".format(
-                model, provider
-            )
-        )
+        self.model = llm
 
-        self.description = description
-        self.user_prompt, self.zotero_analysis = self.parse_description(description)
-        self.user_prompt_weight = self.compute_user_prompt_weight(self.user_prompt)
-        self.zotero_weight = 1 - self.user_prompt_weight
+        self.executor = ThreadPoolExecutor(num_workers, thread_name_prefix="arxiv-llm")
+        self.max_cache_size = max_cache_size
+        self.score_cache = OrderedDict()  # (profile_key, arXiv_id) -> (summary, relevance_score)
         self.lock = threading.Lock()  # 添加线程锁
 
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(
+        self,
+        categories: list[str],
+        max_entries: int,
+        on_event=None,
+        cancel_event: threading.Event = None,
+        refresh: bool = False,
+    ):
+        """
+        抓取各类别昨天的论文，返回 {category: [paper, ...]}。on_event、cancel_event 同 run()。
+        refresh: 不使用抓取器当天的缓存
+        """
+
+        def on_fetched(category, papers):
+            if on_event is not None:
+                on_event({"type": "fetched", "category": category, "count": len(papers)})
+
+        if on_event is not None:
+            on_event({"type": "stage", "stage": "fetch"})
+        papers = self.fetcher.fetch(
+            categories, max_entries, on_fetched=on_fetched, cancel_event=cancel_event, refresh=refresh
+        )
+        if cancel_event is not None and cancel_event.is_set():
+            raise RunCancelled("Run cancelled.")
+        return papers
+
     @staticmethod
     def parse_description(description: str):
         """
@@ -100,7 +298,8 @@ class ArxivDaily:
         else:
             return 0.0
 
-    def get_language_instruction(self):
+    @staticmethod
+    def get_language_instruction(language: str):
         """根据语言返回相应的指令"""
         language_instructions = {
             "zh": "使用中文回答。",
@@ -112,14 +311,14 @@ class ArxivDaily:
             "es": "Por favor, responda en español.",
             "ru": "Пожалуйста, ответьте на русском языке."
         }
-        return language_instructions.get(self.language, "使用中文回答。")
+        return language_instructions.get(language, "使用中文回答。")
 
-    def get_response(self, title, abstract):
-        language_instruction = self.get_language_instruction()
+    def get_prompt(self, title, abstract, run: RunContext):
+        language_instruction = self.get_language_instruction(run.language)
         prompt = f"""
             你是一个有帮助的 AI 研究助手，可以帮助我构建每日论文推荐系统。
             以下是我最近研究领域的描述：
-            {self.description}
+            {run.interest or run.description}
         """
         prompt += f"""
             以下是我从昨天的 arXiv 爬取的论文，我为你提供了标题和摘要：
@@ -138,80 +337,749 @@ class ArxivDaily:
             {language_instruction}
             直接返回上述 JSON 格式，无需任何额外解释。
         """
-
-        response = self.model.inference(prompt, temperature=self.temperature)
+        return prompt
+
+    def get_response(self, title, abstract, run: RunContext, model=None, deadline: float = None):
+        """deadline: 可选，单篇论文的截止时间，传给模型的重试循环；注入的模型只需接受 (prompt, temperature)"""
+        prompt = self.get_prompt(title, abstract, run)
+        model = model if model is not None else self.model
+        kwargs = {"deadline": deadline} if deadline is not None else {}
+        with profiler.span("llm", cat="llm", title=title[:80], triage=model is self.triage_model):
+            response = model.inference(prompt, temperature=self.temperature, **kwargs)
         return response
 
-    def process_paper(self, paper, max_retries=5):
+    def process_paper(self, paper, run: RunContext, max_retries=5, deadline: float = None):
+        """deadline: 可选，本篇论文的截止时间（time.monotonic() 时间点），过了之后不再重试"""
+        cached = self.cached_result(paper, run)
+        if cached is not None:
+            return cached
+
+        if self.triage_model is None:
+            result = self.score_with(self.model, paper, run, max_retries, deadline)
+        else:
+            # 先由小模型初筛，只有落在升级区间内（或初筛失败）的论文才交给主模型
+            # 初筛失败直接升级，不必多次重试
+            triage = self.score_with(self.triage_model, paper, run, 2, deadline)
+            escalate = triage is None or (
+                self.escalate_min <= triage["relevance_score"] <= self.escalate_max
+            )
+            result = self.score_with(self.model, paper, run, max_retries, deadline) if escalate else triage
+            run.cascade.add(triage, escalate, result if escalate else None)
+            if result is None:
+                result = triage
+
+        if result is not None:
+            self.remember(result, run)
+        return result
+
+    def cached_result(self, paper, run: RunContext):
+        """评分缓存中有该论文时返回还原的结果，否则返回 None。"""
+        cache_key = (run.profile_key, paper["arXiv_id"])
+        with self.lock:
+            if cache_key not in self.score_cache:
+                return None
+            run.count("cached")
+            self.score_cache.move_to_end(cache_key)
+            summary, relevance_score = self.score_cache[cache_key]
+        return {
+            "title": paper["title"],
+            "arXiv_id": paper["arXiv_id"],
+            "abstract": paper["abstract"],
+            "summary": summary,
+            "relevance_score": relevance_score,
+            "pdf_url": paper["pdf_url"],
+        }
+
+    def remember(self, result, run: RunContext):
+        with self.lock:
+            # 缓存只保存模型输出，标题、摘要等从论文本身还原
+            self.score_cache[(run.profile_key, result["arXiv_id"])] = (result["summary"], result["relevance_score"])
+            while len(self.score_cache) > self.max_cache_size:
+                self.score_cache.popitem(last=False)
+
+    def score_with(self, model, paper, run: RunContext, max_retries=5, deadline: float = None):
+        """用指定模型为一篇论文评分，解析失败时重试，返回结果 dict 或 None。"""
         retry_count = 0
 
         while retry_count < max_retries:
+            if run.cancelled or run.time_left() <= 0:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
             try:
-                title = paper["title"]
-                abstract = paper["abstract"]
-                response = self.get_response(title, abstract)
-                response = response.strip("```").strip("json")
-                response = json.loads(response)
-                relevance_score = float(response["relevance"])
-                summary = response["summary"]
-                with self.lock:
-                    return {
-                        "title": title,
-                        "arXiv_id": paper["arXiv_id"],
-                        "abstract": abstract,
-                        "summary": summary,
-                        "relevance_score": relevance_score,
-                        "pdf_url": paper["pdf_url"],
-                    }
+                response = self.get_response(paper["title"], paper["abstract"], run, model, deadline)
+                return self.parse_response(response, paper)
             except json.JSONDecodeError as e:
                 retry_count += 1
                 print(f"JSON解析错误 {paper['arXiv_id']}: {e}")
                 print(f"原始响应: {response}")
+                profiler.instant("retry", arXiv_id=paper["arXiv_id"], error="json")
+                run.count("retries")
                 if retry_count == max_retries:
                     print(f"已达到最大重试次数 {max_retries}，放弃处理该论文")
+                    run.count("failed")
                     return None
                 time.sleep(2)  # 增加重试间隔
             except Exception as e:
+                if not getattr(e, "retryable", True):
+                    # 不可重试的错误（如回放时缺少录制结果）直接放弃
+                    print(f"处理论文 {paper['arXiv_id']} 时发生错误: {e}")
+                    run.count("failed")
+                    return None
                 retry_count += 1
                 print(f"处理论文 {paper['arXiv_id']} 时发生错误: {e}")
                 print(f"正在进行第 {retry_count} 次重试...")
+                profiler.instant("retry", arXiv_id=paper["arXiv_id"], error=str(e))
+                run.count("retries")
+                if "timeout" in type(e).__name__.lower() or isinstance(e, TimeoutError):
+                    run.count("call_timeouts")
                 if retry_count == max_retries:
                     print(f"已达到最大重试次数 {max_retries}，放弃处理该论文")
+                    run.count("failed")
                     return None
                 time.sleep(2)  # 增加重试间隔
 
-    def get_recommendation(self):
+    @staticmethod
+    def parse_response(response: str, paper):
+        """把模型的 JSON 回复解析为评分结果，格式不对时抛出 ValueError 或 KeyError。"""
+        response = response.strip("```").strip("json")
+        response = json.loads(response)
+        return {
+            "title": paper["title"],
+            "arXiv_id": paper["arXiv_id"],
+            "abstract": paper["abstract"],
+            "summary": response["summary"],
+            "relevance_score": float(response["relevance"]),
+            "pdf_url": paper["pdf_url"],
+        }
+
+    def score_papers(
+        self, pending, total: int, run: RunContext, on_result, keep_abstract=True, followers=None, to_paper=None
+    ):
+        """
+        用共享线程池为 pending 中的论文评分，每得到一个结果调用 on_result(result)。
+        pending 可以是惰性迭代器，论文在派发时才取出。返回因截止时间未评分的论文数。
+        keep_abstract: 为 False 时结果（以及运行日志中的记录）不携带摘要
+        followers: 可选，match_duplicate 记录的 {代表论文 id: [近重复论文]}，由 on_result 释放；
+            代表论文没有得到结果时见 score_orphans。to_paper 把其中的条目还原为论文 dict
+        """
+        self.prepare_interest(run)
+        if self.broker is not None:
+            skipped = self.score_distributed(pending, total, run, on_result, keep_abstract)
+        elif self.batch is not None:
+            skipped = self.score_batch(pending, run, on_result, keep_abstract)
+        else:
+            skipped = self.score_local(pending, total, run, on_result, keep_abstract)
+        if followers:
+            skipped += self.score_orphans(followers, run, on_result, keep_abstract, to_paper)
+        return self.finish_scoring(run, skipped)
+
+    def score_orphans(self, followers: dict, run: RunContext, on_result, keep_abstract=True, to_paper=None):
+        """
+        代表论文失败、超时或被截止时间跳过时，它的近重复论文不会被 on_result 释放。
+        从每组中提升一篇重新评分（其余的挂到它下面），仍然没有结果的计为跳过，返回跳过的论文数。
+        """
+        promoted = []
+        for rep_id in list(followers):
+            group = followers.pop(rep_id)
+            if group:
+                paper = to_paper(group[0]) if to_paper is not None else group[0]
+                followers[paper["arXiv_id"]] = group[1:]
+                promoted.append(paper)
+        if not promoted:
+            return 0
+        skipped = len(promoted)
+        if not run.cancelled and run.time_left() > 0:
+            print(f"Scoring {len(promoted)} near-duplicates whose representative got no result.")
+            # 批处理模式下也在线评分，补评的论文很少，不值得再提交一个批处理
+            if self.broker is not None:
+                skipped = self.score_distributed(promoted, len(promoted), run, on_result, keep_abstract)
+            else:
+                skipped = self.score_local(promoted, len(promoted), run, on_result, keep_abstract)
+        skipped += sum(len(group) for group in followers.values())
+        followers.clear()
+        return skipped
+
+    def score_local(self, pending, total: int, run: RunContext, on_result, keep_abstract=True):
+        """在本进程的线程池中评分，返回因截止时间未评分的论文数。"""
+        from tqdm import tqdm
+
+        progress = tqdm(total=total, desc="Processing papers", unit="paper")
+        latencies = []
+        inflight = {}
+        dispatched = 0
+        # 当前排名靠前的论文，进入时就开始后台下载 PDF，不占用评分线程
+        leaders = TopK(self.full_text_top) if self.pdf_fetcher is not None else None
+        pending = iter(pending)
+        exhausted = False
+        while not exhausted or inflight:
+            # 每次运行最多 num_workers 篇在途，线程池由多次运行共享
+            while not exhausted and len(inflight) < self.num_workers and not run.cancelled:
+                average = sum(latencies) / len(latencies) if latencies else 0
+                if run.time_left() < average:
+                    break
+                paper = next(pending, None)
+                if paper is None:
+                    exhausted = True
+                    break
+                started = []
+                inflight[self.executor.submit(self.start_paper, paper, run, started)] = started
+                dispatched += 1
+            if not inflight:
+                break
+            finished, _ = wait(inflight, timeout=run.wait_timeout(), return_when=FIRST_COMPLETED)
+            if run.cancelled:
+                for f in inflight:
+                    f.cancel()
+                break
+            if not finished and run.time_left() <= 0:
+                # 截止时间已到，放弃仍在途的论文
+                break
+            if self.paper_timeout:
+                # 超过单篇时限的论文直接放弃，腾出调度名额。截止时间也传给了模型：工作线程不再重试，
+                # 正在进行的请求以剩余时间为超时，所以很快会退出。还在排队的论文尚未开始计时
+                now = time.monotonic()
+                for future, started in list(inflight.items()):
+                    if future not in finished and started and now - started[0] > self.paper_timeout:
+                        del inflight[future]
+                        future.cancel()
+                        run.count("paper_timeouts")
+                        progress.update(1)
+            for future in finished:
+                started = inflight.pop(future)
+                if started:
+                    latencies.append(time.monotonic() - started[0])
+                progress.update(1)
+                result = future.result()
+                if result:
+                    self.accept_result(result, run, on_result, keep_abstract, leaders)
+        progress.close()
+        run.check_cancelled()
+        for f in inflight:
+            f.cancel()
+        return len(inflight) + total - dispatched
+
+    def start_paper(self, paper, run: RunContext, started: list):
+        """在工作线程中执行：从开始处理时计算单篇时限，开始时间记入 started 供调度循环判断超时。"""
+        started.append(time.monotonic())
+        deadline = started[0] + self.paper_timeout if self.paper_timeout else None
+        return self.process_paper(paper, run, 5, deadline)
+
+    def interest_for(self, description: str, language: str = "zh"):
+        """返回该描述在逐篇评分提示词中使用的兴趣画像；未启用画像时返回 None。"""
+        run = RunContext(description, language)
+        self.prepare_interest(run)
+        return run.interest
+
+    def prepare_interest(self, run: RunContext):
+        """需要时为本次运行编译（或从缓存取出）紧凑的兴趣画像。"""
+        if run.interest is not None or self.interests is None:
+            return
+        if run.user_prompt or run.zotero_analysis:
+            sections = [
+                ("用户自定义提示词", run.user_prompt, run.user_prompt_weight),
+                ("Zotero文献库分析", run.zotero_analysis, run.zotero_weight),
+            ]
+        else:
+            sections = [("研究描述", run.description, 1.0)]
+        with profiler.span("interest"):
+            run.interest = self.interests.get(self.model, run.description, sections, self.temperature)
+
+    def score_distributed(self, pending, total: int, run: RunContext, on_result, keep_abstract=True, poll=1.0):
+        """
+        把 pending 提交到 broker，由 worker 进程评分，本进程轮询收集结果。
+        同一描述、同一天的运行使用同一个 run_id，重启后已完成的任务不会重复评分。
+        """
+        from tqdm import tqdm
+
+        run_id = f"{run.profile_key[:16]}_{datetime.now().strftime('%Y%m%d')}"
+        info = {"description": run.description, "language": run.language, "interest": run.interest}
+        submitted = set()
+        batch = []
+        for paper in pending:
+            submitted.add(paper["arXiv_id"])
+            batch.append(paper)
+            if len(batch) >= 500:
+                self.broker.submit(run_id, info, batch)
+                batch = []
+        if batch:
+            self.broker.submit(run_id, info, batch)
+        print(f"{len(submitted)} papers submitted to the work queue as run {run_id}.")
+
+        progress = tqdm(total=total, desc="Processing papers", unit="paper")
+        leaders = TopK(self.full_text_top) if self.pdf_fetcher is not None else None
+        seen = set()  # broker 已返回的论文，包括同一天其他运行提交的
+        collected = 0
+        while collected < len(submitted):
+            for arXiv_id, result in self.broker.finished(run_id, exclude=seen):
+                seen.add(arXiv_id)
+                if arXiv_id not in submitted:
+                    continue
+                collected += 1
+                progress.update(1)
+                if result is None:
+                    run.count("failed")
+                else:
+                    self.accept_result(result, run, on_result, keep_abstract, leaders)
+            if run.cancelled or run.time_left() <= 0:
+                # 还在排队的任务撤回，已领取的由 worker 做完，结果留在队列中供续跑使用
+                self.broker.cancel(run_id)
+                break
+            if collected < len(submitted):
+                time.sleep(min(poll, max(0.0, run.time_left())))
+        progress.close()
+        run.check_cancelled()
+        return len(submitted) - collected
+
+    def score_batch(self, pending, run: RunContext, on_result, keep_abstract=True):
+        """
+        把 pending 写成一个批处理文件提交给 Batch API，等待完成后读入结果。
+        批处理 id 记入运行日志，--resume 时继续等待同一个批处理而不重新提交；
+        批处理中失败或无法解析的论文回到本地线程池在线评分。批处理只使用主模型，不经过初筛。
+        """
+        papers = []
+        for paper in pending:
+            cached = self.cached_result(paper, run)
+            if cached is not None:
+                self.accept_result(cached, run, on_result, keep_abstract)
+            else:
+                papers.append(paper)
+        if not papers:
+            return 0
+
+        name = f"{run.profile_key[:16]}_{datetime.now().strftime('%Y%m%d')}"
+        state = run.journal.stages.get("batch") if run.journal is not None else None
+        if state is not None and state.get("name") == name:
+            batch_id = state["batch_id"]
+            print(f"Resuming batch {batch_id}.")
+        else:
+            requests = [(p["arXiv_id"], self.get_prompt(p["title"], p["abstract"], run)) for p in papers]
+            path = self.batch.write(name, requests, self.temperature)
+            batch_id = self.batch.submit(path, metadata={"run": name})
+            print(f"{len(papers)} papers submitted as batch {batch_id}.")
+            if run.journal is not None:
+                run.journal.checkpoint("batch", name=name, batch_id=batch_id)
+
+        def on_progress(completed, failed, total):
+            print(f"Batch {batch_id}: {completed} completed, {failed} failed of {total}.")
+            run.emit("batch", batch_id=batch_id, completed=completed, failed=failed, total=total)
+
+        with profiler.span("batch", papers=len(papers)):
+            batch = self.batch.wait(
+                batch_id, should_stop=lambda: run.cancelled or run.time_left() <= 0, on_progress=on_progress
+            )
+            responses = self.batch.results(batch, name)
+        print(f"Batch {batch_id} {batch.status}: {len(responses)} of {len(papers)} responses.")
+
+        retry = []
+        for paper in papers:
+            response = responses.get(paper["arXiv_id"])
+            try:
+                result = self.parse_response(response, paper) if response is not None else None
+            except (ValueError, KeyError) as e:
+                print(f"JSON解析错误 {paper['arXiv_id']}: {e}")
+                result = None
+            if result is None:
+                retry.append(paper)
+                continue
+            self.remember(result, run)
+            self.accept_result(result, run, on_result, keep_abstract)
+        run.check_cancelled()
+        if retry and run.time_left() > 0:
+            print(f"Scoring {len(retry)} papers missing from the batch online.")
+            return self.score_local(retry, len(retry), run, on_result, keep_abstract)
+        return len(retry)
+
+    def accept_result(self, result, run: RunContext, on_result, keep_abstract=True, leaders: TopK = None):
+        """记录一篇论文的评分结果：写入运行日志、推送进度、交给 on_result。"""
+        run.count("scored")
+        if not keep_abstract:
+            result.pop("abstract", None)
+        if run.journal is not None:
+            run.journal.record_paper(result)
+        run.emit(
+            "paper",
+            arXiv_id=result["arXiv_id"],
+            title=result["title"],
+            relevance_score=result["relevance_score"],
+        )
+        on_result(result)
+        if leaders is not None and leaders.push(result) is not result:
+            self.pdf_fetcher.prefetch(result["pdf_url"])
+
+    def finish_scoring(self, run: RunContext, skipped: int):
+        """打印并记录评分阶段的总结，返回未评分的论文数。"""
+        if skipped:
+            print(f"Deadline reached: {skipped} papers were not scored, using the best results so far.")
+            run.emit("deadline", skipped=skipped)
+            run.count("skipped", skipped)
+        stats = dict(run.stats)
+        print(
+            "Scoring summary: {} scored ({} cached), {} pre-filtered, {} near-duplicates, {} failed, "
+            "{} retries, {} request timeouts, {} papers timed out, {} skipped.".format(
+                stats.get("scored", 0),
+                stats.get("cached", 0),
+                stats.get("filtered", 0),
+                stats.get("duplicates", 0),
+                stats.get("failed", 0),
+                stats.get("retries", 0),
+                stats.get("call_timeouts", 0),
+                stats.get("paper_timeouts", 0),
+                stats.get("skipped", 0),
+            )
+        )
+        run.emit("score_summary", **stats)
+        if self.triage_model is not None and run.cascade.triaged:
+            stats = run.cascade.to_dict()
+            agreement = "n/a" if stats["agreement"] is None else f"{stats['agreement']:.0%}"
+            mean_diff = "n/a" if stats["mean_abs_diff"] is None else f"{stats['mean_abs_diff']:.2f}"
+            print(
+                f"Cascade: {stats['escalated']} of {stats['triaged']} papers escalated to the main model, "
+                f"agreement {agreement}, mean score difference {mean_diff}."
+            )
+            run.emit("cascade", **stats)
+        if run.journal is not None:
+            run.journal.checkpoint("score", stats=stats)
+        return skipped
+
+    def prefilter(self, index: BM25Index, run: RunContext, start: float):
+        """
+        BM25 预筛：返回应交给 LLM 的论文在 index 中的行号（按匹配度从高到低），
+        其余论文计为 filtered。start 为建索引开始的 time.perf_counter() 时间点，用于报告耗时。
+        """
+        if not index.has_query:
+            print("Lexical pre-filter skipped: no English terms in the description.")
+            return list(range(len(index)))
+        kept = index.select(self.prefilter_keep, self.max_paper_num)
+        filtered = len(index) - len(kept)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"Lexical pre-filter: {len(kept)} of {len(index)} papers kept for LLM scoring ({elapsed:.0f} ms).")
+        run.count("filtered", filtered)
+        run.emit("prefilter", kept=len(kept), filtered=filtered, ms=round(elapsed, 1))
+        return kept
+
+    def match_duplicate(self, paper, run: RunContext, followers: dict, done: dict = None, item=None):
+        """
+        在近重复索引中查找 paper：
+        - 与已评分的论文（本次运行日志或评分缓存中）近重复时，返回继承其评分的结果；
+        - 与本次运行中待评分的代表论文近重复时，把 item（默认为 paper）记入
+          followers[代表论文 id]，返回 False；
+        - 否则 paper 成为代表论文并加入索引，返回 None。
+        """
+        if self.dedup is None:
+            return None
+        signature = self.dedup.signature(paper)
+        match = self.dedup.query(signature, exclude=paper["arXiv_id"])
+        if match is not None:
+            dup_id = match[0]
+            if dup_id in followers:
+                followers[dup_id].append(paper if item is None else item)
+                return False
+            source = (done or {}).get(dup_id)
+            if source is None:
+                with self.lock:
+                    cached = self.score_cache.get((run.profile_key, dup_id))
+                if cached is not None:
+                    source = {"arXiv_id": dup_id, "summary": cached[0], "relevance_score": cached[1]}
+            if source is not None:
+                return self.inherit(paper, source)
+        self.dedup.add(paper["arXiv_id"], signature)
+        followers[paper["arXiv_id"]] = []
+        return None
+
+    @staticmethod
+    def inherit(paper, source):
+        """近重复论文的结果：使用自己的标题和链接，总结与评分来自 source。"""
+        return {
+            "title": paper["title"],
+            "arXiv_id": paper["arXiv_id"],
+            "abstract": paper["abstract"],
+            "summary": source["summary"],
+            "relevance_score": source["relevance_score"],
+            "pdf_url": paper["pdf_url"],
+            "duplicate_of": source.get("duplicate_of") or source["arXiv_id"],
+        }
+
+    def accept_duplicate(self, result, run: RunContext, on_result):
+        run.count("duplicates")
+        if run.journal is not None:
+            run.journal.record_paper(result)
+        on_result(result)
+
+    def release_followers(self, result, followers: dict, run: RunContext, on_result):
+        """代表论文得到结果后，与它近重复的论文继承该结果。"""
+        for paper in followers.pop(result["arXiv_id"], ()):
+            self.accept_duplicate(self.inherit(paper, result), run, on_result)
+
+    @staticmethod
+    def group_duplicates(recommendations):
+        """把近重复论文挂到同在列表中的原论文下（duplicates 字段），不再单独占一个位置。"""
+        by_id = {r["arXiv_id"]: r for r in recommendations}
+        grouped = []
+        for r in recommendations:
+            source = by_id.get(r.get("duplicate_of"))
+            if source is not None and source is not r:
+                source.setdefault("duplicates", []).append(
+                    {"title": r["title"], "arXiv_id": r["arXiv_id"], "pdf_url": r["pdf_url"]}
+                )
+            else:
+                grouped.append(r)
+        return grouped
+
+    def get_recommendation(self, papers: dict, run: RunContext):
         recommendations = {}
-        for category, papers in self.papers.items():
-            for paper in papers:
+        for category, category_papers in papers.items():
+            for paper in category_papers:
                 recommendations[paper["arXiv_id"]] = paper
 
         print(
             f"Got {len(recommendations)} non-overlapping papers from yesterday's arXiv."
         )
 
+        if self.prefilter_keep:
+            start = time.perf_counter()
+            index = BM25Index(run.terms)
+            for paper in recommendations.values():
+                index.add(paper)
+            papers = list(recommendations.values())
+            recommendations = {
+                papers[i]["arXiv_id"]: papers[i] for i in self.prefilter(index, run, start)
+            }
+
         recommendations_ = []
         print("Performing LLM inference...")
+        run.emit("stage", stage="score", total=len(recommendations))
+
+        # 续跑时跳过日志中已完成的论文
+        done = run.journal.results if run.journal is not None else {}
+        pending = []
+        for arXiv_id, paper in recommendations.items():
+            if arXiv_id in done:
+                recommendations_.append(done[arXiv_id])
+            else:
+                pending.append(paper)
+        if done:
+            print(f"{len(recommendations_)} papers restored from the run journal.")
+
+        def on_result(result):
+            recommendations_.append(result)
+            self.release_followers(result, followers, run, recommendations_.append)
+            if run.on_event is not None:
+                run.emit("topk", papers=self.top_k(recommendations_))
+
+        # 近重复的论文不再评分，继承已评分论文或同批代表论文的结果
+        followers = {}
+        representatives = []
+        for paper in pending:
+            inherited = self.match_duplicate(paper, run, followers, done)
+            if inherited is None:
+                representatives.append(paper)
+            elif inherited:
+                self.accept_duplicate(inherited, run, on_result)
+        pending = representatives
+
+        # 按关键词先验从高到低调度，截止时间到了也能先拿到最可能相关的结果；
+        # 没有截止时间时按估计的 token 数从长到短调度，缩短最后几篇拖慢的尾部
+        if run.deadline is not None:
+            priors = keyword_scores(pending, run.terms)
+            order = sorted(range(len(pending)), key=lambda i: priors[i], reverse=True)
+            pending = [pending[i] for i in order]
+        else:
+            pending.sort(key=lambda p: estimate_tokens(p["title"]) + estimate_tokens(p["abstract"]), reverse=True)
 
-        with ThreadPoolExecutor(self.num_workers) as executor:
-            futures = []
-            for arXiv_id, paper in recommendations.items():
-                futures.append(executor.submit(self.process_paper, paper))
-            for future in tqdm(
-                as_completed(futures),
-                total=len(futures),
-                desc="Processing papers",
-                unit="paper",
-            ):
-                result = future.result()
-                if result:
-                    recommendations_.append(result)
+        with profiler.span("score", papers=len(pending)):
+            self.score_papers(pending, len(pending), run, on_result, followers=followers)
 
-        recommendations_ = sorted(
-            recommendations_, key=lambda x: x["relevance_score"], reverse=True
+        recommendations_ = self.group_duplicates(
+            sorted(recommendations_, key=lambda x: x["relevance_score"], reverse=True)
         )[: self.max_paper_num]
+        with profiler.span("full_text"):
+            self.summarize_full_text(recommendations_, run)
+        self.save_markdown(recommendations_, run)
+        return recommendations_
+
+    def get_archive_recommendation(
+        self,
+        categories: list[str],
+        run: RunContext,
+        page_size: int = 500,
+        spill_dir: str = None,
+    ):
+        """
+        整库模式：逐页抓取整个 archive（如 "cs"），每篇论文只保留一个 PaperRecord，
+        摘要写入临时文件，评分结果只在 TopK 堆中保留前 max_paper_num 篇，
+        峰值内存不随每日论文数增长。
+        """
+        run.emit("stage", stage="fetch")
+        done = run.journal.results if run.journal is not None else {}
+        best = TopK(self.max_paper_num)
+        with AbstractSpill(spill_dir) as spill:
+            records = {}  # arXiv_id -> PaperRecord
+            # 预筛索引只保存关键词的命中次数，摘要仍然只在 spill 中
+            index = BM25Index(run.terms) if self.prefilter_keep else None
+            indexing = 0.0
+            for paper in self.fetcher.iter_papers(categories, page_size, run.cancel_event):
+                if paper["arXiv_id"] in records:
+                    continue
+                prior = keyword_scores([paper], run.terms)[0] if run.deadline is not None else 0.0
+                records[paper["arXiv_id"]] = PaperRecord.from_paper(paper, spill, prior)
+                if index is not None:
+                    start = time.perf_counter()
+                    index.add(paper)
+                    indexing += time.perf_counter() - start
+            run.check_cancelled()
+            print(f"Got {len(records)} non-overlapping papers from yesterday's arXiv.")
+            if index is not None:
+                candidates = list(records.values())
+                kept = self.prefilter(index, run, time.perf_counter() - indexing)
+                records = {candidates[i].arXiv_id: candidates[i] for i in kept}
+            print("Performing LLM inference...")
+            run.emit("stage", stage="score", total=len(records))
+
+            def on_result(result):
+                best.push(result)
+                # 近重复的论文只记录了 PaperRecord，继承结果时同样不带摘要
+                for record in followers.pop(result["arXiv_id"], ()):
+                    inherited = self.inherit(record.to_paper(spill), result)
+                    inherited.pop("abstract")
+                    self.accept_duplicate(inherited, run, best.push)
+                if run.on_event is not None:
+                    run.emit("topk", papers=self.top_k(best.sorted()))
+
+            pending = []
+            followers = {}
+            restored = 0
+            for arXiv_id, record in records.items():
+                if arXiv_id in done:
+                    best.push(done[arXiv_id])
+                    restored += 1
+                    continue
+                inherited = self.match_duplicate(record.to_paper(spill), run, followers, done, item=record)
+                if inherited is None:
+                    pending.append(record)
+                elif inherited:
+                    inherited.pop("abstract")
+                    self.accept_duplicate(inherited, run, on_result)
+            if done:
+                print(f"{restored} papers restored from the run journal.")
+            if run.deadline is not None:
+                pending.sort(key=lambda r: r.prior, reverse=True)
+            else:
+                # 摘要字节数近似 token 数，长的先派发
+                pending.sort(key=lambda r: r.length + len(r.title), reverse=True)
+
+            # 评分后不再需要摘要，进入最终结果的论文再从 spill 中读回
+            with profiler.span("score", papers=len(pending)):
+                self.score_papers(
+                    (r.to_paper(spill) for r in pending),
+                    len(pending),
+                    run,
+                    on_result,
+                    keep_abstract=False,
+                    followers=followers,
+                    to_paper=lambda record: record.to_paper(spill),
+                )
+
+            recommendations_ = self.group_duplicates(best.sorted())
+            for result in recommendations_:
+                result["abstract"] = records[result["arXiv_id"]].abstract(spill)
+        with profiler.span("full_text"):
+            self.summarize_full_text(recommendations_, run)
+        self.save_markdown(recommendations_, run)
+        return recommendations_
+
+    def get_full_text_response(self, paper, intro: str, conclusion: str, run: RunContext):
+        language_instruction = self.get_language_instruction(run.language)
+        prompt = f"""
+            你是一个有帮助的 AI 研究助手，可以帮助我构建每日论文推荐系统。
+            以下是我最近研究领域的描述：
+            {run.description}
+        """
+        prompt += f"""
+            以下是一篇论文的标题、摘要，以及从 PDF 中提取的引言和结论（可能不完整）：
+            标题: {paper["title"]}
+            摘要: {paper["abstract"]}
+            引言: {intro or "无"}
+            结论: {conclusion or "无"}
+        """
+        prompt += f"""
+            请结合引言和结论，总结这篇论文的研究问题、方法和主要结论，并说明它与我研究领域的关系。
 
+            请按以下 JSON 格式给出你的回答：
+            {{
+                "summary": <你的总结>
+            }}
+            {language_instruction}
+            直接返回上述 JSON 格式，无需任何额外解释。
+        """
+        # 有截止时间时传给模型，来不及的调用不再重试
+        kwargs = {"deadline": run.deadline} if run.deadline is not None else {}
+        start = time.monotonic()
+        with profiler.span("llm_full_text", cat="llm", arXiv_id=paper["arXiv_id"]):
+            response = self.model.inference(prompt, temperature=self.temperature, **kwargs)
+        latency = time.monotonic() - start
+        with self.lock:
+            self.full_text_latency = 0.8 * self.full_text_latency + 0.2 * latency if self.full_text_latency else latency
+        response = response.strip().strip("```").strip("json")
+        try:
+            return json.loads(response)["summary"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def summarize_full_text(self, recommendations, run: RunContext):
+        """用 PDF 的引言与结论为排名前 full_text_top 的论文重新生成总结，失败时保留原总结。"""
+        if self.pdf_fetcher is None or not recommendations or self.full_text_top <= 0:
+            return
+        top = recommendations[: self.full_text_top]
+        if run.journal is not None and run.journal.has("full_text"):
+            summaries = run.journal.stages["full_text"]["summaries"]
+            for paper in top:
+                paper["summary"] = summaries.get(paper["arXiv_id"], paper["summary"])
+            return
+        run.check_cancelled()
+        if run.deadline is not None and run.time_left() <= 0:
+            return
+        run.emit("stage", stage="full_text")
+        # 在当前线程等待 PDF，只有拿到正文的论文才占用 LLM 线程。全文总结在评分截止时间内完成，
+        # 不占用为总结和发送预留的时间：剩余时间不够下载或一次调用的论文保留基于摘要的总结
+        downloads = {self.pdf_fetcher.prefetch(paper["pdf_url"]): paper for paper in top}
+        futures = {}
+        try:
+            for download in as_completed(downloads, timeout=min(self.pdf_fetcher.timeout, run.time_left())):
+                paper = downloads[download]
+                if run.time_left() <= self.full_text_latency:
+                    print("Not enough time left for more full-text summaries.")
+                    break
+                sections = self.pdf_fetcher.get(paper["pdf_url"])
+                if sections and any(sections) and not run.cancelled:
+                    futures[self.executor.submit(self.get_full_text_response, paper, *sections, run)] = paper
+        except TimeoutError:
+            print("Some PDFs are still downloading, keeping their abstract-based summaries.")
+        summaries = {}
+        try:
+            for future in as_completed(futures, timeout=None if run.deadline is None else max(0.0, run.time_left())):
+                paper = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"Full-text summary of {paper['arXiv_id']} failed: {e}")
+                    continue
+                if summary:
+                    paper["summary"] = summary
+                    summaries[paper["arXiv_id"]] = summary
+        except TimeoutError:
+            print("Some full-text summaries did not finish in time, keeping their abstract-based summaries.")
+            for future in futures:
+                future.cancel()
+        print(f"{len(summaries)} of {len(top)} top papers are summarized from their full text.")
+        run.check_cancelled()
+        if run.journal is not None:
+            run.journal.checkpoint("full_text", summaries=summaries)
+
+    def save_markdown(self, recommendations_, run: RunContext):
         # Save recommendation to markdown file
+        if not self.save_dir:
+            return
         current_time = datetime.now()
         save_path = os.path.join(
             self.save_dir, f"{current_time.strftime('%Y-%m-%d')}.md"
@@ -219,7 +1087,7 @@ class ArxivDaily:
         with open(save_path, "w") as f:
             f.write("# Daily arXiv Papers\n")
             f.write(f"## Date: {current_time.strftime('%Y-%m-%d')}\n")
-            f.write(f"## Description: {self.description}\n")
+            f.write(f"## Description: {run.description}\n")
             f.write("## Papers:\n")
             for i, paper in enumerate(recommendations_):
                 f.write(f"### {i + 1}. {paper['title']}\n")
@@ -229,16 +1097,29 @@ class ArxivDaily:
                 f.write(f"{paper['summary']}\n")
                 f.write(f"#### Relevance Score: {paper['relevance_score']}\n")
                 f.write(f"#### PDF URL: {paper['pdf_url']}\n")
+                for dup in paper.get("duplicates", ()):
+                    f.write(f"#### Similar: {dup['title']} ({dup['pdf_url']})\n")
                 f.write("\n")
 
-        return recommendations_
-
-    def summarize(self, recommendations):
+    def top_k(self, recommendations):
+        """当前得分最高的 max_paper_num 篇论文的简要信息，用于进度推送。"""
+        ranked = sorted(
+            recommendations, key=lambda x: x["relevance_score"], reverse=True
+        )[: self.max_paper_num]
+        return [
+            {
+                "arXiv_id": p["arXiv_id"],
+                "title": p["title"],
+                "relevance_score": p["relevance_score"],
+            }
+            for p in ranked
+        ]
+
+    def summarize(self, recommendations, run: RunContext):
         overview = ""
         for i in range(len(recommendations)):
             overview += f"{i + 1}. {recommendations[i]['title']} - {recommendations[i]['summary']} \n"
         
-        language_instruction = self.get_language_instruction()
         language_prompts = {
             "zh": """
             请按以下要求总结今天的论文:
@@ -415,14 +1296,14 @@ class ArxivDaily:
         }
         
         # 获取对应语言的提示词，如果没有则使用中文
-        prompt_template = language_prompts.get(self.language, language_prompts["zh"])
+        prompt_template = language_prompts.get(run.language, language_prompts["zh"])
         
         # 构建加权描述
         weighted_description = f"""
-        用户自定义提示词（权重 {self.user_prompt_weight:.2f}）：
-        {self.user_prompt}
-        \nZotero文献库分析（权重 {self.zotero_weight:.2f}）：
-        {self.zotero_analysis}
+        用户自定义提示词（权重 {run.user_prompt_weight:.2f}）：
+        {run.user_prompt}
+        \nZotero文献库分析（权重 {run.zotero_weight:.2f}）：
+        {run.zotero_analysis}
         """
         prompt = f"""
             你是一个有帮助的 AI 研究助手，可以帮助我构建每日论文推荐系统。
@@ -435,75 +1316,114 @@ class ArxivDaily:
         """
         prompt += prompt_template
 
-        response = (
-            self.model.inference(prompt, temperature=self.temperature)
-            .strip("```")
-            .strip("html")
-            .strip()
-        )
+        with profiler.span("llm_summarize", cat="llm", papers=len(recommendations)):
+            response = (
+                self.model.inference(prompt, temperature=self.temperature)
+                .strip("```")
+                .strip("html")
+                .strip()
+            )
         print(response)
         response = get_summary_html(response)
         return response
 
-    def render_email(self, recommendations):
-        parts = []
+    def render_email(self, recommendations, run: RunContext):
+        run.check_cancelled()
         if len(recommendations) == 0:
-            return framework.replace("__CONTENT__", get_empty_html())
-        for i, p in enumerate(tqdm(recommendations, desc="Rendering Emails")):
-            rate = get_stars(p["relevance_score"])
-            parts.append(
-                get_block_html(
-                    str(i + 1) + ". " + p["title"],
-                    rate,
-                    p["arXiv_id"],
-                    p["summary"],
-                    p["pdf_url"],
-                )
-            )
-        summary = self.summarize(recommendations)
-        # Add the summary to the start of the email
-        content = summary
-        content += "<br>" + "</br><br>".join(parts) + "</br>"
-        return framework.replace("__CONTENT__", content)
-
-    def send_email(
+            run.summary = ""
+            return render_email_html("", [])
+        run.emit("stage", stage="summarize")
+        if run.journal is not None and run.journal.has("summarize"):
+            run.summary = run.journal.stages["summarize"]["summary"]
+        else:
+            with profiler.span("summarize"):
+                run.summary = self.summarize(recommendations, run)
+            if run.journal is not None:
+                run.journal.checkpoint("summarize", summary=run.summary)
+        run.check_cancelled()
+        run.emit("stage", stage="render")
+        with profiler.span("render"), profiler.profile("render"):
+            return render_email_html(run.summary, recommendations, self.max_email_bytes)
+
+    def run(
         self,
-        sender: str,
-        receiver: str,
-        password: str,
-        smtp_server: str,
-        smtp_port: int,
-        title: str,
+        papers: dict,
+        description: str,
+        language: str = "zh",
+        receivers: list[str] = None,
+        mailer: Mailer = None,
+        on_event=None,
+        cancel_event: threading.Event = None,
+        journal: RunJournal = None,
+        deadline: float = None,
+        summary_reserve: float = 60,
+        interest: str = None,
     ):
-        recommendations = self.get_recommendation()
-        html = self.render_email(recommendations)
-
-        def _format_addr(s):
-            name, addr = parseaddr(s)
-            return formataddr((Header(name, "utf-8").encode(), addr))
-
-        msg = MIMEText(html, "html", "utf-8")
-        msg["From"] = _format_addr(f"{title} <%s>" % sender)
-
-        # 处理多个接收者
-        receivers = [addr.strip() for addr in receiver.split(",")]
-        print(receivers)
-        msg["To"] = ",".join([_format_addr(f"You <%s>" % addr) for addr in receivers])
-
-        today = datetime.now().strftime("%Y/%m/%d")
-        msg["Subject"] = Header(f"{title} {today}", "utf-8").encode()
+        """
+        对已抓取的论文执行一次推荐：评分、总结、渲染邮件；给出 receivers 和 mailer 时发送邮件。
+        papers: fetch() 的返回值 {category: [paper, ...]}
+        mailer: util.mailer.Mailer，发送失败的邮件会进入其 outbox 等待重试
+        journal: 可选 RunJournal；续跑时只处理剩余论文，已完成的总结和发送不会重复
+        deadline: 可选，本次运行的时间预算（秒）。论文按关键词先验排序调度，
+            预算用完后停止派发，用已得到的最佳结果继续总结和发送
+        summary_reserve: 为总结、渲染和发送预留的时间（秒），从 deadline 中扣除
+        interest: 可选，已编译的兴趣画像（如 interest_for() 的结果），不再重新编译
+        返回 (recommendations, html)
+        """
+        run = self.make_run(description, language, on_event, cancel_event, journal, deadline, summary_reserve)
+        run.interest = interest
+        recommendations = self.get_recommendation(papers, run)
+        return self.finish(recommendations, run, receivers, mailer)
 
-        try:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-        except Exception as e:
-            logger.warning(f"Failed to use TLS. {e}")
-            logger.warning(f"Try to use SSL.")
-            server = smtplib.SMTP_SSL(smtp_server, smtp_port)
+    def run_archive(
+        self,
+        categories: list[str],
+        description: str,
+        language: str = "zh",
+        receivers: list[str] = None,
+        mailer: Mailer = None,
+        on_event=None,
+        cancel_event: threading.Event = None,
+        journal: RunJournal = None,
+        deadline: float = None,
+        summary_reserve: float = 60,
+        page_size: int = 500,
+        spill_dir: str = None,
+    ):
+        """
+        整库模式的 run()：categories 可以是整个 archive（如 ["cs"]），论文边抓取边转为紧凑记录，
+        不经过 fetch() 的 {category: [paper, ...]} 列表。其余参数同 run()。
+        page_size: 每次请求的列表页大小
+        spill_dir: 摘要临时文件所在目录，默认为系统临时目录
+        返回 (recommendations, html)
+        """
+        run = self.make_run(description, language, on_event, cancel_event, journal, deadline, summary_reserve)
+        recommendations = self.get_archive_recommendation(categories, run, page_size, spill_dir)
+        return self.finish(recommendations, run, receivers, mailer)
 
-        server.login(sender, password)
-        server.sendmail(sender, receivers, msg.as_string())
-        server.quit()
+    @staticmethod
+    def make_run(description, language, on_event, cancel_event, journal, deadline, summary_reserve):
+        score_deadline = None
+        if deadline is not None:
+            score_deadline = time.monotonic() + max(0.0, deadline - summary_reserve)
+        return RunContext(description, language, on_event, cancel_event, journal, score_deadline)
+
+    def finish(self, recommendations, run: RunContext, receivers=None, mailer: Mailer = None):
+        """总结、渲染并发送邮件，返回 (recommendations, html)。"""
+        html = self.render_email(recommendations, run)
+        if receivers and mailer is not None:
+            if run.journal is not None and run.journal.has("send"):
+                print("Email already sent in this run, skipping.")
+            else:
+                run.emit("stage", stage="send")
+                text = render_email_text(run.summary, recommendations) if self.plain_text else None
+                with profiler.span("send", receivers=len(receivers)):
+                    mailer.send(html, receivers, text=text)
+                if run.journal is not None:
+                    run.journal.checkpoint("send", receivers=receivers)
+        if run.journal is not None:
+            run.journal.checkpoint("done")
+        return recommendations, html
 
 
 if __name__ == "__main__":
@@ -525,8 +1445,7 @@ if __name__ == "__main__":
         3. Low-level Vision
     """
 
-    arxiv_daily = ArxivDaily(
-        categories, max_entries, max_paper_num, provider, model, None, None, description
-    )
-    recommendations = arxiv_daily.get_recommendation()
+    arxiv_daily = ArxivDaily(max_paper_num, provider, model, None, None, 4, 0.7)
+    papers = arxiv_daily.fetch(categories, max_entries)
+    recommendations, html = arxiv_daily.run(papers, description)
     print(recommendations)
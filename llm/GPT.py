@@ -6,15 +6,18 @@ from openai import OpenAI
 import time
 
 class GPT():
-    def __init__(self, model, base_url, api_key):
+    def __init__(self, model, base_url, api_key, retries=10, timeout=60):
+        """timeout: per-request timeout (s), so a hung request cannot hold a worker for minutes."""
         self.model_name = model
         self.base_url = base_url
         self.api_key = api_key
+        self.retries = retries
+        self.timeout = timeout
 
         self._init_model()
 
     def _init_model(self):
-        self.client = OpenAI(base_url= self.base_url, api_key=self.api_key)
+        self.client = OpenAI(base_url= self.base_url, api_key=self.api_key, timeout=self.timeout)
 
     def build_prompt(self, question):
         message = []
@@ -34,10 +37,18 @@ class GPT():
         ]
         return prompt
 
-    def call_gpt_eval(self, message, model_name, retries=10, wait_time=1, temperature=0.0):
+    def call_gpt_eval(self, message, model_name, retries=None, wait_time=1, temperature=0.0, deadline=None):
+        """deadline: optional time.monotonic() point; no attempt starts after it and each request is capped to the time left."""
+        retries = retries if retries is not None else self.retries
         for i in range(retries):
+            client = self.client
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Deadline passed after {i} attempts.")
+                client = client.with_options(timeout=min(self.timeout, remaining), max_retries=0)
             try:
-                result = self.client.chat.completions.create(
+                result = client.chat.completions.create(
                     model=model_name,
                     messages=message,
                     temperature=temperature
@@ -55,9 +66,24 @@ class GPT():
                     print(e)
                     raise
 
-    def inference(self, prompt, temperature=0.7):
+    def ping(self, timeout=10):
+        """
+        Cheap health check: list the available models instead of running a generation.
+        Raises if the endpoint is unreachable or the key is rejected.
+        """
+        client = self.client.with_options(timeout=timeout, max_retries=0)
+        models = [m.id for m in client.models.list()]
+        if models and self.model_name not in models:
+            print(f"Warning: {self.model_name} is not in the model list of {self.base_url}.")
+        return True
+
+    def warm(self):
+        """Open the connection ahead of a run; hosted models have nothing to load."""
+        self.ping()
+
+    def inference(self, prompt, temperature=0.7, deadline=None):
         prompt = self.build_prompt(prompt)
-        response = self.call_gpt_eval(prompt, self.model_name, temperature=temperature)
+        response = self.call_gpt_eval(prompt, self.model_name, temperature=temperature, deadline=deadline)
         return response
     
 if __name__ == "__main__":
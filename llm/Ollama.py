@@ -1,13 +1,49 @@
-from ollama import generate
+from ollama import Client
 import json
+import time
 
 class Ollama:
-    def __init__(self, model):
+    def __init__(self, model, host=None, timeout=None, keep_alive=None):
+        """
+        host: address of the Ollama server, defaults to OLLAMA_HOST or localhost.
+        timeout: per-request timeout (s), None to wait indefinitely.
+        keep_alive: how long the server keeps the weights loaded after a request
+            (e.g. "30m", -1 for ever), None for the server default.
+        """
         self.model_name = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.client = Client(host=host, timeout=timeout)
 
-    def inference(self, prompt):
-        response = generate(self.model_name, prompt)["response"]
-        response = response.split("</think>")[1].strip()
+    def ping(self, timeout=10):
+        """
+        Cheap health check: ask the Ollama server for its local models instead of running a generation.
+        Raises if the server is unreachable or the model has not been pulled.
+        """
+        models = Client(host=self.host, timeout=timeout).list()["models"]
+        names = set()
+        for m in models:
+            name = m.get("model") or m.get("name")
+            names.add(name)
+            names.add(name.removesuffix(":latest"))
+        if self.model_name not in names:
+            raise RuntimeError(f"Model {self.model_name} is not available on the Ollama server {self.host or ''}.")
+        return True
+
+    def warm(self):
+        """Load the weights ahead of a run: a generate call with an empty prompt only loads the model."""
+        self.client.generate(self.model_name, "", keep_alive=self.keep_alive)
+
+    def inference(self, prompt, temperature=None, deadline=None):
+        """deadline: optional time.monotonic() point after which the request is not sent."""
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError("Deadline passed before the request was sent.")
+        options = {"temperature": temperature} if temperature is not None else None
+        response = self.client.generate(
+            self.model_name, prompt, options=options, keep_alive=self.keep_alive
+        )["response"]
+        # Reasoning models put their thoughts before </think>; other models do not emit it
+        response = response.split("</think>")[-1].strip()
         return response
     
 if __name__ == "__main__":
@@ -1,2 +1,64 @@
-from .GPT import GPT
-from .Ollama import Ollama
\ No newline at end of file
+"""
+LLM backends.
+
+Provider modules are imported lazily, so that only the client library of the
+selected backend (``openai`` or ``ollama``) is loaded at startup.
+
+A comma-separated base_url (e.g. several OpenAI-compatible endpoints or Ollama
+hosts serving the same model) gives a ModelPool that balances, ejects and
+hedges across them.
+"""
+
+import importlib
+
+__all__ = ["GPT", "Ollama", "ModelPool", "get_model"]
+
+# provider -> 实现该 provider 的模块（与类同名）
+PROVIDERS = {
+    "ollama": "Ollama",
+    "openai": "GPT",
+    "siliconflow": "GPT",
+}
+
+
+def __getattr__(name):
+    if name in ("GPT", "Ollama", "ModelPool"):
+        module = "pool" if name == "ModelPool" else name
+        cls = getattr(importlib.import_module(f".{module}", __name__), name)
+        # 导入子模块会把同名属性设为模块本身，这里改回类
+        globals()[name] = cls
+        return cls
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_model(provider: str, model: str, base_url=None, api_key=None, hedge=True, timeout=60, keep_alive=None):
+    """
+    Construct the model of the given provider, importing only its module.
+    base_url may list several endpoints separated by commas (api_key likewise,
+    or one key for all), which returns a ModelPool over them.
+    timeout is the per-request timeout in seconds; keep_alive is passed to
+    Ollama, which keeps the weights loaded that long after each request.
+    """
+    provider = provider.lower()
+    if provider not in PROVIDERS:
+        raise ValueError(f"Model not supported: {provider}")
+    class_name = PROVIDERS[provider]
+    cls = __getattr__(class_name)
+    urls = [u.strip() for u in (base_url or "").split(",") if u.strip()]
+    if len(urls) > 1:
+        keys = [k.strip() for k in (api_key or "").split(",")]
+        if len(keys) == 1:
+            keys = keys * len(urls)
+        if len(keys) != len(urls):
+            raise ValueError("api_key must be a single key or one key per base_url.")
+        if class_name == "Ollama":
+            members = [cls(model, url, timeout, keep_alive) for url in urls]
+        else:
+            # 失败时由 pool 换一个后端重试，成员自身只尝试一次
+            members = [
+                cls(model, url, key or None, retries=1, timeout=timeout) for url, key in zip(urls, keys)
+            ]
+        return __getattr__("ModelPool")(members, hedge=hedge)
+    if class_name == "Ollama":
+        return cls(model, base_url or None, timeout, keep_alive)
+    return cls(model, base_url, api_key, timeout=timeout)
@@ -0,0 +1,107 @@
+"""
+OpenAI-compatible Batch API.
+
+For runs that are not urgent (backfills, weekly digests) all per-paper
+requests are written to one JSONL file, uploaded and executed by the
+provider within its completion window, usually at a lower price and outside
+the online rate limits. Batch reuses the client of a GPT instance, so
+base_url points it at any compatible server, including a local stand-in.
+"""
+
+import json
+import os
+import time
+
+# 批处理的终止状态
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+class Batch:
+    def __init__(self, gpt, work_dir: str = "batches", poll_interval: float = 30, completion_window: str = "24h"):
+        """
+        gpt: llm.GPT 实例，提供客户端、模型名与消息格式
+        work_dir: 批处理输入与输出文件的保存目录
+        poll_interval: 查询批处理状态的间隔（秒）
+        """
+        self.gpt = gpt
+        self.model_name = gpt.model_name
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        os.makedirs(work_dir, exist_ok=True)
+
+    def write(self, name: str, requests: list[tuple], temperature: float = 0.7):
+        """requests: [(custom_id, prompt)]，写成批处理输入 JSONL，返回文件路径。"""
+        path = os.path.join(self.work_dir, f"{name}.input.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for custom_id, prompt in requests:
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self.model_name,
+                        "messages": self.gpt.build_prompt(prompt),
+                        "temperature": temperature,
+                    },
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return path
+
+    def submit(self, path: str, metadata: dict = None):
+        """上传输入文件并创建批处理，返回批处理 id。"""
+        client = self.gpt.client
+        with open(path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+            metadata=metadata,
+        )
+        return batch.id
+
+    def wait(self, batch_id: str, should_stop=None, on_progress=None):
+        """
+        轮询直到批处理结束，返回最后一次查询到的批处理对象。
+        should_stop: 可选，返回 True 时取消批处理并立即返回
+        on_progress: 可选回调 (completed, failed, total)
+        """
+        client = self.gpt.client
+        while True:
+            batch = client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            if on_progress is not None and counts is not None:
+                on_progress(counts.completed, counts.failed, counts.total)
+            if batch.status in TERMINAL:
+                return batch
+            if should_stop is not None and should_stop():
+                try:
+                    client.batches.cancel(batch_id)
+                except Exception as e:
+                    print(f"Failed to cancel batch {batch_id}: {e}")
+                return client.batches.retrieve(batch_id)
+            time.sleep(self.poll_interval)
+
+    def results(self, batch, name: str = None):
+        """下载输出文件，返回 {custom_id: 回复文本}；失败的请求不在其中。"""
+        output_file_id = getattr(batch, "output_file_id", None)
+        if not output_file_id:
+            return {}
+        text = self.gpt.client.files.content(output_file_id).text
+        if name:
+            with open(os.path.join(self.work_dir, f"{name}.output.jsonl"), "w", encoding="utf-8") as f:
+                f.write(text)
+        responses = {}
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code", 200) != 200:
+                continue
+            try:
+                responses[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                continue
+        return responses
@@ -0,0 +1,229 @@
+"""
+A pool of equivalent model endpoints behind one inference() call.
+
+Several OpenAI-compatible base URLs and/or Ollama hosts serving the same
+model are used together:
+
+- each request goes to the healthy endpoint with the fewest outstanding
+  requests (ties broken by median latency);
+- an endpoint that fails eject_after times in a row is ejected for
+  eject_seconds, and a failed request is retried on another endpoint;
+- with hedging on, a request that is still running after the observed p95
+  latency is duplicated on another endpoint and the first answer wins, so
+  one slow server does not set the tail latency of the whole run.
+
+Latency is tracked per call class, i.e. by prompt length in powers of two:
+the many short per-paper scoring calls would otherwise set a p95 that every
+long call (overall summary, full-text summary, interest compilation) goes
+over, and the most expensive requests would all be sent twice. Rare classes
+never collect hedge_min_samples and are not hedged.
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Endpoint:
+    def __init__(self, model):
+        self.model = model
+        self.name = getattr(model, "base_url", None) or getattr(model, "host", None) or "default"
+        self.outstanding = 0
+        self.failures = 0  # 连续失败次数
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=200)
+
+    def median(self):
+        return statistics.median(self.latencies) if self.latencies else 0.0
+
+
+class ModelPool:
+    def __init__(
+        self,
+        models: list,
+        hedge: bool = True,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        eject_after: int = 3,
+        eject_seconds: float = 60,
+    ):
+        """
+        models: 提供同一模型的多个后端（GPT / Ollama 实例）
+        hedge: 是否对超过 p95 延迟的请求发送对冲请求
+        hedge_min_samples: 每个调用类别至少积累多少次延迟样本后才开始对冲
+        eject_after / eject_seconds: 连续失败 eject_after 次的后端暂停使用 eject_seconds 秒
+        """
+        if not models:
+            raise ValueError("ModelPool needs at least one model.")
+        self.endpoints = [Endpoint(m) for m in models]
+        self.model_name = getattr(models[0], "model_name", None)
+        self.hedge = hedge and len(models) > 1
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.latencies = {}  # 调用类别 -> 所有后端的成功延迟，用于估计该类别的 p95
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.lock = threading.Lock()
+        # 被对冲放弃的请求仍会跑完，线程数留足余量
+        self.executor = ThreadPoolExecutor(8 * len(models), thread_name_prefix="llm-pool")
+
+    def _pick(self, exclude=()):
+        """选择在途请求最少的健康后端并占用一个名额；全部被摘除时退而选最早恢复的。"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.ejected_until <= now]
+            if healthy:
+                endpoint = min(healthy, key=lambda e: (e.outstanding, e.median()))
+            else:
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    @staticmethod
+    def call_class(prompt: str):
+        """调用类别：提示词长度按 2 的幂分桶（<1k、1k-2k、2k-4k…字符）。"""
+        return (len(prompt) // 1024).bit_length()
+
+    def _call(self, endpoint: Endpoint, prompt, temperature, deadline=None):
+        start = time.monotonic()
+        try:
+            response = endpoint.model.inference(prompt, temperature=temperature, deadline=deadline)
+        except Exception:
+            with self.lock:
+                endpoint.outstanding -= 1
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= self.eject_after:
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                    endpoint.failures = 0
+                    print(f"Endpoint {endpoint.name} ejected for {self.eject_seconds}s after repeated failures.")
+            raise
+        latency = time.monotonic() - start
+        with self.lock:
+            endpoint.outstanding -= 1
+            endpoint.failures = 0
+            endpoint.latencies.append(latency)
+            self.latencies.setdefault(self.call_class(prompt), deque(maxlen=500)).append(latency)
+        return response
+
+    def hedge_delay(self, call_class: int = 0):
+        """对冲等待时间：该调用类别观测到的 p95 延迟，样本不足时返回 None。"""
+        with self.lock:
+            latencies = self.latencies.get(call_class, ())
+            if not self.hedge or len(latencies) < self.hedge_min_samples:
+                return None
+            samples = sorted(latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_quantile))]
+
+    def inference(self, prompt, temperature=0.7, deadline=None):
+        """deadline: 可选的 time.monotonic() 时间点，过了之后不再发起请求或对冲，并抛出 TimeoutError"""
+        start = time.monotonic()
+        call_class = self.call_class(prompt)
+        tried = []
+        futures = {}
+
+        def launch(exclude):
+            endpoint = self._pick(exclude)
+            if endpoint is None:
+                return False
+            tried.append(endpoint)
+            futures[self.executor.submit(self._call, endpoint, prompt, temperature, deadline)] = endpoint
+            return True
+
+        launch(())
+        hedged = False
+        last_error = None
+        while futures:
+            timeout = None
+            delay = None if hedged else self.hedge_delay(call_class)
+            if delay is not None:
+                timeout = max(0.0, delay - (time.monotonic() - start))
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done and deadline is not None and time.monotonic() >= deadline:
+                # 在途的请求各自以剩余时间为超时，很快会自行结束
+                raise TimeoutError("Deadline passed while waiting for the endpoints.")
+            if not done:
+                # 超过 p95 仍未返回，向另一个后端发送对冲请求
+                hedged = True
+                if launch(tried):
+                    with self.lock:
+                        self.hedges += 1
+                continue
+            for future in done:
+                endpoint = futures.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if endpoint is not tried[0]:
+                    with self.lock:
+                        self.hedge_wins += hedged
+                return response
+            if not futures:
+                if not launch(tried):
+                    break
+                # 故障转移后的请求重新计时，也可以再对冲一次
+                start = time.monotonic()
+                hedged = False
+        raise last_error
+
+    def ping(self, timeout=10):
+        """检查每个后端，不可用的直接摘除；全部不可用时抛出异常。"""
+        alive = 0
+        errors = []
+        for endpoint in self.endpoints:
+            try:
+                endpoint.model.ping(timeout=timeout)
+                alive += 1
+            except Exception as e:
+                errors.append(f"{endpoint.name}: {e}")
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+        for error in errors:
+            print(f"Endpoint unavailable, ejected: {error}")
+        if not alive:
+            raise RuntimeError("No endpoint in the pool is available.")
+        return True
+
+    def warm(self):
+        """预热所有未被摘除的后端，失败的后端只打印错误。"""
+        now = time.monotonic()
+        for endpoint in self.endpoints:
+            if endpoint.ejected_until > now:
+                continue
+            try:
+                endpoint.model.warm()
+            except Exception as e:
+                print(f"Failed to warm up endpoint {endpoint.name}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "endpoints": [
+                    {
+                        "name": e.name,
+                        "requests": e.requests,
+                        "errors": e.errors,
+                        "median_latency": round(e.median(), 3),
+                    }
+                    for e in self.endpoints
+                ],
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
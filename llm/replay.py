@@ -0,0 +1,126 @@
+"""
+Record and replay LLM calls.
+
+RecordedModel wraps a model and appends every call (prompt, response,
+latency) to a JSONL ResponseStore. With replay=True it answers from the
+store first and only calls the wrapped model on a miss, so a recorded day
+can be scored again fully offline; without a wrapped model a miss raises
+ReplayMiss. Calls are keyed by the model name and the exact prompt, so a
+pipeline configuration that changes the prompts has to be recorded once
+before it can be replayed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from util.tokens import estimate_tokens
+
+
+class ReplayMiss(KeyError):
+    # 重试不会让缺失的录制结果出现
+    retryable = False
+
+
+def prompt_key(model_name: str, prompt: str):
+    return hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class ResponseStore:
+    """录制的模型调用：path 为 JSONL 文件，每行一次调用。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.responses = {}  # key -> [{"response", "latency"}, ...]
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.responses.setdefault(record["key"], []).append(record)
+
+    def get(self, key: str, index: int):
+        """返回该 prompt 的第 index 次录制结果，录制次数不够时重复最后一次；没有录制时返回 None。"""
+        with self.lock:
+            records = self.responses.get(key)
+            if not records:
+                return None
+            return records[min(index, len(records) - 1)]
+
+    def add(self, key: str, model_name: str, prompt: str, response: str, latency: float):
+        record = {"key": key, "model": model_name, "prompt": prompt, "response": response, "latency": latency}
+        with self.lock:
+            self.responses.setdefault(key, []).append(record)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class RecordedModel:
+    def __init__(self, store: ResponseStore, model=None, model_name: str = None, replay: bool = False):
+        """
+        store: 录制结果的存放位置，可随时替换（如 daemon 每天换一个目录）
+        model: 被包装的模型；replay 模式下可以为 None，此时只能回放
+        replay: 先查录制结果，命中时不调用模型
+        """
+        if model is None and not replay:
+            raise ValueError("RecordedModel needs a model unless it only replays.")
+        self.store = store
+        self.model = model
+        self.model_name = model_name or getattr(model, "model_name", None)
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.seen = {}  # key -> 本实例已回放的次数
+        self.calls = 0
+        self.misses = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_seconds = 0.0  # 录制时（或实际调用）的累计延迟
+
+    def __getattr__(self, name):
+        # ping、warm、stats、close 等交给被包装的模型
+        model = self.__dict__.get("model")
+        if model is None:
+            raise AttributeError(name)
+        return getattr(model, name)
+
+    def inference(self, prompt, temperature=0.7, deadline=None):
+        key = prompt_key(self.model_name, prompt)
+        record = None
+        if self.replay:
+            with self.lock:
+                index = self.seen.get(key, 0)
+                self.seen[key] = index + 1
+            record = self.store.get(key, index)
+        if record is not None:
+            response, latency = record["response"], record["latency"]
+        else:
+            if self.model is None:
+                with self.lock:
+                    self.misses += 1
+                raise ReplayMiss(f"No recorded response of {self.model_name} for this prompt.")
+            start = time.monotonic()
+            response = self.model.inference(prompt, temperature=temperature, deadline=deadline)
+            latency = time.monotonic() - start
+            self.store.add(key, self.model_name, prompt, response, latency)
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += estimate_tokens(prompt)
+            self.completion_tokens += estimate_tokens(response)
+            self.llm_seconds += latency
+        return response
+
+    def usage(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "misses": self.misses,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "llm_seconds": round(self.llm_seconds, 2),
+            }
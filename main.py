@@ -1,26 +1,61 @@
-from util.construct_email import send_email
 from arxiv_daily import ArxivDaily
+from llm import get_model
+from llm.batch import Batch
+from util.mailer import Mailer
+from util.journal import RunJournal
+from util.harvest import HarvestFetcher
+from util.pdf import PdfFetcher
+from util.workqueue import make_broker
+from util.daemon import ANNOUNCE_AT, ANNOUNCE_TZ, Daemon, ListingPoller, listing_used
+from llm.replay import RecordedModel, ResponseStore
+import json
+from util import profiler
 import argparse
+import atexit
 import os
+import time
 
 
 
 if __name__ == "__main__":
+    start_time = time.monotonic()
     parser = argparse.ArgumentParser(description="Arxiv Daily")
-    parser.add_argument("--categories", nargs="+", help="categories", required=True)
+    parser.add_argument("--categories", nargs="+", help="categories")
     parser.add_argument("--max_paper_num", type=int, help="max_paper_num", default=60)
     parser.add_argument(
         "--max_entries", type=int, help="max_entries to get from arxiv", default=100
     )
-    parser.add_argument("--provider", type=str, help="provider", required=True)
+    parser.add_argument("--provider", type=str, help="provider")
     parser.add_argument("--model", type=str, help="model", required=None)
     parser.add_argument(
         "--save", action="store_true", help="Save the email content to a file."
     )
     parser.add_argument("--save_dir", type=str, default="./arxiv_history")
 
-    parser.add_argument("--base_url", type=str, help="base_url", default=None)
-    parser.add_argument("--api_key", type=str, help="api_key", default=None)
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        help="base_url; several comma-separated endpoints (or Ollama hosts) serving the same "
+        "model are load-balanced",
+        default=None,
+    )
+    parser.add_argument(
+        "--api_key", type=str, help="api_key, or one comma-separated key per base_url", default=None
+    )
+    parser.add_argument(
+        "--call_timeout", type=float, help="Timeout (s) of a single LLM request", default=60
+    )
+    parser.add_argument(
+        "--paper_timeout",
+        type=float,
+        help="Give up on a paper after this many seconds including retries, 0 for no limit.",
+        default=300,
+    )
+    parser.add_argument(
+        "--no_hedge",
+        action="store_true",
+        help="With several base_urls, do not duplicate requests that run past the p95 latency.",
+    )
 
     parser.add_argument(
         "--description",
@@ -31,18 +66,234 @@ if __name__ == "__main__":
 
     parser.add_argument("--smtp_server", type=str, help="SMTP server")
     parser.add_argument("--smtp_port", type=int, help="SMTP port")
+    parser.add_argument(
+        "--smtp_insecure",
+        action="store_true",
+        help="Log in and send without TLS when the server does not offer STARTTLS (sends the password in cleartext)",
+    )
     parser.add_argument("--sender", type=str, help="Sender email address")
     parser.add_argument("--receiver", type=str, help="Receiver email address")
     parser.add_argument("--sender_password", type=str, help="Sender email password")
     parser.add_argument("--temperature", type=float, help="Temperature", default=0.7)
+    parser.add_argument(
+        "--max_email_bytes",
+        type=int,
+        help="Byte budget of the email HTML, 0 for unlimited.",
+        default=100000,
+    )
+    parser.add_argument(
+        "--plain_text", action="store_true", help="Attach a plain-text alternative part."
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Time budget (s) of the whole run. Papers are scored in order of a keyword prior "
+        "and the best results so far are sent when the budget runs out.",
+        default=None,
+    )
+    parser.add_argument(
+        "--summary_reserve",
+        type=float,
+        help="Seconds of the deadline reserved for summarizing, rendering and sending.",
+        default=60,
+    )
+    parser.add_argument(
+        "--source",
+        choices=["listing", "oai", "atom"],
+        help="Where to get papers: the arXiv listing pages, OAI-PMH or the Atom API. "
+        "oai and atom support --from_date/--until_date backfills (oai by last-modified date, "
+        "atom by first submission date, neither exactly the announcement date).",
+        default="listing",
+    )
+    parser.add_argument("--from_date", type=str, help="First day (YYYY-MM-DD) to harvest", default=None)
+    parser.add_argument("--until_date", type=str, help="Last day (YYYY-MM-DD) to harvest", default=None)
+    parser.add_argument(
+        "--harvest_url", type=str, help="Base URL of the OAI-PMH or Atom endpoint", default=None
+    )
+    parser.add_argument(
+        "--whole_archive",
+        action="store_true",
+        help="Follow whole archives (e.g. --categories cs): fetch all of yesterday's papers "
+        "page by page with compact records, keeping only the top max_paper_num results.",
+    )
+    parser.add_argument(
+        "--page_size", type=int, help="Listing page size in whole-archive mode", default=500
+    )
+    parser.add_argument(
+        "--full_text_top",
+        type=int,
+        help="Re-summarize the top N papers from the introduction and conclusion of their PDFs, "
+        "0 to disable.",
+        default=0,
+    )
+    parser.add_argument("--pdf_cache_dir", type=str, help="PDF and text cache", default="./pdf_cache")
+    parser.add_argument(
+        "--pdf_max_pages", type=int, help="Read at most this many leading pages of a PDF", default=6
+    )
+    parser.add_argument("--pdf_max_mb", type=float, help="Skip PDFs larger than this (MB)", default=20)
+    parser.add_argument(
+        "--profile",
+        type=str,
+        help="Write a Chrome trace (open in chrome://tracing or ui.perfetto.dev) of every "
+        "stage and LLM call to this path.",
+        default=None,
+    )
+    parser.add_argument(
+        "--cprofile_dir",
+        type=str,
+        help="With --profile, also run cProfile on parsing and rendering and dump the stats here.",
+        default=None,
+    )
+    parser.add_argument(
+        "--triage_provider",
+        type=str,
+        help="Provider of a small model that triages every paper; only papers it scores within "
+        "[--escalate_min, --escalate_max] are rescored by --model, which also writes the overview.",
+        default=None,
+    )
+    parser.add_argument("--triage_model", type=str, help="Triage model", default=None)
+    parser.add_argument("--triage_base_url", type=str, help="Triage base_url", default=None)
+    parser.add_argument("--triage_api_key", type=str, help="Triage api_key", default=None)
+    parser.add_argument(
+        "--escalate_min", type=float, help="Lowest triage score that is escalated", default=4.0
+    )
+    parser.add_argument(
+        "--escalate_max", type=float, help="Highest triage score that is escalated", default=10.0
+    )
+    parser.add_argument(
+        "--journal_dir",
+        type=str,
+        help="Directory of the per-run journals used by --resume.",
+        default="./runs",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume today's run with the same configuration from its journal.",
+    )
+    parser.add_argument(
+        "--outbox_dir",
+        type=str,
+        help="Directory where failed emails are spooled for retry.",
+        default="./outbox",
+    )
+    parser.add_argument(
+        "--flush_outbox",
+        action="store_true",
+        help="Only retry the emails spooled in outbox_dir, then exit.",
+    )
 
     parser.add_argument("--num_workers", type=int, help="Number of workers", default=4)
+    parser.add_argument(
+        "--record_dir",
+        type=str,
+        help="Record the fetched papers and every LLM call of a run under record_dir/<date>/, "
+        "for offline evaluation with test/eval_ranking.py (not in whole-archive mode).",
+        default=None,
+    )
+    parser.add_argument(
+        "--interest_budget",
+        type=int,
+        help="Token budget of the research interests in each paper prompt; a longer description is "
+        "compiled once into a compact profile. 0 embeds the full description.",
+        default=300,
+    )
+    parser.add_argument(
+        "--dedup_threshold",
+        type=float,
+        help="Papers whose title and abstract overlap an already scored paper by at least this "
+        "(estimated Jaccard) inherit its score instead of being scored, 0 to disable.",
+        default=0.8,
+    )
+    parser.add_argument(
+        "--prefilter_keep",
+        type=float,
+        help="Send only this fraction of the papers (best BM25 match with the English terms of the "
+        "description, at least max_paper_num) to the LLM; terms written as -term are penalties. 0 to disable.",
+        default=0,
+    )
+    parser.add_argument(
+        "--interest_dir", type=str, help="Cache of compiled interest profiles", default="./interest_cache"
+    )
+    parser.add_argument(
+        "--broker",
+        type=str,
+        help="Work queue (e.g. sqlite:///queue.db) shared with worker.py processes that score the papers",
+        default=None,
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Score through the OpenAI-compatible Batch API: cheaper and outside the rate limits, "
+        "but results may take up to the completion window (for backfills and digests).",
+    )
+    parser.add_argument("--batch_dir", type=str, help="Batch input and output files", default="./batches")
+    parser.add_argument("--batch_poll", type=float, help="Seconds between batch status polls", default=30)
+    parser.add_argument(
+        "--batch_window", type=str, help="Completion window requested for the batch", default="24h"
+    )
     parser.add_argument(
         "--title", type=str, help="Title of the email", default="Daily arXiv"
     )
     parser.add_argument("--language", type=str, help="Language for email content", default="zh")
+    parser.add_argument(
+        "--health_timeout", type=float, help="Timeout (s) of the model health check", default=10
+    )
+    parser.add_argument(
+        "--skip_health_check", action="store_true", help="Skip the model health check."
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Stay resident and run after every arXiv announcement, with clients, caches and "
+        "the model kept warm between runs.",
+    )
+    parser.add_argument(
+        "--announce_at", type=str, help="Announcement time (HH:MM) in --announce_tz", default=ANNOUNCE_AT
+    )
+    parser.add_argument("--announce_tz", type=str, help="Time zone of --announce_at", default=ANNOUNCE_TZ)
+    parser.add_argument(
+        "--warm_ahead", type=float, help="Warm up the model this many seconds before the announcement", default=300
+    )
+    parser.add_argument(
+        "--poll_interval", type=float, help="Seconds between listing polls after the announcement", default=120
+    )
+    parser.add_argument(
+        "--poll_window",
+        type=float,
+        help="Stop polling this many seconds after the announcement if no new listing appears",
+        default=3 * 3600,
+    )
+    parser.add_argument(
+        "--keep_alive",
+        type=str,
+        help="Ollama only: keep the weights loaded this long after a request (e.g. 30m, -1m for ever). "
+        "Defaults to 24h with --daemon.",
+        default=None,
+    )
 
     args = parser.parse_args()
+    if args.profile:
+        profiler.enable(args.cprofile_dir)
+        # Export on any exit so that a failed run can be inspected too
+        atexit.register(profiler.export, args.profile)
+
+    mailer = Mailer(
+        args.sender,
+        args.sender_password,
+        args.smtp_server,
+        args.smtp_port,
+        title=args.title,
+        outbox_dir=args.outbox_dir,
+        allow_insecure=args.smtp_insecure,
+    )
+    # Retry emails that failed in previous runs before doing any new work
+    mailer.flush_outbox()
+    if args.flush_outbox:
+        mailer.close()
+        raise SystemExit(0)
+    if not args.categories or not args.provider:
+        parser.error("--categories and --provider are required")
 
     if not (args.provider == "Ollama" or args.provider == "ollama"):
         assert args.base_url is not None, (
@@ -52,60 +303,240 @@ if __name__ == "__main__":
             "api_key is required for SiliconFlow and OpenAI"
         )
 
-    with open(args.description, "r") as f:
+    description_path = args.description
+    with open(description_path, "r") as f:
         args.description = f.read()
+    if args.daemon and args.keep_alive is None:
+        args.keep_alive = "24h"
 
-    # Test LLM availability
-    if args.provider == "Ollama" or args.provider == "ollama":
-        from llm.Ollama import Ollama
+    triage_llm = None
+    if args.triage_provider:
+        triage_llm = get_model(
+            args.triage_provider.lower(),
+            args.triage_model,
+            args.triage_base_url,
+            args.triage_api_key,
+            timeout=args.call_timeout,
+            keep_alive=args.keep_alive,
+        )
 
-        try:
-            model = Ollama(args.model)
-            model.inference("Hello, who are you?")
-        except Exception as e:
-            print(e)
-            assert False, "Model not initialized successfully."
-    elif (
-        args.provider == "OpenAI"
-        or args.provider == "openai"
-        or args.provider == "SiliconFlow"
-    ):
-        from llm.GPT import GPT
+    # A comma-separated --base_url gives a pool balanced across the endpoints
+    try:
+        model = get_model(
+            args.provider,
+            args.model,
+            args.base_url,
+            args.api_key,
+            hedge=not args.no_hedge,
+            timeout=args.call_timeout,
+            keep_alive=args.keep_alive,
+        )
+    except ValueError as e:
+        print(e)
+        assert False, "Model not supported."
 
+    # Test LLM availability: a cheap model-list call instead of a full generation
+    if not args.skip_health_check:
         try:
-            model = GPT(args.model, args.base_url, args.api_key)
-            model.inference("Hello, who are you?")
+            model.ping(timeout=args.health_timeout)
+            if triage_llm is not None:
+                triage_llm.ping(timeout=args.health_timeout)
         except Exception as e:
             print(e)
             assert False, "Model not initialized successfully."
-    else:
-        assert False, "Model not supported."
+
+    recorders = []
+    if args.record_dir:
+        model = RecordedModel(None, model)
+        recorders.append(model)
+        if triage_llm is not None:
+            triage_llm = RecordedModel(None, triage_llm)
+            recorders.append(triage_llm)
 
     if args.save:
         os.makedirs(args.save_dir, exist_ok=True)
     else:
         args.save_dir = None
 
+    pdf_fetcher = None
+    if args.full_text_top > 0:
+        pdf_fetcher = PdfFetcher(
+            args.pdf_cache_dir,
+            max_pages=args.pdf_max_pages,
+            max_bytes=int(args.pdf_max_mb * 1024 * 1024),
+        )
+
+    broker = make_broker(args.broker) if args.broker else None
+
+    batch = None
+    if args.batch:
+        if args.provider.lower() == "ollama":
+            parser.error("--batch requires an OpenAI-compatible provider")
+        from llm import GPT
+
+        # The batch goes to the first endpoint only, pools are not split across batches
+        batch = Batch(
+            GPT(args.model, args.base_url.split(",")[0].strip(), args.api_key.split(",")[0].strip()),
+            args.batch_dir,
+            poll_interval=args.batch_poll,
+            completion_window=args.batch_window,
+        )
+
     arxiv_daily = ArxivDaily(
-        args.categories,
-        args.max_entries,
         args.max_paper_num,
         args.provider,
         args.model,
         args.base_url,
         args.api_key,
-        args.description,
         args.num_workers,
         args.temperature,
         save_dir=args.save_dir,
-        language=args.language,
+        llm=model,
+        fetcher=(
+            HarvestFetcher(args.source, args.from_date, args.until_date, args.harvest_url)
+            if args.source != "listing"
+            else None
+        ),
+        max_email_bytes=args.max_email_bytes or None,
+        plain_text=args.plain_text,
+        pdf_fetcher=pdf_fetcher,
+        full_text_top=args.full_text_top,
+        triage_llm=triage_llm,
+        escalate_min=args.escalate_min,
+        escalate_max=args.escalate_max,
+        paper_timeout=args.paper_timeout or None,
+        broker=broker,
+        interest_budget=args.interest_budget,
+        interest_dir=args.interest_dir,
+        dedup_threshold=args.dedup_threshold or None,
+        batch=batch,
+        prefilter_keep=args.prefilter_keep or None,
     )
 
-    arxiv_daily.send_email(
-        args.sender,
-        args.receiver,
-        args.sender_password,
-        args.smtp_server,
-        args.smtp_port,
-        args.title,
-    )
+    def run_once(listing=None):
+        """
+        listing: {category: newest arXiv id} of the categories with a new listing, given by the
+        daemon. Only those categories are run; the run id and the journal are keyed on it and the
+        listing is fetched again, bypassing the fetcher's per-day cache. Returns the categories
+        whose new listing was actually used.
+        """
+        # In daemon mode the description file is re-read, so edits apply from the next run
+        if args.daemon:
+            with open(description_path, "r") as f:
+                args.description = f.read()
+            mailer.flush_outbox()
+        run_start = time.monotonic() if args.daemon else start_time
+        day_dir = None
+        if args.record_dir:
+            day_dir = os.path.join(args.record_dir, time.strftime("%Y-%m-%d"))
+            store = ResponseStore(os.path.join(day_dir, "responses.jsonl"))
+            for recorder in recorders:
+                recorder.store = store
+        run_id = RunJournal.make_run_id(
+            args.categories, args.description, args.language, args.model, listing=listing
+        )
+        journal = RunJournal(
+            os.path.join(args.journal_dir, f"{run_id}.jsonl"), resume=args.resume or args.daemon
+        )
+        run_kwargs = dict(
+            language=args.language,
+            receivers=[addr.strip() for addr in args.receiver.split(",")],
+            mailer=mailer,
+            journal=journal,
+            summary_reserve=args.summary_reserve,
+        )
+
+        def remaining():
+            if args.deadline is None:
+                return None
+            return args.deadline - (time.monotonic() - run_start)
+
+        # A daemon run covers only the categories with a new listing
+        categories = list(listing) if listing else args.categories
+        try:
+            if args.whole_archive:
+                # Whole-archive listings are not stored in the journal; --resume fetches them again
+                arxiv_daily.run_archive(
+                    categories,
+                    args.description,
+                    deadline=remaining(),
+                    page_size=args.page_size,
+                    **run_kwargs,
+                )
+                # The pages are fetched live, there is no cached listing to tell apart
+                return set(listing or ())
+            else:
+                if journal.papers is not None:
+                    # The journal is keyed on the listing, so its fetch stage is from the same one
+                    papers = journal.papers
+                else:
+                    papers = arxiv_daily.fetch(categories, args.max_entries, refresh=listing is not None)
+                    if listing is not None:
+                        # arXiv may still serve the previous listing right after the poll; those
+                        # categories are left out and stay pending in the daemon
+                        used = listing_used(papers, listing)
+                        papers = {c: p for c, p in papers.items() if c in used}
+                        if not papers:
+                            print("The fetched listings are not the new ones yet, skipping this run.")
+                            return set()
+                    journal.checkpoint("fetch", papers=papers)
+                interest = None
+                if day_dir is not None:
+                    # The profile may come from --interest_dir without an LLM call, so the text
+                    # itself is recorded and the same text is used for the run
+                    interest = arxiv_daily.interest_for(args.description, args.language)
+                    os.makedirs(day_dir, exist_ok=True)
+                    with open(os.path.join(day_dir, "day.json"), "w", encoding="utf-8") as f:
+                        json.dump(
+                            {
+                                "categories": categories,
+                                "description": args.description,
+                                "language": args.language,
+                                "model": model.model_name,
+                                "triage_model": triage_llm.model_name if triage_llm is not None else None,
+                                "interest": interest,
+                                # ArxivDaily settings of the recorded run, the default replay configuration
+                                "config": {
+                                    "interest_budget": args.interest_budget,
+                                    "dedup_threshold": args.dedup_threshold or None,
+                                    "prefilter_keep": args.prefilter_keep or None,
+                                    "escalate_min": args.escalate_min,
+                                    "escalate_max": args.escalate_max,
+                                },
+                                "papers": papers,
+                            },
+                            f,
+                            ensure_ascii=False,
+                        )
+                arxiv_daily.run(papers, args.description, deadline=remaining(), interest=interest, **run_kwargs)
+                return listing_used(papers, listing or {})
+        finally:
+            journal.close()
+
+    if args.daemon:
+        daemon = Daemon(
+            run_once,
+            ListingPoller(args.categories),
+            models=[m for m in (model, triage_llm) if m is not None],
+            announce_at=args.announce_at,
+            tz=args.announce_tz,
+            warm_ahead=args.warm_ahead,
+            poll_interval=args.poll_interval,
+            poll_window=args.poll_window,
+            state_path=os.path.join(args.journal_dir, "daemon_state.json"),
+        )
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            print("Daemon stopped.")
+    else:
+        run_once()
+    arxiv_daily.close()
+    if hasattr(model, "stats"):
+        print(f"Endpoint pool: {model.stats()}")
+        model.close()
+    if pdf_fetcher is not None:
+        pdf_fetcher.close()
+    if broker is not None:
+        broker.close()
+    mailer.close()
@@ -0,0 +1,104 @@
+"""
+Startup benchmark: import time of the pipeline modules and wall time of a
+``main.py --help`` invocation, each measured in a fresh interpreter.
+
+    python test/bench_startup.py                       # print the numbers
+    python test/bench_startup.py --save baseline.json  # record a baseline
+    python test/bench_startup.py --baseline baseline.json --tolerance 0.2
+
+With --baseline, exits with status 1 if any measurement regressed by more
+than the given relative tolerance.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 这些模块不应该在启动时被导入
+HEAVY_MODULES = ["openai", "ollama", "bs4", "tqdm", "requests"]
+
+
+def import_time(module: str, repeat: int):
+    """Median cumulative import time (ms) of ``module`` and the heavy modules it pulled in."""
+    samples = []
+    loaded = set()
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        total = 0
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+            if not match:
+                continue
+            name = match.group(3)
+            if len(match.group(2)) == 1:  # 只累加顶层导入
+                total += int(match.group(1))
+            if name in HEAVY_MODULES:
+                loaded.add(name)
+        samples.append(total / 1000)
+    return statistics.median(samples), sorted(loaded)
+
+
+def command_time(cmd: list[str], repeat: int):
+    """Median wall time (ms) of running ``cmd`` in a fresh interpreter."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, capture_output=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", type=str, help="Write results to this JSON file.")
+    parser.add_argument("--baseline", type=str, help="Compare against this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    for module in ["llm", "arxiv_daily"]:
+        ms, loaded = import_time(module, args.repeat)
+        results[f"import {module}"] = ms
+        print(f"import {module}: {ms:.1f} ms")
+        if loaded:
+            print(f"  warning: eagerly imported {', '.join(loaded)}")
+    ms = command_time([sys.executable, "main.py", "--help"], args.repeat)
+    results["main.py --help"] = ms
+    print(f"main.py --help: {ms:.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = False
+        for name, ms in results.items():
+            if name not in baseline:
+                continue
+            ratio = ms / baseline[name] - 1
+            status = "REGRESSION" if ratio > args.tolerance else "ok"
+            regressed |= ratio > args.tolerance
+            print(f"{name}: {baseline[name]:.1f} -> {ms:.1f} ms ({ratio:+.0%}) {status}")
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Offline evaluation of ranking quality against cost.
+
+Replays recorded days (main.py --record_dir) through several pipeline
+configurations and compares each ranking with a reference configuration:
+precision@k of the top papers, rank-biased overlap (RBO) of the whole
+ranking and the mean score difference on shared papers, next to the number
+of LLM calls, estimated tokens, recorded LLM seconds and replay wall time.
+
+    python main.py ... --record_dir fixtures                    # record days online
+    python test/eval_ranking.py fixtures --configs configs.json   # compare offline
+
+configs.json is a list of configurations; "name" labels a configuration,
+"triage_model" replays a triage model under that name and every other key
+is passed to ArxivDaily (e.g. interest_budget, escalate_min, prefilter_keep),
+on top of the settings recorded in day.json. A configuration without
+overrides therefore replays the recorded run, including the interest profile
+it used (which may have come from --interest_dir without an LLM call):
+
+    [
+        {"name": "reference"},
+        {"name": "full_description", "interest_budget": 0}
+    ]
+
+Prompts that a configuration changes must have been recorded once; pass
+--provider/--model/... to call the main model on a miss and record the
+answer, otherwise a miss fails the paper and is reported in the misses
+column. Triage models are only replayed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from arxiv_daily import ArxivDaily, RunContext  # noqa: E402
+from llm.replay import RecordedModel, ResponseStore  # noqa: E402
+
+DEFAULT_CONFIGS = [
+    {"name": "reference"},
+    {"name": "full_description", "interest_budget": 0},
+]
+
+
+def precision_at_k(ranking: list[str], reference: list[str], k: int):
+    """ranking 前 k 篇中同时出现在 reference 前 k 篇中的比例。"""
+    if not reference[:k]:
+        return None
+    return len(set(ranking[:k]) & set(reference[:k])) / min(k, len(reference))
+
+
+def rank_biased_overlap(ranking: list[str], reference: list[str], p: float = 0.9):
+    """外推的 RBO（Webber et al., 2010），1 表示两个排序完全一致。"""
+    k = min(len(ranking), len(reference))
+    if k == 0:
+        return None
+    seen_a, seen_b = set(), set()
+    overlap = 0
+    total = 0.0
+    for d in range(1, k + 1):
+        a, b = ranking[d - 1], reference[d - 1]
+        if a == b:
+            overlap += 1
+        else:
+            overlap += (a in seen_b) + (b in seen_a)
+        seen_a.add(a)
+        seen_b.add(b)
+        total += overlap / d * p**d
+    return overlap / k * p**k + (1 - p) / p * total
+
+
+def load_days(path: str):
+    """path 是单个录制目录或包含多个录制目录的目录，返回 [(名称, day, 目录)]。"""
+    if os.path.exists(os.path.join(path, "day.json")):
+        dirs = [path]
+    else:
+        dirs = sorted(
+            os.path.join(path, d)
+            for d in os.listdir(path)
+            if os.path.exists(os.path.join(path, d, "day.json"))
+        )
+    days = []
+    for d in dirs:
+        with open(os.path.join(d, "day.json"), "r", encoding="utf-8") as f:
+            days.append((os.path.basename(os.path.normpath(d)), json.load(f), d))
+    return days
+
+
+def run_config(day: dict, day_dir: str, config: dict, args, live=None):
+    """用回放的模型对一天的论文评分，返回 (按分数排序的 arXiv_id, {id: 分数}, 开销)。"""
+    store = ResponseStore(os.path.join(day_dir, "responses.jsonl"))
+    model = RecordedModel(store, live, day["model"], replay=True)
+    triage = None
+    if config.get("triage_model"):
+        triage = RecordedModel(store, None, config["triage_model"], replay=True)
+    # 录制时的设置打底，配置中的键覆盖它们
+    kwargs = dict(day.get("config", {}))
+    kwargs.update((k, v) for k, v in config.items() if k not in ("name", "triage_model"))
+    kwargs.setdefault("interest_dir", None)
+    engine = ArxivDaily(
+        args.max_paper_num,
+        "replay",
+        day["model"],
+        None,
+        None,
+        args.num_workers,
+        args.temperature,
+        llm=model,
+        triage_llm=triage,
+        **kwargs,
+    )
+    # 画像预算与录制时相同时直接使用录制的画像，不重新编译
+    interest = None
+    if kwargs.get("interest_budget", 300) == day.get("config", {}).get("interest_budget"):
+        interest = day.get("interest")
+    run = RunContext(day["description"], day.get("language", "zh"), interest=interest)
+    start = time.monotonic()
+    try:
+        recommendations = engine.get_recommendation(day["papers"], run)
+    finally:
+        engine.close()
+    wall = time.monotonic() - start
+
+    cost = model.usage()
+    if triage is not None:
+        for key, value in triage.usage().items():
+            cost[key] += value
+    cost["tokens"] = cost.pop("prompt_tokens") + cost.pop("completion_tokens")
+    cost["wall_seconds"] = round(wall, 2)
+    ranking = [r["arXiv_id"] for r in recommendations]
+    scores = {r["arXiv_id"]: r["relevance_score"] for r in recommendations}
+    return ranking, scores, cost
+
+
+def compare(ranking, scores, reference, reference_scores, ks):
+    metrics = {f"p@{k}": precision_at_k(ranking, reference, k) for k in ks}
+    metrics["rbo"] = rank_biased_overlap(ranking, reference)
+    shared = set(scores) & set(reference_scores)
+    metrics["score_diff"] = (
+        sum(abs(scores[i] - reference_scores[i]) for i in shared) / len(shared) if shared else None
+    )
+    return metrics
+
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ranking evaluation")
+    parser.add_argument("fixtures", type=str, help="A recorded day, or a directory of recorded days")
+    parser.add_argument("--configs", type=str, help="JSON file with the configurations", default=None)
+    parser.add_argument("--reference", type=str, help="Name of the reference configuration", default=None)
+    parser.add_argument("--ks", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--max_paper_num", type=int, default=60)
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--output", type=str, help="Write the full report as JSON", default=None)
+    parser.add_argument("--provider", type=str, help="Call this model on a replay miss", default=None)
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--base_url", type=str, default=None)
+    parser.add_argument("--api_key", type=str, default=None)
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, "r", encoding="utf-8") as f:
+            configs = json.load(f)
+    reference_name = args.reference or configs[0]["name"]
+    if reference_name not in [c["name"] for c in configs]:
+        parser.error(f"Unknown reference configuration: {reference_name}")
+    days = load_days(args.fixtures)
+    if not days:
+        parser.error(f"No recorded day (day.json) under {args.fixtures}")
+
+    live = None
+    if args.provider:
+        from llm import get_model
+
+        live = get_model(args.provider, args.model, args.base_url, args.api_key)
+
+    report = {"reference": reference_name, "days": {}, "configs": {}}
+    for name, day, day_dir in days:
+        results = {}
+        for config in configs:
+            print(f"== {name}: {config['name']}")
+            results[config["name"]] = run_config(day, day_dir, config, args, live)
+        reference, reference_scores, _ = results[reference_name]
+        report["days"][name] = {}
+        for config_name, (ranking, scores, cost) in results.items():
+            metrics = compare(ranking, scores, reference, reference_scores, args.ks)
+            report["days"][name][config_name] = {**metrics, **cost}
+
+    columns = [f"p@{k}" for k in args.ks] + [
+        "rbo", "score_diff", "calls", "tokens", "llm_seconds", "wall_seconds", "misses",
+    ]
+    for config in configs:
+        rows = [report["days"][name][config["name"]] for name, _, _ in days]
+        report["configs"][config["name"]] = {c: mean([r[c] for r in rows]) for c in columns}
+
+    print(f"\n{len(days)} day(s), reference: {reference_name}")
+    print(f"{'config':<20}" + "".join(f"{c:>13}" for c in columns))
+    for config_name, row in report["configs"].items():
+        cells = []
+        for c in columns:
+            value = row[c]
+            if value is None:
+                cells.append(f"{'-':>13}")
+            elif c.startswith("p@") or c in ("rbo", "score_diff"):
+                cells.append(f"{value:>13.3f}")
+            else:
+                cells.append(f"{value:>13.1f}")
+        print(f"{config_name:<20}" + "".join(cells))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
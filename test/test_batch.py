@@ -0,0 +1,232 @@
+"""
+Batch API scoring against a local stand-in for the OpenAI batch endpoints.
+
+    python -m pytest test/test_batch.py
+
+The stand-in server implements file upload and download and the create,
+retrieve and cancel batch calls, and executes a batch after a few polls. The
+paper id decides the outcome of each request: *.3 fails with an error,
+*.4 answers with text that is not JSON and *.5 gets HTTP 500. An expired
+batch returns only the first half of its output, and a batch can also be
+left running forever to test the deadline.
+"""
+
+import email.parser
+import itertools
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from arxiv_daily import ArxivDaily  # noqa: E402
+from llm import GPT  # noqa: E402
+from llm.batch import Batch  # noqa: E402
+from util.journal import RunJournal  # noqa: E402
+
+
+class BatchServer(BaseHTTPRequestHandler):
+    files = {}
+    batches = {}
+    ids = itertools.count(1)
+    outcome = "completed"  # completed、expired 或 never
+    polls_to_finish = 2
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, status=200, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/files":
+            message = email.parser.BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+            )
+            content = next(p.get_payload(decode=True) for p in message.get_payload() if p.get_filename())
+            file_id = f"file-{next(self.ids)}"
+            self.files[file_id] = content
+            return self.reply(
+                {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                 "filename": "input.jsonl", "purpose": "batch", "status": "processed"}
+            )
+        if self.path == "/v1/batches":
+            request = json.loads(body)
+            batch_id = f"batch-{next(self.ids)}"
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                "completion_window": request["completion_window"], "input_file_id": request["input_file_id"],
+                "created_at": 0, "status": "in_progress", "output_file_id": None, "polls": 0,
+            }
+            return self.reply(self.view(self.batches[batch_id]))
+        if self.path.startswith("/v1/batches/") and self.path.endswith("/cancel"):
+            batch = self.batches[self.path.split("/")[3]]
+            batch["status"] = "cancelled"
+            return self.reply(self.view(batch))
+        self.reply({"error": "not found"}, 404)
+
+    def do_GET(self):
+        parts = self.path.split("/")
+        if parts[2] == "files" and parts[-1] == "content":
+            return self.reply(self.files[parts[3]], content_type="application/octet-stream")
+        if parts[2] == "batches":
+            batch = self.batches[parts[3]]
+            batch["polls"] += 1
+            if batch["status"] == "in_progress" and self.outcome != "never":
+                if batch["polls"] >= self.polls_to_finish:
+                    self.execute(batch)
+            return self.reply(self.view(batch))
+        self.reply({"error": "not found"}, 404)
+
+    def view(self, batch):
+        lines = self.files[batch["input_file_id"]].decode("utf-8").splitlines()
+        done = len(lines) if batch["status"] in ("completed", "expired") else 0
+        view = {k: v for k, v in batch.items() if k != "polls"}
+        view["request_counts"] = {"completed": done, "failed": 0, "total": len(lines)}
+        return view
+
+    def execute(self, batch):
+        requests = [json.loads(line) for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines()]
+        if self.outcome == "expired":
+            requests = requests[: len(requests) // 2]
+        output = []
+        for request in requests:
+            custom_id = request["custom_id"]
+            prompt = request["body"]["messages"][0]["content"][0]["text"]
+            if custom_id.endswith(".3"):
+                output.append({"custom_id": custom_id, "response": None, "error": {"code": "server_error"}})
+                continue
+            status = 500 if custom_id.endswith(".5") else 200
+            content = "not json" if custom_id.endswith(".4") else json.dumps(
+                {"summary": "batch", "relevance": 9.0 if "Fuzzing" in prompt else 2.0}
+            )
+            output.append({
+                "custom_id": custom_id,
+                "response": {"status_code": status, "body": {"choices": [{"message": {"content": content}}]}},
+                "error": None,
+            })
+        file_id = f"file-{next(self.ids)}"
+        self.files[file_id] = "\n".join(json.dumps(o) for o in output).encode("utf-8")
+        batch.update(status=self.outcome, output_file_id=file_id)
+
+
+class OnlineModel:
+    """批处理之外的在线评分。"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def inference(self, prompt, temperature=0.7):
+        if '"relevance"' in prompt:
+            self.calls += 1
+            return json.dumps({"summary": "online", "relevance": 5.0})
+        return "<h2>summary</h2>"
+
+
+PAPERS = {
+    "cs.AI": [
+        {
+            "title": "Fuzzing Agents" if i == 0 else f"Paper {i}",
+            "arXiv_id": f"2610.{i}",
+            "abstract": f"Abstract {i} " + " ".join(f"w{i}x{j}" for j in range(30)),
+            "comments": "",
+            "pdf_url": f"https://arxiv.org/pdf/2610.{i}",
+            "abstract_url": "",
+        }
+        for i in range(8)
+    ]
+}
+
+
+@pytest.fixture
+def server():
+    BatchServer.files = {}
+    BatchServer.batches = {}
+    BatchServer.outcome = "completed"
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), BatchServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_engine(server, tmp_path, online):
+    batch = Batch(GPT("stub-model", server, "sk-test", retries=1), str(tmp_path / "batches"), poll_interval=0.05)
+    return ArxivDaily(10, "openai", "stub-model", None, None, 2, 0.7, llm=online, batch=batch, dedup_threshold=None)
+
+
+def test_submit_poll_collect(server, tmp_path):
+    batch = Batch(GPT("stub-model", server, "sk-test", retries=1), str(tmp_path), poll_interval=0.05)
+    path = batch.write("run", [(f"2610.{i}", f"prompt {i}") for i in range(6)], temperature=0.5)
+    batch_id = batch.submit(path)
+    progress = []
+    finished = batch.wait(batch_id, on_progress=lambda *counts: progress.append(counts))
+    assert finished.status == "completed"
+    assert progress[-1] == (6, 0, 6)
+    uploaded = [json.loads(line) for line in BatchServer.files[BatchServer.batches[batch_id]["input_file_id"]].splitlines()]
+    assert uploaded[0]["body"]["model"] == "stub-model"
+    assert uploaded[0]["body"]["temperature"] == 0.5
+    responses = batch.results(finished, "run")
+    # 出错的请求和非 200 的回复不在结果中
+    assert sorted(responses) == ["2610.0", "2610.1", "2610.2", "2610.4"]
+    assert responses["2610.4"] == "not json"
+    assert os.path.exists(tmp_path / "run.output.jsonl")
+
+
+def test_run_rescoring_failures_online(server, tmp_path):
+    online = OnlineModel()
+    engine = make_engine(server, tmp_path, online)
+    journal = RunJournal(str(tmp_path / "journal.jsonl"))
+    recommendations, _ = engine.run(PAPERS, "fuzzing", journal=journal)
+    journal.close()
+    engine.close()
+    by_id = {r["arXiv_id"]: r for r in recommendations}
+    assert len(by_id) == 8
+    assert by_id["2610.0"]["relevance_score"] == 9.0
+    assert {i for i, r in by_id.items() if r["summary"] == "online"} == {"2610.3", "2610.4", "2610.5"}
+    assert online.calls == 3
+    assert len(BatchServer.batches) == 1
+
+    # 续跑时等待同一个批处理，不重新提交
+    online = OnlineModel()
+    engine = make_engine(server, tmp_path, online)
+    journal = RunJournal(str(tmp_path / "journal.jsonl"), resume=True)
+    journal.results.clear()
+    engine.run(PAPERS, "fuzzing", journal=journal)
+    journal.close()
+    engine.close()
+    assert len(BatchServer.batches) == 1
+    assert online.calls == 3
+
+
+def test_expired_batch(server, tmp_path):
+    BatchServer.outcome = "expired"
+    online = OnlineModel()
+    engine = make_engine(server, tmp_path, online)
+    recommendations, _ = engine.run(PAPERS, "fuzzing")
+    engine.close()
+    assert len(recommendations) == 8
+    # 过期前完成了前一半（其中 2610.3 出错），其余在线评分
+    assert online.calls == 5
+
+
+def test_deadline_cancels_batch(server, tmp_path):
+    BatchServer.outcome = "never"
+    online = OnlineModel()
+    engine = make_engine(server, tmp_path, online)
+    recommendations, _ = engine.run(PAPERS, "fuzzing", deadline=0.3, summary_reserve=0)
+    engine.close()
+    assert recommendations == []
+    assert online.calls == 0
+    assert [b["status"] for b in BatchServer.batches.values()] == ["cancelled"]
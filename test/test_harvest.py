@@ -0,0 +1,104 @@
+"""
+OAI-PMH harvesting against recorded responses served from a local fixture server.
+
+    python -m pytest test/test_harvest.py
+
+fixtures/oai holds two pages of a ListRecords response joined by a
+resumption token (with a deleted record and a paper outside the requested
+category) and a noRecordsMatch error. The server answers the first request
+with 503 and Retry-After, as arXiv does when it throttles a harvester.
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from util.harvest import HarvestFetcher, iter_oai_papers  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "oai")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    throttle = 0  # 还要以 503 回应的请求数
+    requests = []  # 收到的查询参数
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        FixtureHandler.requests.append(params)
+        if FixtureHandler.throttle > 0:
+            FixtureHandler.throttle -= 1
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        if params.get("resumptionToken") == "token-page-2":
+            name = "page2.xml"
+        elif params.get("from") == "2026-10-15":
+            name = "page1.xml"
+        else:
+            name = "no_records.xml"
+        with open(os.path.join(FIXTURES, name), "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    FixtureHandler.throttle = 0
+    FixtureHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/oai"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_pages_deleted_records_and_category_filter(server):
+    papers = list(iter_oai_papers("cs.AI", "2026-10-15", "2026-10-15", base_url=server))
+    # 2610.01002 只属于 cs.CV，2610.00999 已删除
+    assert [p["arXiv_id"] for p in papers] == ["2610.01001", "1905.00123"]
+    first = papers[0]
+    assert first["title"] == "Fuzzing Language Model Agents"
+    assert first["abstract"] == "We fuzz the tool calls of language model agents."
+    assert first["comments"] == "12 pages"
+    assert first["pdf_url"] == "https://arxiv.org/pdf/2610.01001"
+    # 第二页只带 verb 和 resumptionToken
+    assert FixtureHandler.requests[0]["set"] == "cs"
+    assert FixtureHandler.requests[1] == {"verb": "ListRecords", "resumptionToken": "token-page-2"}
+
+
+def test_whole_archive(server):
+    papers = list(iter_oai_papers("cs", "2026-10-15", "2026-10-15", base_url=server))
+    assert [p["arXiv_id"] for p in papers] == ["2610.01001", "2610.01002", "1905.00123"]
+
+
+def test_no_records_match(server):
+    assert list(iter_oai_papers("cs", "2026-10-18", "2026-10-18", base_url=server)) == []
+
+
+def test_retry_after(server):
+    FixtureHandler.throttle = 2
+    papers = list(iter_oai_papers("cs.AI", "2026-10-15", "2026-10-15", base_url=server))
+    assert len(papers) == 2
+    assert len(FixtureHandler.requests) == 4
+
+
+def test_fetcher(server):
+    fetcher = HarvestFetcher("oai", "2026-10-15", "2026-10-15", base_url=server, min_sleep=0, max_sleep=0)
+    assert [p["arXiv_id"] for p in fetcher.fetch_papers("cs.AI", 1)] == ["2610.01001"]
+    assert len(list(fetcher.iter_papers(["cs.AI", "cs.CV"]))) == 3
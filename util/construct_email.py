@@ -1,159 +1,126 @@
+"""
+Render the recommendation email.
+
+All styling lives in one shared <style> block and the per-paper blocks only
+carry class names, so the markup repeated for every paper stays small. The
+templates are compiled once at import time and the body is assembled with
+str.join. render_email_html() enforces a byte budget (Gmail clips messages
+above ~102 KB) by shortening TLDRs and, if needed, collapsing the tail of
+the list into title-only links. An overall summary that alone would not
+leave room for that list is cut down to plain text first.
+"""
+
+import html
 import math
-from tqdm import tqdm
-from email.header import Header
-from email.mime.text import MIMEText
-from email.utils import parseaddr, formataddr
-import smtplib
-import datetime
-from loguru import logger
-
-framework = """
-<!DOCTYPE HTML>
-<html>
-<head>
-  <style>
-    .star-wrapper {
-      font-size: 1.3em; /* 调整星星大小 */
-      line-height: 1; /* 确保垂直对齐 */
-      display: inline-flex;
-      align-items: center; /* 保持对齐 */
-    }
-    .half-star {
-      display: inline-block;
-      width: 0.5em; /* 半颗星的宽度 */
-      overflow: hidden;
-      white-space: nowrap;
-      vertical-align: middle;
-    }
-    .full-star {
-      vertical-align: middle;
-    }
-  </style>
-</head>
-<body>
-
-<div>
-    __CONTENT__
-</div>
-
-<br><br>
-<div>
-To unsubscribe, remove your email in your Github Action setting.
-</div>
-
-</body>
-</html>
+import re
+from string import Template
+
+# Gmail 会截断超过约 102KB 的邮件，留出邮件头的余量
+DEFAULT_MAX_BYTES = 100_000
+
+# 依次尝试的 TLDR 截断长度（字符），None 表示不截断
+TLDR_LIMITS = (None, 400, 250, 150, 80)
+
+STYLE = """
+.star-wrapper{font-size:1.3em;line-height:1;display:inline-flex;align-items:center}
+.half-star{display:inline-block;width:.5em;overflow:hidden;white-space:nowrap;vertical-align:middle}
+.full-star{vertical-align:middle}
+h2{color:#2c3e50;border-bottom:3px solid #3498db;padding-bottom:12px;margin:25px 0 20px;font-size:28px;font-weight:bold}
+p,ol{color:#34495e;line-height:1.8;font-size:16px}
+p{margin:15px 0}
+li{margin:15px 0;font-size:16px}
+.paper-title{color:#2980b9;font-weight:bold;font-size:20px}
+.relevance{color:#e74c3c;font-style:italic;font-size:18px;font-weight:bold}
+.abstract,.analysis{margin-left:25px;color:#2c3e50;font-size:16px;line-height:1.8}
+.paper{font-family:Arial,sans-serif;border:1px solid #ddd;border-radius:8px;padding:16px;background-color:#f9f9f9;margin:8px 0;width:100%}
+.paper td{font-size:14px;color:#333;padding:8px 0}
+.paper td.title{font-size:20px;font-weight:bold;padding:0}
+.pdf{display:inline-block;text-decoration:none;font-size:14px;font-weight:bold;color:#fff;background-color:#d9534f;padding:8px 16px;border-radius:4px}
+.more li{margin:4px 0;font-size:14px}
 """
 
+FRAMEWORK = Template(
+    "<!DOCTYPE HTML><html><head><meta charset=\"utf-8\"><style>"
+    + re.sub(r"\s*\n\s*", "", STYLE)
+    + "</style></head><body><div>$content</div><br><br><div>"
+    "To unsubscribe, remove your email in your Github Action setting.</div></body></html>"
+)
+
+BLOCK = Template(
+    '<table class="paper" border="0" cellpadding="0" cellspacing="0">'
+    '<tr><td class="title">$title</td></tr>'
+    "<tr><td><strong>Relevance:</strong> $rate</td></tr>"
+    "<tr><td><strong>arXiv ID:</strong> $arxiv_id</td></tr>"
+    "<tr><td><strong>TLDR:</strong> $abstract</td></tr>"
+    "$similar"
+    '<tr><td><a class="pdf" href="$pdf_url">PDF</a></td></tr>'
+    "</table>"
+)
+SIMILAR = Template("<tr><td><strong>Similar:</strong> $links</td></tr>")
+SIMILAR_LINK = Template('<a href="$pdf_url">$title</a> ($arxiv_id)')
+
+MORE = Template('<h2>$heading</h2><ol class="more" start="$start">$items</ol>')
+MORE_ITEM = Template('<li><a href="$pdf_url">$title</a> ($score)</li>')
+
+EMPTY = (
+    '<table class="paper" border="0" cellpadding="0" cellspacing="0">'
+    '<tr><td class="title">No Papers Today. Take a Rest!</td></tr></table>'
+)
+
+# 兼容旧接口：framework.replace("__CONTENT__", content)
+framework = FRAMEWORK.safe_substitute(content="__CONTENT__")
+
+FULL_STAR = '<span class="full-star">⭐</span>'
+HALF_STAR = '<span class="half-star">⭐</span>'
+
 
 def get_empty_html():
-    block_template = """
-  <table border="0" cellpadding="0" cellspacing="0" width="100%" style="font-family: Arial, sans-serif; border: 1px solid #ddd; border-radius: 8px; padding: 16px; background-color: #f9f9f9;">
-  <tr>
-    <td style="font-size: 20px; font-weight: bold; color: #333;">
-        No Papers Today. Take a Rest!
-    </td>
-  </tr>
-  """
-    return block_template
+    return EMPTY
 
 
 def get_summary_html(summary: str):
-    summary = summary.replace("{", "{{").replace("}", "}}")
-    style = """
-        <style>
-            h2 {
-                color: #2c3e50;
-                border-bottom: 3px solid #3498db;
-                padding-bottom: 12px;
-                margin: 25px 0 20px 0;
-                font-size: 28px;
-                font-weight: bold;
-                text-shadow: 1px 1px 2px rgba(0,0,0,0.1);
-            }
-            p {
-                color: #34495e;
-                line-height: 1.8;
-                margin: 15px 0;
-                font-size: 16px;
-            }
-            ol {
-                color: #34495e;
-                line-height: 1.8;
-                font-size: 16px;
-            }
-            li {
-                margin: 15px 0;
-                font-size: 16px;
-            }
-            .paper-title {
-                color: #2980b9;
-                font-weight: bold;
-                font-size: 20px;
-            }
-            .relevance {
-                color: #e74c3c;
-                font-style: italic;
-                font-size: 18px;
-                font-weight: bold;
-            }
-            .abstract, .analysis {
-                margin-left: 25px;
-                color: #2c3e50;
-                font-size: 16px;
-                line-height: 1.8;
-            }
-        </style>
-    """
-    summary = summary.replace("</head>", f"{style}</head>")
+    # 样式统一放在 FRAMEWORK 的 <style> 中，这里不再重复注入
     return summary
 
 
-def get_block_html(title: str, rate: str, arxiv_id: str, abstract: str, pdf_url: str):
-    block_template = """
-    <table border="0" cellpadding="0" cellspacing="0" width="100%" style="font-family: Arial, sans-serif; border: 1px solid #ddd; border-radius: 8px; padding: 16px; background-color: #f9f9f9;">
-    <tr>
-        <td style="font-size: 20px; font-weight: bold; color: #333;">
-            {title}
-        </td>
-    </tr>
-    <tr>
-        <td style="font-size: 14px; color: #333; padding: 8px 0;">
-            <strong>Relevance:</strong> {rate}
-        </td>
-    </tr>
-    <tr>
-        <td style="font-size: 14px; color: #333; padding: 8px 0;">
-            <strong>arXiv ID:</strong> {arxiv_id}
-        </td>
-    </tr>
-    <tr>
-        <td style="font-size: 14px; color: #333; padding: 8px 0;">
-            <strong>TLDR:</strong> {abstract}
-        </td>
-    </tr>
-
-    <tr>
-        <td style="padding: 8px 0;">
-            <a href="{pdf_url}" style="display: inline-block; text-decoration: none; font-size: 14px; font-weight: bold; color: #fff; background-color: #d9534f; padding: 8px 16px; border-radius: 4px;">PDF</a>
-        </td>
-    </tr>
-</table>
-"""
-    return block_template.format(
-        title=title, rate=rate, arxiv_id=arxiv_id, abstract=abstract, pdf_url=pdf_url
+def truncate(text: str, limit: int = None):
+    if limit is None or len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "…"
+
+
+def get_block_html(
+    title: str, rate: str, arxiv_id: str, abstract: str, pdf_url: str, duplicates: list[dict] = None
+):
+    """duplicates: 归到这篇论文下的近重复论文 [{"title", "arXiv_id", "pdf_url"}]"""
+    similar = ""
+    if duplicates:
+        links = "; ".join(
+            SIMILAR_LINK.substitute(
+                pdf_url=html.escape(d["pdf_url"], quote=True),
+                title=html.escape(d["title"]),
+                arxiv_id=html.escape(d["arXiv_id"]),
+            )
+            for d in duplicates
+        )
+        similar = SIMILAR.substitute(links=links)
+    return BLOCK.substitute(
+        title=html.escape(title),
+        rate=rate,
+        arxiv_id=html.escape(arxiv_id),
+        abstract=html.escape(abstract),
+        similar=similar,
+        pdf_url=html.escape(pdf_url, quote=True),
     )
 
 
 def get_stars(score: float):
-    full_star = '<span class="full-star">⭐</span>'
-    half_star = '<span class="half-star">⭐</span>'
     low = 2
     high = 8
     if score <= low:
         return ""
     elif score >= high:
-        return full_star * 5
+        return FULL_STAR * 5
     else:
         interval = (high - low) / 10
         star_num = math.ceil((score - low) / interval)
@@ -161,38 +128,110 @@ def get_stars(score: float):
         half_star_num = star_num - full_star_num * 2
         return (
             '<div class="star-wrapper">'
-            + full_star * full_star_num
-            + half_star * half_star_num
+            + FULL_STAR * full_star_num
+            + HALF_STAR * half_star_num
             + "</div>"
         )
 
 
-def send_email(
-    sender: str,
-    receiver: str,
-    password: str,
-    smtp_server: str,
-    smtp_port: int,
-    html: str,
-):
-    def _format_addr(s):
-        name, addr = parseaddr(s)
-        return formataddr((Header(name, "utf-8").encode(), addr))
-
-    msg = MIMEText(html, "html", "utf-8")
-    msg["From"] = _format_addr("Github Action <%s>" % sender)
-    msg["To"] = _format_addr("You <%s>" % receiver)
-    today = datetime.datetime.now().strftime("%Y/%m/%d")
-    msg["Subject"] = Header(f"Daily arXiv {today}", "utf-8").encode()
-
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-    except Exception as e:
-        logger.warning(f"Failed to use TLS. {e}")
-        logger.warning(f"Try to use SSL.")
-        server = smtplib.SMTP_SSL(smtp_server, smtp_port)
-
-    server.login(sender, password)
-    server.sendmail(sender, [receiver], msg.as_string())
-    server.quit()
+def _render(summary: str, papers: list[dict], tldr_limit: int = None, keep: int = None):
+    """渲染完整邮件；keep 之后的论文只保留标题链接。"""
+    if keep is None:
+        keep = len(papers)
+    parts = [summary]
+    for i, p in enumerate(papers[:keep]):
+        parts.append(
+            get_block_html(
+                f"{i + 1}. {p['title']}",
+                get_stars(p["relevance_score"]),
+                p["arXiv_id"],
+                truncate(str(p["summary"]), tldr_limit),
+                p["pdf_url"],
+                p.get("duplicates"),
+            )
+        )
+    if keep < len(papers):
+        items = "".join(
+            MORE_ITEM.substitute(
+                pdf_url=html.escape(p["pdf_url"], quote=True),
+                title=html.escape(p["title"]),
+                score=p["relevance_score"],
+            )
+            for p in papers[keep:]
+        )
+        parts.append(MORE.substitute(heading="More Papers", start=keep + 1, items=items))
+    return FRAMEWORK.substitute(content="".join(parts))
+
+
+def truncate_summary(summary: str, max_bytes: int):
+    """
+    总结超过 max_bytes 字节时转为纯文本并按字节截断，避免在标签中间截断 HTML；
+    未超出时原样返回。
+    """
+    if len(summary.encode("utf-8")) <= max_bytes:
+        return summary
+    wrapper = "<p></p>"
+    budget = max(0, max_bytes - len(wrapper) - len("…".encode("utf-8")))
+    text = html.escape(_html_to_text(summary)).replace("\n", "<br>")
+    text = text.encode("utf-8")[:budget].decode("utf-8", errors="ignore")
+    # 不留下被截断的实体或 <br>
+    text = re.sub(r"&[^;\s]*$|<[^>]*$", "", text).rstrip()
+    return f"<p>{text}…</p>"
+
+
+def render_email_html(summary: str, papers: list[dict], max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    渲染推荐邮件。超过 max_bytes（UTF-8 字节）时逐步缩短 TLDR，
+    仍然超出则将排名靠后的论文折叠为仅含标题的链接列表。max_bytes 为 None 时不限制。
+    总结本身就会挤掉这个标题列表时，先把总结截断到剩余的预算内（且不超过一半）。
+    """
+    if max_bytes is not None:
+        floor = _render("", papers, TLDR_LIMITS[-1], 0) if papers else FRAMEWORK.substitute(content=EMPTY)
+        room = max(0, max_bytes - len(floor.encode("utf-8")))
+        if len(summary.encode("utf-8")) > room:
+            # 截断后最多占一半预算，其余留给论文区块
+            summary = truncate_summary(summary, min(room, max_bytes // 2))
+    if not papers:
+        return FRAMEWORK.substitute(content=summary + EMPTY if summary else EMPTY)
+
+    content = None
+    for limit in TLDR_LIMITS:
+        content = _render(summary, papers, limit)
+        if max_bytes is None or len(content.encode("utf-8")) <= max_bytes:
+            return content
+
+    # 二分查找能保留完整区块的最多论文数
+    lo, hi = 0, len(papers)
+    best = _render(summary, papers, TLDR_LIMITS[-1], 0)
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        candidate = _render(summary, papers, TLDR_LIMITS[-1], mid)
+        if len(candidate.encode("utf-8")) <= max_bytes:
+            best = candidate
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def _html_to_text(fragment: str):
+    text = re.sub(r"<\s*(br|/p|/li|/h\d|/tr)\s*/?>", "\n", fragment, flags=re.I)
+    text = re.sub(r"<[^>]+>", "", text)
+    text = html.unescape(text)
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+def render_email_text(summary: str, papers: list[dict]):
+    """纯文本备选正文，供不显示 HTML 的邮件客户端使用。"""
+    if not papers:
+        return "No Papers Today. Take a Rest!"
+    parts = [_html_to_text(summary), ""] if summary else []
+    for i, p in enumerate(papers):
+        parts.append(f"{i + 1}. {p['title']}")
+        parts.append(f"   Relevance: {p['relevance_score']}  arXiv ID: {p['arXiv_id']}")
+        parts.append(f"   TLDR: {p['summary']}")
+        parts.append(f"   PDF: {p['pdf_url']}")
+        for d in p.get("duplicates", ()):
+            parts.append(f"   Similar: {d['title']} ({d['arXiv_id']}) {d['pdf_url']}")
+        parts.append("")
+    return "\n".join(parts)
@@ -0,0 +1,254 @@
+"""
+Run the recommender as a resident daemon instead of a cron job.
+
+The process stays up between runs, so the model clients, the score cache,
+the HTTP sessions and (through Ollama's keep_alive) the local model weights
+stay warm. Runs are aligned with arXiv's announcement schedule: new listings
+appear at 20:00 America/New_York, Sunday to Thursday. A few minutes before
+each announcement the model is warmed up, then the listing of every category
+is polled with a conditional GET for a one-page listing, and the run starts
+as soon as the newest arXiv id changes.
+
+Each run is keyed on the newest ids it was started for: the run id, and so
+the journal, include them, and the listing is fetched again instead of being
+taken from the fetcher's per-day cache. A catch-up run at startup and the
+announcement of the same evening are therefore two separate runs. The newest
+id of a category is stored in a small state file only after a run has
+actually scored a listing that contains it, so a restarted daemon neither
+misses a day nor sends the same one twice. Categories that are still pending
+after a run (arXiv served the old listing, or the run failed) are polled
+again, with a backoff after failures, until the poll window is over.
+"""
+
+import json
+import os
+import re
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+
+ANNOUNCE_TZ = "America/New_York"
+ANNOUNCE_AT = "20:00"
+ANNOUNCE_DAYS = {6, 0, 1, 2, 3}  # 周日至周四，datetime.weekday() 编号
+LISTING_URL = "https://arxiv.org/list/{category}/new?skip=0&show=25"
+
+_ABS_LINK = re.compile(r'href\s*=\s*"/abs/([^"]+)"')
+_VERSION = re.compile(r"v\d+$")
+
+
+def listing_used(papers: dict, listing: dict):
+    """
+    返回 papers（{category: [paper, ...]}）中包含 listing 里最新 id 的类别。
+    列表页刚更新时抓到的可能仍是旧列表，这些类别不应记为已处理。
+    """
+    used = set()
+    for category, newest in listing.items():
+        ids = {_VERSION.sub("", paper["arXiv_id"]) for paper in papers.get(category, [])}
+        if _VERSION.sub("", newest) in ids:
+            used.add(category)
+    return used
+
+
+def next_announcement(now: datetime = None, at: str = ANNOUNCE_AT, tz: str = ANNOUNCE_TZ, days=ANNOUNCE_DAYS):
+    """返回 now 之后下一次公告的时间（带时区）。"""
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+    try:
+        zone = ZoneInfo(tz)
+    except ZoneInfoNotFoundError:
+        raise ValueError(f"Unknown time zone {tz}; on systems without tz database install tzdata.")
+    now = (now or datetime.now(timezone.utc)).astimezone(zone)
+    hour, minute = (int(x) for x in at.split(":"))
+    for offset in range(8):
+        slot = (now + timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if slot > now and slot.weekday() in days:
+            return slot
+    raise ValueError("No announcement day configured.")
+
+
+class ListingPoller:
+    """
+    以条件 GET 轮询各类别的最新列表页，只解析第一个论文链接。
+    服务器返回 304 时不传输页面内容。
+    """
+
+    def __init__(self, categories: list[str], url: str = LISTING_URL, timeout: float = 30):
+        self.categories = categories
+        self.url = url
+        self.timeout = timeout
+        self.validators = {}  # category -> (ETag, Last-Modified)
+        self.newest = {}  # category -> 最近一次看到的最新 arXiv id
+        self.session = None
+
+    def latest(self, category: str):
+        """返回该类别列表页上最新的 arXiv id，请求失败时返回上一次的结果。"""
+        if self.session is None:
+            import requests
+
+            self.session = requests.Session()
+        etag, modified = self.validators.get(category, (None, None))
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        try:
+            response = self.session.get(self.url.format(category=category), headers=headers, timeout=self.timeout)
+        except Exception as e:
+            print(f"Failed to poll the listing of {category}: {e}")
+            return self.newest.get(category)
+        if response.status_code == 304:
+            return self.newest.get(category)
+        if response.status_code != 200:
+            print(f"Polling the listing of {category} returned HTTP {response.status_code}.")
+            return self.newest.get(category)
+        self.validators[category] = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        match = _ABS_LINK.search(response.text)
+        if match:
+            self.newest[category] = match.group(1)
+        return self.newest.get(category)
+
+    def changed(self, seen: dict):
+        """返回最新 id 与 seen 不同的类别 {category: newest_id}。"""
+        changed = {}
+        for category in self.categories:
+            newest = self.latest(category)
+            if newest is not None and newest != seen.get(category):
+                changed[category] = newest
+        return changed
+
+
+class Daemon:
+    def __init__(
+        self,
+        run_once,
+        poller: ListingPoller,
+        models=(),
+        announce_at: str = ANNOUNCE_AT,
+        tz: str = ANNOUNCE_TZ,
+        days=ANNOUNCE_DAYS,
+        warm_ahead: float = 300,
+        poll_interval: float = 120,
+        poll_window: float = 3 * 3600,
+        max_backoff: float = 1800,
+        state_path: str = None,
+        stop_event: threading.Event = None,
+    ):
+        """
+        run_once: 函数 (listing) -> 实际处理了的类别集合，为 listing 中的类别执行一次完整的
+            抓取、评分与发送；listing 为有新列表的 {category: 最新 arXiv id}
+        models: 公告前 warm_ahead 秒预热的模型，调用其 warm()（没有时调用 ping()）
+        poll_interval: 公告时间之后轮询列表页的间隔（秒）
+        poll_window: 公告时间之后最多轮询多久，超过则认为当天没有新列表（如节假日）
+        max_backoff: 运行失败后重试间隔的上限（秒），间隔从 poll_interval 开始翻倍
+        state_path: 保存各类别已处理的最新 id 的 JSON 文件
+        """
+        self.run_once = run_once
+        self.poller = poller
+        self.models = list(models)
+        self.announce_at = announce_at
+        self.tz = tz
+        self.days = days
+        self.warm_ahead = warm_ahead
+        self.poll_interval = poll_interval
+        self.poll_window = poll_window
+        self.max_backoff = max_backoff
+        self.state_path = state_path
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.seen = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.seen = json.load(f)
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.seen, f)
+        os.replace(tmp_path, self.state_path)
+
+    def sleep_until(self, when: datetime):
+        """睡到 when，被 stop_event 打断时返回 False。分段等待，避免系统休眠后时间漂移。"""
+        while True:
+            seconds = (when - datetime.now(timezone.utc)).total_seconds()
+            if seconds <= 0:
+                return True
+            if self.stop_event.wait(min(seconds, 300)):
+                return False
+
+    def warm(self):
+        for model in self.models:
+            try:
+                warm = getattr(model, "warm", None) or model.ping
+                warm()
+                print(f"Model {getattr(model, 'model_name', '')} warmed up.")
+            except Exception as e:
+                print(f"Failed to warm up the model: {e}")
+
+    def wait_for_listing(self, until: datetime):
+        """轮询到出现新列表或超过 until，返回有更新的类别。"""
+        while True:
+            changed = self.poller.changed(self.seen)
+            if changed:
+                return changed
+            if datetime.now(timezone.utc) >= until:
+                return {}
+            if self.stop_event.wait(self.poll_interval):
+                return {}
+
+    def run(self, changed: dict):
+        """
+        为 changed 中的类别运行一次。全部记为已处理时返回 True，
+        有类别抓到的仍是旧列表时返回 False，运行失败时返回 None。
+        """
+        print(f"New listings for {', '.join(sorted(changed))}, starting a run.")
+        try:
+            used = self.run_once(changed)
+        except Exception:
+            # 失败的运行不记录到状态文件，重试或 daemon 重启后会从运行日志续跑
+            traceback.print_exc()
+            return None
+        missed = sorted(set(changed) - set(used))
+        if missed:
+            print(f"The fetched listings of {', '.join(missed)} are not the new ones yet; they stay pending.")
+        self.seen.update({c: newest for c, newest in changed.items() if c in used})
+        self.save_state()
+        return not missed
+
+    def catch_up(self, changed: dict, until: datetime):
+        """运行直到 changed 中的类别都记为已处理；仍有未处理的类别时继续轮询，运行失败时退避重试，直到 until。"""
+        failures = 0
+        while changed and not self.stop_event.is_set():
+            done = self.run(changed)
+            if done:
+                return
+            failures = failures + 1 if done is None else 0
+            if datetime.now(timezone.utc) >= until:
+                print(f"Still no complete run for {', '.join(sorted(changed))} at the end of the poll window.")
+                return
+            delay = min(self.poll_interval * 2 ** failures, self.max_backoff)
+            if self.stop_event.wait(delay):
+                return
+            changed = self.wait_for_listing(until)
+
+    def serve(self):
+        # 启动时先检查一次：上次运行之后已经有新列表时立即运行
+        changed = self.poller.changed(self.seen)
+        if changed:
+            self.catch_up(changed, datetime.now(timezone.utc) + timedelta(seconds=self.poll_window))
+        while not self.stop_event.is_set():
+            slot = next_announcement(at=self.announce_at, tz=self.tz, days=self.days)
+            print(f"Next arXiv announcement at {slot.isoformat()}.")
+            if not self.sleep_until(slot - timedelta(seconds=self.warm_ahead)):
+                break
+            self.warm()
+            if not self.sleep_until(slot):
+                break
+            until = slot + timedelta(seconds=self.poll_window)
+            changed = self.wait_for_listing(until)
+            if changed:
+                self.catch_up(changed, until)
+            elif not self.stop_event.is_set():
+                print("No new listing after the announcement time, skipping this one.")
@@ -0,0 +1,108 @@
+"""
+Near-duplicate detection for papers with MinHash and LSH.
+
+Resubmissions under a new id, companion papers and cross-listed variants
+share most of their abstract. Each paper is reduced to the MinHash signature
+of its title-plus-abstract word shingles; the signature is split into bands
+and papers that agree on a whole band are candidates, which are then checked
+against the estimated Jaccard similarity. Lookups cost a few dict probes, so
+every candidate can be checked against everything scored before (bounded by
+max_size) without pairwise comparisons.
+"""
+
+import hashlib
+import random
+import re
+import threading
+from collections import OrderedDict
+
+_WORD = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+
+
+def shingles(text: str, k: int = 3):
+    """小写词的 k-gram 集合，每个 shingle 用 64 位哈希表示。"""
+    words = _WORD.findall(text.lower())
+    grams = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))} if words else set()
+    return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams}
+
+
+class NearDuplicateIndex:
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        min_shingles: int = 10,
+        max_size: int = 20000,
+        seed: int = 1,
+    ):
+        """
+        threshold: 估计的 Jaccard 相似度达到该值才视为近重复
+        num_perm / bands: 签名长度与 LSH 分段数，每段 num_perm // bands 行；
+            默认 16 段 x 4 行，相似度约 0.5 以上的论文即成为候选，再按 threshold 精确过滤
+        min_shingles: shingle 太少（如缺少摘要）的论文不参与去重
+        max_size: 索引最多保存的论文数，超出时淘汰最早加入的
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands.")
+        rng = random.Random(seed)
+        self.perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_shingles = min_shingles
+        self.max_size = max_size
+        self.signatures = OrderedDict()  # key -> signature
+        self.buckets = {}  # (band, band 值) -> {key}
+        self.lock = threading.Lock()
+
+    def signature(self, paper: dict):
+        """论文的 MinHash 签名；内容太短时返回 None。"""
+        hashes = shingles(f"{paper.get('title', '')} {paper.get('abstract', '')}")
+        if len(hashes) < self.min_shingles:
+            return None
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.perms)
+
+    def _bands(self, signature):
+        for i in range(self.bands):
+            yield i, signature[i * self.rows:(i + 1) * self.rows]
+
+    @staticmethod
+    def similarity(a, b):
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def query(self, signature, exclude=None):
+        """返回与 signature 最相似且达到阈值的 (key, similarity)，没有时返回 None。"""
+        if signature is None:
+            return None
+        with self.lock:
+            candidates = set()
+            for band in self._bands(signature):
+                candidates |= self.buckets.get(band, set())
+            candidates.discard(exclude)
+            best = None
+            for key in candidates:
+                score = self.similarity(signature, self.signatures[key])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        return best
+
+    def add(self, key: str, signature):
+        if signature is None:
+            return
+        with self.lock:
+            if key in self.signatures:
+                self.signatures.move_to_end(key)
+                return
+            self.signatures[key] = signature
+            for band in self._bands(signature):
+                self.buckets.setdefault(band, set()).add(key)
+            while len(self.signatures) > self.max_size:
+                old_key, old_signature = self.signatures.popitem(last=False)
+                for band in self._bands(old_signature):
+                    bucket = self.buckets.get(band)
+                    if bucket is not None:
+                        bucket.discard(old_key)
+                        if not bucket:
+                            del self.buckets[band]
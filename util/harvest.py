@@ -0,0 +1,275 @@
+"""
+Harvest arXiv metadata through OAI-PMH or the Atom query API.
+
+Unlike the HTML listing pages, both interfaces take a date range and are
+paged (OAI-PMH resumption tokens, Atom start/max_results), so large archives
+are fetched in bounded chunks. Neither range is the announcement date of the
+listing pages, though:
+
+- OAI-PMH from/until select records by datestamp, the date the record was
+  last modified. A new version or a metadata fix moves an old paper into the
+  range, and a paper announced in the range but revised later has left it.
+- Atom submittedDate is the submission date of the first version, usually a
+  day or more before the announcement, and later versions do not count.
+
+A backfill therefore returns roughly, not exactly, what the listing showed
+on those days; the dedup index and the score cache absorb the overlap
+between consecutive days. The XML
+is parsed incrementally with iterparse while it streams in and every record
+is dropped from the tree once it has been converted, so a response never
+sits in memory as a whole document. Papers come out in the same dict shape
+as util.request.parse_arxiv_listing().
+
+The base URLs are configurable, so the harvester can be pointed at a local
+fixture server (see test/test_harvest.py).
+"""
+
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from util import profiler
+from util.request import ArxivFetcher
+
+OAI_BASE_URL = "https://oaipmh.arxiv.org/oai"
+ATOM_BASE_URL = "https://export.arxiv.org/api/query"
+
+OAI_NS = "{http://www.openarchives.org/OAI/2.0/}"
+ARXIV_NS = "{http://arxiv.org/OAI/arXiv/}"
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+ARXIV_ATOM_NS = "{http://arxiv.org/schemas/atom}"
+
+# OAI-PMH 中属于 physics 分组的 archive，set 名为 physics:<archive>
+PHYSICS_ARCHIVES = {
+    "astro-ph", "cond-mat", "gr-qc", "hep-ex", "hep-lat", "hep-ph", "hep-th",
+    "math-ph", "nlin", "nucl-ex", "nucl-th", "physics", "quant-ph",
+}
+
+_VERSION = re.compile(r"v\d+$")
+
+
+def _clean(text):
+    return " ".join((text or "").split())
+
+
+def make_paper(arxiv_id: str, title: str, abstract: str, comments: str = None):
+    """构造与列表页解析结果相同结构的论文 dict。"""
+    arxiv_id = _VERSION.sub("", arxiv_id)
+    return {
+        "title": _clean(title) or "No title available",
+        "arXiv_id": arxiv_id,
+        "abstract": _clean(abstract) or "No abstract available",
+        "comments": _clean(comments) or "No comments available",
+        "pdf_url": f"https://arxiv.org/pdf/{arxiv_id}",
+        "abstract_url": f"https://arxiv.org/abs/{arxiv_id}",
+    }
+
+
+def oai_set(category: str):
+    """类别到 OAI-PMH set：cs.CV -> cs，hep-th -> physics:hep-th。"""
+    archive = category.split(".")[0]
+    return f"physics:{archive}" if archive in PHYSICS_ARCHIVES else archive
+
+
+def _get(session, url: str, params: dict, timeout: float, max_retries: int = 5):
+    """流式 GET；遇到 503 按 Retry-After 等待后重试。"""
+    for _ in range(max_retries):
+        with profiler.span("http", cat="fetch", url=url):
+            response = session.get(url, params=params, stream=True, timeout=timeout)
+        if response.status_code == 503:
+            retry_after = response.headers.get("Retry-After", "10")
+            response.close()
+            time.sleep(int(retry_after) if retry_after.isdigit() else 10)
+            continue
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response
+    raise RuntimeError(f"{url} is still unavailable after {max_retries} attempts.")
+
+
+def _iterparse(stream, container_tag: str, item_tag: str):
+    """
+    增量解析 XML，逐个 yield item_tag 元素；处理完的元素从父节点移除，内存只保留当前记录。
+    解析结束后 yield (None, root)，供调用方读取 resumptionToken 等尾部信息。
+    """
+    container = None
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            if elem.tag == container_tag:
+                container = elem
+            continue
+        if elem.tag == item_tag:
+            yield elem, None
+            if container is not None:
+                container.remove(elem)
+            else:
+                elem.clear()
+    yield None, root
+
+
+def iter_oai_papers(
+    category: str,
+    from_date: str,
+    until_date: str,
+    base_url: str = OAI_BASE_URL,
+    session=None,
+    timeout: float = 60,
+):
+    """
+    通过 OAI-PMH ListRecords（metadataPrefix=arXiv）逐篇 yield datestamp（最后修改日期，
+    不是公布日期）在 [from_date, until_date] 内的论文。
+    category 为完整 archive（如 "cs"）时返回整个 archive，否则按记录的 categories 过滤。
+    """
+    if session is None:
+        import requests
+
+        session = requests.Session()
+    exact = None if category == oai_set(category).split(":")[-1] else category
+    params = {
+        "verb": "ListRecords",
+        "metadataPrefix": "arXiv",
+        "set": oai_set(category),
+        "from": from_date,
+        "until": until_date,
+    }
+    while params:
+        response = _get(session, base_url, params, timeout)
+        token = None
+        with response:
+            for record, root in _iterparse(response.raw, f"{OAI_NS}ListRecords", f"{OAI_NS}record"):
+                if record is None:
+                    token = root.find(f".//{OAI_NS}resumptionToken")
+                    error = root.find(f"{OAI_NS}error")
+                    if error is not None and error.get("code") != "noRecordsMatch":
+                        raise RuntimeError(f"OAI-PMH error {error.get('code')}: {error.text}")
+                    break
+                header = record.find(f"{OAI_NS}header")
+                if header is not None and header.get("status") == "deleted":
+                    continue
+                meta = record.find(f"{OAI_NS}metadata/{ARXIV_NS}arXiv")
+                if meta is None:
+                    continue
+                if exact is not None and exact not in meta.findtext(f"{ARXIV_NS}categories", "").split():
+                    continue
+                yield make_paper(
+                    meta.findtext(f"{ARXIV_NS}id", ""),
+                    meta.findtext(f"{ARXIV_NS}title"),
+                    meta.findtext(f"{ARXIV_NS}abstract"),
+                    meta.findtext(f"{ARXIV_NS}comments"),
+                )
+        # 有 resumptionToken 时只带 verb 和 token 请求下一批
+        if token is not None and (token.text or "").strip():
+            params = {"verb": "ListRecords", "resumptionToken": token.text.strip()}
+        else:
+            params = None
+
+
+def iter_atom_papers(
+    category: str,
+    from_date: str,
+    until_date: str,
+    base_url: str = ATOM_BASE_URL,
+    page_size: int = 500,
+    session=None,
+    timeout: float = 60,
+    page_sleep: float = 3,
+):
+    """通过 Atom 查询 API 逐页 yield 首个版本在 [from_date, until_date] 内提交的论文（不是公布日期）。"""
+    if session is None:
+        import requests
+
+        session = requests.Session()
+    start = from_date.replace("-", "") + "0000"
+    end = until_date.replace("-", "") + "2359"
+    query = f"cat:{category} AND submittedDate:[{start} TO {end}]"
+    offset = 0
+    while True:
+        params = {
+            "search_query": query,
+            "start": offset,
+            "max_results": page_size,
+            "sortBy": "submittedDate",
+            "sortOrder": "ascending",
+        }
+        response = _get(session, base_url, params, timeout)
+        count = 0
+        with response:
+            for entry, _ in _iterparse(response.raw, f"{ATOM_NS}feed", f"{ATOM_NS}entry"):
+                if entry is None:
+                    break
+                count += 1
+                yield make_paper(
+                    entry.findtext(f"{ATOM_NS}id", "").rsplit("/abs/", 1)[-1],
+                    entry.findtext(f"{ATOM_NS}title"),
+                    entry.findtext(f"{ATOM_NS}summary"),
+                    entry.findtext(f"{ARXIV_ATOM_NS}comment"),
+                )
+        if count < page_size:
+            break
+        offset += page_size
+        time.sleep(page_sleep)  # API 使用约定：连续请求间隔 3 秒
+
+
+class HarvestFetcher(ArxivFetcher):
+    """
+    用 OAI-PMH 或 Atom API 代替列表页抓取的 ArxivFetcher，可注入 ArxivDaily(fetcher=...)。
+    默认抓取前一天（UTC）的记录；给出 from_date/until_date（YYYY-MM-DD）时可回填任意日期区间，
+    日期的含义见模块说明（OAI 为修改日期，Atom 为首次提交日期），与列表页的公布日期并不一致。
+    """
+
+    def __init__(
+        self,
+        backend: str = "oai",
+        from_date: str = None,
+        until_date: str = None,
+        base_url: str = None,
+        min_sleep: int = 3,
+        max_sleep: int = 5,
+        timeout: float = 60,
+    ):
+        if backend not in ("oai", "atom"):
+            raise ValueError(f"Unsupported harvest backend: {backend}")
+        super().__init__(min_sleep, max_sleep, fetch_fn=self.fetch_papers)
+        yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d")
+        self.backend = backend
+        self.from_date = from_date or yesterday
+        self.until_date = until_date or self.from_date
+        self.base_url = base_url or (OAI_BASE_URL if backend == "oai" else ATOM_BASE_URL)
+        self.timeout = timeout
+        self.session = None
+
+    def harvest(self, category: str, page_size: int = 500):
+        if self.session is None:
+            import requests
+
+            self.session = requests.Session()
+        if self.backend == "oai":
+            return iter_oai_papers(
+                category, self.from_date, self.until_date, self.base_url, self.session, self.timeout
+            )
+        return iter_atom_papers(
+            category,
+            self.from_date,
+            self.until_date,
+            self.base_url,
+            page_size,
+            self.session,
+            self.timeout,
+            page_sleep=self.min_sleep,
+        )
+
+    def fetch_papers(self, category: str, max_entries: int):
+        return list(islice(self.harvest(category, min(max_entries, 500)), max_entries))
+
+    def iter_papers(self, categories: list[str], page_size: int = 500, cancel_event=None):
+        for category in categories:
+            for paper in self.harvest(category, page_size):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield paper
+            print(f"Papers on arXiv for {category} from {self.from_date} to {self.until_date} are harvested.")
@@ -0,0 +1,160 @@
+"""
+Compile the research description into a compact interest profile.
+
+description.txt holds the user's own prompt and a multi-paragraph analysis of
+their Zotero library, easily 1-2K tokens. Embedding it in every per-paper
+prompt repeats that context thousands of times a day, so it is compiled once
+per description into a token-budgeted profile: positive topics, keywords and
+topics to avoid for each section, weighted like compute_user_prompt_weight()
+weights the sections. Sections that already fit their share of the budget
+(typically the user's short prompt) are kept verbatim.
+
+Compiled profiles are cached by the hash of the description and the budget,
+in memory and optionally as cache_dir/<hash>.json, so the compiler runs again
+only when the description changes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from util.tokens import estimate_tokens, truncate_tokens
+
+COMPILE_PROMPT = """
+你需要把一段研究兴趣描述压缩成紧凑的兴趣画像，供后续逐篇判断 arXiv 论文的相关性。
+描述如下：
+{text}
+
+请按以下 JSON 格式回答，不超过 {budget} 个 token：
+{{
+    "topics": [<最能代表该兴趣的研究主题，短语，按重要性排序，最多 8 个>],
+    "keywords": [<具体的方法、模型、任务或术语，优先保留英文原名，按重要性排序，最多 20 个>],
+    "negative": [<描述中明确表示不感兴趣的主题，没有则为空列表>]
+}}
+直接返回上述 JSON 格式，无需任何额外解释。
+"""
+
+
+def profile_hash(description: str, max_tokens: int):
+    return hashlib.sha256(f"{max_tokens}\n{description}".encode("utf-8")).hexdigest()
+
+
+def _render_section(section: dict):
+    if "text" in section:
+        return f"- {section['name']}（权重 {section['weight']:.1f}）：{section['text']}"
+    lines = [f"- {section['name']}（权重 {section['weight']:.1f}）："]
+    if section.get("topics"):
+        lines.append(f"  主题：{'；'.join(section['topics'])}")
+    if section.get("keywords"):
+        lines.append(f"  关键词：{', '.join(section['keywords'])}")
+    return "\n".join(lines)
+
+
+def render_profile(profile: dict, max_tokens: int):
+    """把画像渲染为提示词文本；超出预算时先删关键词、再删主题，都从最不重要的一项删起。"""
+    sections = [
+        dict(s, topics=list(s.get("topics", [])), keywords=list(s.get("keywords", [])))
+        for s in profile["sections"]
+    ]
+    negative = list(profile.get("negative", []))
+
+    def render():
+        lines = ["研究兴趣画像（权重越高越重要）："]
+        lines += [_render_section(s) for s in sections]
+        if negative:
+            lines.append(f"- 不感兴趣：{'；'.join(negative)}")
+        return "\n".join(lines)
+
+    text = render()
+    for field in ("keywords", "topics"):
+        while estimate_tokens(text) > max_tokens:
+            longest = max(sections, key=lambda s: len(s[field]))
+            if not longest[field]:
+                break
+            longest[field].pop()
+            text = render()
+    return text
+
+
+def compile_profile(model, sections: list[tuple], max_tokens: int = 300, temperature: float = 0.2):
+    """
+    sections: [(名称, 文本, 权重)]，权重为 0 或文本为空的部分被跳过
+    返回画像 dict：{"sections": [...], "negative": [...]}
+    """
+    profile = {"sections": [], "negative": []}
+    for name, text, weight in sections:
+        text = text.strip()
+        if not text or weight <= 0:
+            continue
+        budget = max(40, int(max_tokens * weight))
+        if estimate_tokens(text) <= budget:
+            profile["sections"].append({"name": name, "weight": weight, "text": text})
+            continue
+        try:
+            response = model.inference(COMPILE_PROMPT.format(text=text, budget=budget), temperature=temperature)
+            response = json.loads(response.strip().strip("```").strip("json"))
+            profile["sections"].append(
+                {
+                    "name": name,
+                    "weight": weight,
+                    "topics": list(dict.fromkeys(str(t) for t in response.get("topics", []))),
+                    "keywords": list(dict.fromkeys(str(k) for k in response.get("keywords", []))),
+                }
+            )
+            profile["negative"] += [str(n) for n in response.get("negative", [])]
+        except Exception as e:
+            # 编译失败时退回截断后的原文，不影响评分
+            print(f"Failed to compile the interest profile for {name}: {e}")
+            profile["sections"].append(
+                {"name": name, "weight": weight, "text": truncate_tokens(text, budget)}
+            )
+            profile["fallback"] = True
+    return profile
+
+
+class InterestProfiles:
+    """按描述哈希缓存编译好的兴趣画像文本。"""
+
+    def __init__(self, cache_dir: str = None, max_tokens: int = 300):
+        """
+        cache_dir: 可选，编译结果保存为 cache_dir/<hash>.json，跨进程复用
+        max_tokens: 画像的 token 预算
+        """
+        self.cache_dir = cache_dir
+        self.max_tokens = max_tokens
+        self.texts = {}  # hash -> 画像文本
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, model, description: str, sections: list[tuple], temperature: float = 0.2):
+        """返回描述对应的画像文本；描述本身不超过预算时直接返回原文。"""
+        if estimate_tokens(description) <= self.max_tokens:
+            return description
+        key = profile_hash(description, self.max_tokens)
+        # 整个编译过程持锁，同一描述只编译一次
+        with self.lock:
+            if key in self.texts:
+                return self.texts[key]
+            path = os.path.join(self.cache_dir, f"{key}.json") if self.cache_dir else None
+            profile = None
+            if path and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    profile = json.load(f)
+            if profile is None:
+                profile = compile_profile(model, sections, self.max_tokens, temperature)
+                # 退回原文的结果不落盘，下次运行重新编译
+                if path and not profile.get("fallback"):
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(profile, f, ensure_ascii=False)
+                    os.replace(tmp_path, path)
+            text = render_profile(profile, self.max_tokens)
+            if not profile.get("fallback"):
+                self.texts[key] = text
+        print(
+            f"Interest profile compiled: {estimate_tokens(text)} tokens instead of "
+            f"{estimate_tokens(description)} per paper prompt."
+        )
+        return text
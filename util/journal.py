@@ -0,0 +1,101 @@
+"""
+Append-only JSONL journal of a run, used to resume after a crash.
+
+Every line is one record:
+    {"type": "stage", "stage": "fetch", "papers": {...}}
+    {"type": "paper", "arXiv_id": "...", "result": {...}}
+    {"type": "stage", "stage": "summarize", "summary": "..."}
+    {"type": "stage", "stage": "send", "receivers": [...]}
+    {"type": "stage", "stage": "done"}
+
+A run killed halfway leaves at most one truncated line, which is ignored
+on load; resuming skips the papers and stages already recorded.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+
+class RunJournal:
+    def __init__(self, path: str, resume: bool = False):
+        """
+        path: 日志文件路径
+        resume: True 时读取已有记录并在其后追加，否则清空重新开始
+        """
+        self.path = path
+        self.papers = None  # fetch 阶段保存的 {category: [paper, ...]}
+        self.results = {}  # arXiv_id -> 评分结果，只在续跑时从已有日志读入，本次写入的结果不保留
+        self.stages = {}  # stage -> 该阶段的记录
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+            print(
+                f"Resuming run from {path}: {len(self.results)} papers done, "
+                f"stages: {', '.join(self.stages) or 'none'}."
+            )
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume and self.file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # 让新记录从新的一行开始，不与截断的行拼在一起
+                    self.file.write("\n")
+
+    @staticmethod
+    def make_run_id(categories: list[str], description: str, language: str, model: str, listing: dict = None):
+        """
+        同一天、同一配置的运行使用同一个 run id，便于 --resume 找到它。
+        listing: 可选 {category: 最新 arXiv id}，daemon 按列表而不是日期区分运行，
+        同一天先补跑旧列表、再处理新公告时不会续跑到上一次的日志
+        """
+        parts = [sorted(categories), description, language, model]
+        if listing:
+            parts.append(sorted(listing.items()))
+        fingerprint = json.dumps(parts, ensure_ascii=False)
+        digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:12]
+        return f"{datetime.now().strftime('%Y-%m-%d')}_{digest}"
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程崩溃时写了一半的最后一行
+                    continue
+                self._apply(record)
+
+    def _apply(self, record: dict):
+        if record["type"] == "paper":
+            self.results[record["arXiv_id"]] = record["result"]
+        elif record["type"] == "stage":
+            self.stages[record["stage"]] = record
+            if record["stage"] == "fetch":
+                self.papers = record["papers"]
+
+    def _append(self, record: dict, sync: bool = False):
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+            # 本次运行的评分结果只写入文件：整库模式下结果数随 archive 增长，不能常驻内存
+            if record["type"] == "stage":
+                self._apply(record)
+
+    def record_paper(self, result: dict):
+        self._append({"type": "paper", "arXiv_id": result["arXiv_id"], "result": result})
+
+    def checkpoint(self, stage: str, **data):
+        self._append({"type": "stage", "stage": stage, **data}, sync=True)
+
+    def has(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def close(self):
+        with self.lock:
+            self.file.close()
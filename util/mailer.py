@@ -0,0 +1,234 @@
+"""
+Mail delivery: a reused SMTP session, TLS mode chosen from the port,
+per-recipient messages and an on-disk outbox for failed sends.
+
+Messages that cannot be delivered are written to the outbox directory and
+retried by flush_outbox(), so a transient SMTP failure does not require
+rerunning the (expensive) recommendation pipeline.
+"""
+
+import datetime
+import glob
+import json
+import os
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr, parseaddr
+
+from loguru import logger
+
+from util import profiler
+
+# 隐式 TLS（SMTPS）端口，其余端口使用 STARTTLS
+SSL_PORTS = (465,)
+
+
+def _format_addr(s):
+    name, addr = parseaddr(s)
+    return formataddr((Header(name, "utf-8").encode(), addr))
+
+
+class Mailer:
+    def __init__(
+        self,
+        sender: str,
+        password: str,
+        smtp_server: str,
+        smtp_port: int,
+        title: str = "Daily arXiv",
+        outbox_dir: str = None,
+        timeout: float = 30,
+        max_attempts: int = 10,
+        allow_insecure: bool = False,
+    ):
+        """
+        参数：
+            outbox_dir: 发送失败的邮件写入该目录，之后由 flush_outbox() 重试；为 None 时不落盘
+            timeout: SMTP 连接与命令超时（秒）
+            max_attempts: 单封邮件在 outbox 中的最大重试次数，超过后移入 outbox_dir/failed
+            allow_insecure: 服务器不支持 STARTTLS 时仍以明文登录和发送；默认拒绝，避免明文发送密码
+        """
+        self.sender = sender
+        self.password = password
+        self.smtp_server = smtp_server
+        self.smtp_port = int(smtp_port) if smtp_port is not None else None
+        self.title = title
+        self.outbox_dir = outbox_dir
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.allow_insecure = allow_insecure
+        self.server = None
+        self.lock = threading.RLock()
+        if outbox_dir:
+            os.makedirs(outbox_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        if self.smtp_port in SSL_PORTS:
+            server = smtplib.SMTP_SSL(
+                self.smtp_server,
+                self.smtp_port,
+                timeout=self.timeout,
+                context=ssl.create_default_context(),
+            )
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            server.ehlo()
+            if server.has_extn("starttls"):
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            elif self.allow_insecure:
+                logger.warning(f"{self.smtp_server}:{self.smtp_port} does not support STARTTLS, sending in cleartext.")
+            else:
+                server.close()
+                raise smtplib.SMTPNotSupportedError(
+                    f"{self.smtp_server}:{self.smtp_port} does not support STARTTLS; refusing to log in "
+                    "without TLS. Use an SMTPS port (465) or allow insecure SMTP explicitly."
+                )
+        if self.password:
+            server.login(self.sender, self.password)
+        return server
+
+    def _session(self):
+        """返回可用的 SMTP 会话，复用已有连接，断开时重连。"""
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] == 250:
+                    return self.server
+            except OSError:  # 包括 SMTPException
+                pass
+            self._drop()
+        self.server = self._connect()
+        return self.server
+
+    def _drop(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+    def close(self):
+        with self.lock:
+            self._drop()
+
+    def build_message(self, html: str, receiver: str, text: str = None, subject: str = None):
+        """
+        构造发给单个收件人的邮件；给出 text 时附带纯文本备选正文。
+        """
+        if text is not None:
+            msg = MIMEMultipart("alternative")
+            msg.attach(MIMEText(text, "plain", "utf-8"))
+            msg.attach(MIMEText(html, "html", "utf-8"))
+        else:
+            msg = MIMEText(html, "html", "utf-8")
+        msg["From"] = _format_addr(f"{self.title} <%s>" % self.sender)
+        msg["To"] = _format_addr("You <%s>" % receiver)
+        if subject is None:
+            today = datetime.datetime.now().strftime("%Y/%m/%d")
+            subject = f"{self.title} {today}"
+        msg["Subject"] = Header(subject, "utf-8").encode()
+        return msg
+
+    def send_raw(self, message: str, receivers: list[str]):
+        """在复用的会话上发送已序列化的邮件，连接失效时重连重试一次。"""
+        with self.lock, profiler.span("smtp", cat="send", receivers=len(receivers)):
+            try:
+                self._session().sendmail(self.sender, receivers, message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                self._drop()
+                self._session().sendmail(self.sender, receivers, message)
+
+    def send(self, html: str, receivers: list[str], personalize=None, text=None):
+        """
+        给每个收件人单独发送一封邮件，共用同一个 SMTP 会话。
+        personalize: 可选函数 (receiver, html) -> html，用于生成个性化正文
+        text: 可选纯文本备选正文，或函数 (receiver) -> text
+        返回发送失败（已写入 outbox）的收件人列表。
+        """
+        failed = []
+        for receiver in receivers:
+            body = personalize(receiver, html) if personalize is not None else html
+            alt = text(receiver) if callable(text) else text
+            message = self.build_message(body, receiver, alt).as_string()
+            try:
+                self.send_raw(message, [receiver])
+                print(f"Email sent to {receiver}.")
+            except Exception as e:
+                logger.warning(f"Failed to send email to {receiver}: {e}")
+                failed.append(receiver)
+                self.spool(message, [receiver], str(e))
+        return failed
+
+    def spool(self, message: str, receivers: list[str], error: str = ""):
+        if not self.outbox_dir:
+            return None
+        entry = {
+            "sender": self.sender,
+            "receivers": receivers,
+            "message": message,
+            "attempts": 1,
+            "last_error": error,
+            "created_at": time.time(),
+        }
+        path = os.path.join(self.outbox_dir, f"{uuid.uuid4().hex}.json")
+        self._write_entry(path, entry)
+        logger.info(f"Email to {', '.join(receivers)} spooled to {path}.")
+        return path
+
+    @staticmethod
+    def _write_entry(path: str, entry: dict):
+        # 先写临时文件再重命名，避免进程崩溃时留下半个文件
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def flush_outbox(self):
+        """
+        重试 outbox 中的邮件。成功的删除，失败的累加重试次数，超过 max_attempts 的移入 failed 子目录。
+        返回 (sent, remaining)。
+        """
+        if not self.outbox_dir:
+            return 0, 0
+        sent = 0
+        remaining = 0
+        for path in sorted(glob.glob(os.path.join(self.outbox_dir, "*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skip broken outbox entry {path}: {e}")
+                continue
+            try:
+                self.send_raw(entry["message"], entry["receivers"])
+                os.remove(path)
+                sent += 1
+            except Exception as e:
+                entry["attempts"] += 1
+                entry["last_error"] = str(e)
+                if entry["attempts"] >= self.max_attempts:
+                    failed_dir = os.path.join(self.outbox_dir, "failed")
+                    os.makedirs(failed_dir, exist_ok=True)
+                    self._write_entry(os.path.join(failed_dir, os.path.basename(path)), entry)
+                    os.remove(path)
+                    logger.warning(f"Giving up on {path} after {entry['attempts']} attempts: {e}")
+                else:
+                    self._write_entry(path, entry)
+                    remaining += 1
+        if sent or remaining:
+            print(f"Outbox flushed: {sent} sent, {remaining} remaining.")
+        return sent, remaining
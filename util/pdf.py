@@ -0,0 +1,187 @@
+"""
+Download and extract the full text of top-ranked papers.
+
+PDFs are fetched by a small thread pool of their own, so downloads never take
+a slot from the LLM workers, and text extraction (CPU-bound) runs in a process
+pool. Both are capped: downloads stop at max_bytes and only the first
+max_pages plus the last tail_pages pages are read, which is where the
+introduction and the conclusion are.
+
+The cache is content-addressed: cache_dir/pdf/<sha256>.pdf holds the bytes,
+cache_dir/url/<sha256(url)> maps a URL to its content hash and
+cache_dir/text/<sha256>.p<max_pages>-<tail_pages>.txt holds the extracted text, so a PDF
+reached through different URLs (e.g. with and without a version suffix) is
+stored and extracted once.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from util import profiler
+
+_INTRO = re.compile(r"^\s*(?:\d+\.?|[IVX]+\.?)?\s*Introduction\s*$", re.I | re.M)
+_CONCLUSION = re.compile(
+    r"^\s*(?:\d+\.?|[IVX]+\.?)?\s*(?:Conclusions?|Concluding Remarks|Discussion)\b.*$", re.I | re.M
+)
+_HEADING = re.compile(r"^\s*(?:\d+|[IVX]+)\.?\s+[A-Z][^\n]{0,60}$", re.M)
+_REFERENCES = re.compile(r"^\s*(?:References|Bibliography)\s*$", re.I | re.M)
+
+
+def extract_text(pdf_path: str, max_pages: int = 6, tail_pages: int = 3):
+    """读取 PDF 前 max_pages 页与最后 tail_pages 页的文本。在进程池中运行。"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    total = len(reader.pages)
+    pages = list(range(min(max_pages, total)))
+    pages += [i for i in range(max(0, total - tail_pages), total) if i not in pages]
+    return "\n".join(reader.pages[i].extract_text() or "" for i in pages)
+
+
+def extract_sections(text: str, max_chars: int = 4000):
+    """从全文中截取引言与结论，各自最多 max_chars 字符；找不到时返回空字符串。"""
+    intro = ""
+    match = _INTRO.search(text)
+    if match:
+        # 引言到下一个编号标题为止
+        end = _HEADING.search(text, match.end())
+        intro = text[match.end():end.start() if end else None][:max_chars].strip()
+    conclusion = ""
+    matches = list(_CONCLUSION.finditer(text))
+    if matches:
+        start = matches[-1].end()
+        end = _REFERENCES.search(text, start)
+        conclusion = text[start:end.start() if end else None][:max_chars].strip()
+    return intro, conclusion
+
+
+def _sha256(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+
+class PdfFetcher:
+    def __init__(
+        self,
+        cache_dir: str = "pdf_cache",
+        num_downloads: int = 4,
+        num_processes: int = 2,
+        max_pages: int = 6,
+        tail_pages: int = 3,
+        max_bytes: int = 20 * 1024 * 1024,
+        timeout: float = 60,
+    ):
+        """
+        num_downloads: 同时下载的 PDF 数
+        num_processes: 文本提取进程数
+        max_pages / tail_pages: 只读取前 max_pages 页和最后 tail_pages 页
+        max_bytes: 单个 PDF 的大小上限，超过则放弃
+        timeout: 单次下载的超时（秒）
+        """
+        self.cache_dir = cache_dir
+        self.max_pages = max_pages
+        self.tail_pages = tail_pages
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        for sub in ("pdf", "url", "text"):
+            os.makedirs(os.path.join(cache_dir, sub), exist_ok=True)
+        self.downloads = ThreadPoolExecutor(num_downloads, thread_name_prefix="arxiv-pdf")
+        self.extractors = ProcessPoolExecutor(num_processes)
+        self.futures = {}  # pdf_url -> Future[(intro, conclusion) | None]
+        self.lock = threading.Lock()
+        self.session = None
+
+    def close(self):
+        self.downloads.shutdown(wait=False, cancel_futures=True)
+        self.extractors.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def prefetch(self, pdf_url: str):
+        """开始在后台下载并提取 pdf_url，立即返回 Future；同一 URL 只处理一次。"""
+        with self.lock:
+            if pdf_url not in self.futures:
+                self.futures[pdf_url] = self.downloads.submit(self._load, pdf_url)
+            return self.futures[pdf_url]
+
+    def get(self, pdf_url: str, timeout: float = None):
+        """返回 (intro, conclusion)，下载或提取失败时返回 None。"""
+        try:
+            return self.prefetch(pdf_url).result(timeout=timeout)
+        except Exception as e:
+            print(f"Full text of {pdf_url} is not available: {e}")
+            return None
+
+    def _load(self, pdf_url: str):
+        digest = self._cached_digest(pdf_url)
+        if digest is None:
+            with profiler.span("pdf_download", cat="full_text", url=pdf_url):
+                data = self._download(pdf_url)
+            if data is None:
+                return None
+            digest = _sha256(data)
+            pdf_path = os.path.join(self.cache_dir, "pdf", f"{digest}.pdf")
+            if not os.path.exists(pdf_path):
+                self._write(pdf_path, data)
+            self._write(self._url_path(pdf_url), digest.encode("ascii"))
+
+        text_path = os.path.join(self.cache_dir, "text", f"{digest}.p{self.max_pages}-{self.tail_pages}.txt")
+        if os.path.exists(text_path):
+            with open(text_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        else:
+            pdf_path = os.path.join(self.cache_dir, "pdf", f"{digest}.pdf")
+            with profiler.span("pdf_extract", cat="full_text", url=pdf_url):
+                text = self.extractors.submit(
+                    extract_text, pdf_path, self.max_pages, self.tail_pages
+                ).result()
+            self._write(text_path, text.encode("utf-8"))
+        return extract_sections(text)
+
+    def _url_path(self, pdf_url: str):
+        return os.path.join(self.cache_dir, "url", _sha256(pdf_url.encode("utf-8")))
+
+    def _cached_digest(self, pdf_url: str):
+        try:
+            with open(self._url_path(pdf_url), "r", encoding="ascii") as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        if os.path.exists(os.path.join(self.cache_dir, "pdf", f"{digest}.pdf")):
+            return digest
+        return None
+
+    def _download(self, pdf_url: str):
+        with self.lock:
+            if self.session is None:
+                import requests
+
+                self.session = requests.Session()
+        with self.session.get(pdf_url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length is not None and int(length) > self.max_bytes:
+                print(f"Skip {pdf_url}: {int(length)} bytes exceeds the limit.")
+                return None
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    print(f"Skip {pdf_url}: larger than {self.max_bytes} bytes.")
+                    return None
+                chunks.append(chunk)
+        return b"".join(chunks)
@@ -0,0 +1,135 @@
+"""
+Lightweight run profiling.
+
+span() records how long a block took as a Chrome trace "complete" event;
+export() writes the events as JSON that chrome://tracing and
+https://ui.perfetto.dev can open, with one track per thread, so LLM calls on
+the worker threads show up next to the fetch, summarize, render and send
+stages of the main thread. profile() additionally runs cProfile over a block
+(parsing, rendering) and dumps the accumulated stats per block name.
+
+Profiling is off by default; then span() and profile() return a shared
+no-op context manager and cost next to nothing.
+
+    from util import profiler
+    profiler.enable(cprofile_dir="profiles")
+    with profiler.span("fetch", category="cs.CV"):
+        ...
+    profiler.export("trace.json")
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+_NULL = contextlib.nullcontext()
+
+
+class Tracer:
+    def __init__(self, cprofile_dir: str = None):
+        """cprofile_dir: 给出时 profile() 运行 cProfile，并把统计结果写入该目录"""
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.threads = {}  # tid -> 线程名
+        self.cprofile_dir = cprofile_dir
+        self.profiles = {}  # 名称 -> cProfile.Profile，多次调用累加
+        self.profile_lock = threading.Lock()
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+
+    def _now(self):
+        return (time.perf_counter() - self.origin) * 1e6  # 微秒
+
+    def _record(self, event: dict):
+        thread = threading.current_thread()
+        event["pid"] = self.pid
+        event["tid"] = thread.ident
+        with self.lock:
+            self.threads.setdefault(thread.ident, thread.name)
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "stage", **args):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._record(
+                {"name": name, "cat": cat, "ph": "X", "ts": start, "dur": self._now() - start, "args": args}
+            )
+
+    def instant(self, name: str, cat: str = "event", **args):
+        self._record({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": self._now(), "args": args})
+
+    @contextlib.contextmanager
+    def profile(self, name: str):
+        # cProfile 同一时间只能有一个在运行，其他线程的同名块直接跳过
+        if not self.cprofile_dir or not self.profile_lock.acquire(blocking=False):
+            yield
+            return
+        import cProfile
+
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+        finally:
+            self.profile_lock.release()
+
+    def export(self, path: str):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.cprofile_dir, f"{name}.prof"))
+        print(f"Trace with {len(events)} events written to {path}.")
+
+
+_tracer = None
+
+
+def enable(cprofile_dir: str = None):
+    """开启全局 tracer 并返回它。"""
+    global _tracer
+    _tracer = Tracer(cprofile_dir)
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name: str, cat: str = "stage", **args):
+    if _tracer is None:
+        return _NULL
+    return _tracer.span(name, cat, **args)
+
+
+def instant(name: str, cat: str = "event", **args):
+    if _tracer is not None:
+        _tracer.instant(name, cat, **args)
+
+
+def profile(name: str):
+    if _tracer is None:
+        return _NULL
+    return _tracer.profile(name)
+
+
+def export(path: str):
+    if _tracer is not None:
+        _tracer.export(path)
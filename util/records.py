@@ -0,0 +1,106 @@
+"""
+Compact paper records for whole-archive runs.
+
+A whole archive (e.g. all of cs.*) lists thousands of papers a day. Instead of
+keeping a dict with the full abstract, comments and URLs for every paper, a run
+keeps one PaperRecord (__slots__, no per-instance dict) per paper and spills
+the abstract to a temporary file, reading it back only when the paper is sent
+to the LLM or ends up in the email. TopK keeps the running best results in a
+bounded heap, so the summaries of papers that do not make the cut are dropped
+as soon as they are pushed out.
+"""
+
+import heapq
+import itertools
+import tempfile
+import threading
+
+
+class AbstractSpill:
+    """追加写入的临时文件，保存摘要文本，按 (offset, length) 读回。关闭后文件自动删除。"""
+
+    def __init__(self, spill_dir: str = None):
+        self.file = tempfile.TemporaryFile(dir=spill_dir)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        with self.lock:
+            self.file.seek(self.size)
+            self.file.write(data)
+            offset = self.size
+            self.size += len(data)
+        return offset, len(data)
+
+    def read(self, offset: int, length: int):
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length).decode("utf-8")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PaperRecord:
+    """一篇论文的紧凑记录，摘要存放在 AbstractSpill 中。"""
+
+    __slots__ = ("arXiv_id", "title", "pdf_url", "offset", "length", "prior")
+
+    def __init__(self, arXiv_id: str, title: str, pdf_url: str, offset: int, length: int, prior: float = 0.0):
+        self.arXiv_id = arXiv_id
+        self.title = title
+        self.pdf_url = pdf_url
+        self.offset = offset
+        self.length = length
+        self.prior = prior
+
+    @classmethod
+    def from_paper(cls, paper: dict, spill: AbstractSpill, prior: float = 0.0):
+        """由抓取到的论文 dict 构造记录，摘要写入 spill，comments 等字段丢弃。"""
+        offset, length = spill.write(paper["abstract"])
+        return cls(paper["arXiv_id"], paper["title"], paper["pdf_url"], offset, length, prior)
+
+    def abstract(self, spill: AbstractSpill):
+        return spill.read(self.offset, self.length)
+
+    def to_paper(self, spill: AbstractSpill):
+        """还原为 process_paper() 所需的论文 dict。"""
+        return {
+            "title": self.title,
+            "arXiv_id": self.arXiv_id,
+            "abstract": self.abstract(spill),
+            "pdf_url": self.pdf_url,
+        }
+
+
+class TopK:
+    """按 relevance_score 保留得分最高的 k 个结果的最小堆。"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap = []
+        self.counter = itertools.count()  # 分数相同时按先到先得，避免比较 dict
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, result: dict):
+        """加入一个结果，返回被挤出的结果（没有则为 None）。"""
+        entry = (result["relevance_score"], -next(self.counter), result)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+            return None
+        if entry[:2] <= self.heap[0][:2]:
+            return result
+        return heapq.heapreplace(self.heap, entry)[2]
+
+    def sorted(self):
+        """按得分从高到低返回当前保留的结果。"""
+        return [entry[2] for entry in sorted(self.heap, key=lambda e: e[:2], reverse=True)]
@@ -2,16 +2,19 @@
 Use requests and BeautifulSoup to get yesterday's arXiv papers.
 """
 
-import requests
-from bs4 import BeautifulSoup
+import random
+import threading
+import time
+from datetime import datetime
 
+from util import profiler
 
-def get_yesterday_arxiv_papers(category: str = "cs.CV", max_results: int = 100):
-    url = f"https://arxiv.org/list/{category}/new?skip=0&show={max_results}"
 
-    response = requests.get(url)
+def parse_arxiv_listing(text: str):
+    """解析 arXiv 列表页 HTML，返回论文列表。"""
+    from bs4 import BeautifulSoup
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = BeautifulSoup(text, "html.parser")
 
     try:
         entries = soup.find_all("dl", id="articles")[0].find_all(["dt", "dd"])
@@ -56,6 +59,115 @@ def get_yesterday_arxiv_papers(category: str = "cs.CV", max_results: int = 100):
     return papers
 
 
+def get_yesterday_arxiv_papers(category: str = "cs.CV", max_results: int = 100, skip: int = 0):
+    # 延迟导入，避免拖慢启动
+    import requests
+
+    url = f"https://arxiv.org/list/{category}/new?skip={skip}&show={max_results}"
+
+    with profiler.span("http", cat="fetch", category=category, skip=skip):
+        response = requests.get(url)
+
+    with profiler.span("parse", cat="fetch", category=category), profiler.profile("parse"):
+        return parse_arxiv_listing(response.text)
+
+
+class ArxivFetcher:
+    """
+    Fetch yesterday's papers for several categories, sleeping between requests
+    to avoid being blocked. Listings are cached per day, so a long-lived
+    fetcher (web app, daemon) only hits arXiv once per category and day.
+    """
+
+    def __init__(self, min_sleep: int = 5, max_sleep: int = 15, fetch_fn=None, page_fn=None):
+        """
+        fetch_fn: 单个类别的抓取函数 (category, max_entries) -> [paper, ...]，默认抓取 arXiv 列表页
+        page_fn: 分页抓取函数 (category, page_size, skip) -> [paper, ...]，供 iter_papers() 使用
+        """
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+        self.fetch_fn = fetch_fn if fetch_fn is not None else get_yesterday_arxiv_papers
+        self.page_fn = page_fn if page_fn is not None else get_yesterday_arxiv_papers
+        self.cache = {}  # (date, category, max_entries) -> papers
+        self.lock = threading.Lock()
+
+    def fetch_category(self, category: str, max_entries: int, refresh: bool = False):
+        """返回 (papers, cached)。refresh 为 True 时忽略缓存重新抓取，并用新结果替换缓存。"""
+        key = (datetime.now().strftime("%Y-%m-%d"), category, max_entries)
+        with self.lock:
+            if key in self.cache and not refresh:
+                return self.cache[key], True
+        papers = self.fetch_fn(category, max_entries)
+        with self.lock:
+            # 只保留当天的结果
+            self.cache = {k: v for k, v in self.cache.items() if k[0] == key[0]}
+            if papers:
+                self.cache[key] = papers
+        return papers, False
+
+    def fetch(self, categories: list[str], max_entries: int, on_fetched=None, cancel_event=None, refresh: bool = False):
+        """
+        on_fetched: 可选回调 (category, papers)，每个类别抓取完成后调用
+        cancel_event: 可选 threading.Event，被 set 后停止抓取剩余类别
+        refresh: 忽略当天的缓存，如 daemon 发现列表页已更新时
+        """
+        papers = {}
+        need_sleep = False
+        for category in categories:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            key = (datetime.now().strftime("%Y-%m-%d"), category, max_entries)
+            with self.lock:
+                cached = key in self.cache and not refresh
+            if need_sleep and not cached:
+                # avoid being blocked
+                sleep_time = random.randint(self.min_sleep, self.max_sleep)
+                with profiler.span("sleep", cat="fetch", seconds=sleep_time):
+                    if cancel_event is not None:
+                        if cancel_event.wait(sleep_time):
+                            break
+                    else:
+                        time.sleep(sleep_time)
+            with profiler.span("fetch", category=category):
+                papers[category], cached = self.fetch_category(category, max_entries, refresh)
+            need_sleep = not cached
+            print(
+                "{} papers on arXiv for {} are fetched.".format(
+                    len(papers[category]), category
+                )
+            )
+            if on_fetched is not None:
+                on_fetched(category, papers[category])
+        return papers
+
+    def iter_papers(self, categories: list[str], page_size: int = 500, cancel_event=None):
+        """
+        逐页抓取各类别（或整个 archive，如 "cs"）昨天的全部论文并逐篇 yield，
+        每次只在内存中保留一页，不写入缓存。供整库模式使用。
+        """
+        need_sleep = False
+        for category in categories:
+            skip = 0
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if need_sleep:
+                    sleep_time = random.randint(self.min_sleep, self.max_sleep)
+                    with profiler.span("sleep", cat="fetch", seconds=sleep_time):
+                        if cancel_event is not None:
+                            if cancel_event.wait(sleep_time):
+                                return
+                        else:
+                            time.sleep(sleep_time)
+                page = self.page_fn(category, page_size, skip)
+                need_sleep = True
+                print(f"{len(page)} papers on arXiv for {category} are fetched (skip={skip}).")
+                yield from page
+                if len(page) < page_size:
+                    break
+                skip += page_size
+
+
 if __name__ == "__main__":
     papers = get_yesterday_arxiv_papers()
     print(len(papers))
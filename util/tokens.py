@@ -0,0 +1,29 @@
+"""
+Rough token estimates for budgeting prompts without loading a tokenizer.
+"""
+
+import re
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """CJK 字符约 1 token/字，其余约 4 字符/token。"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int):
+    """截断 text 使其估计 token 数不超过 max_tokens。"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + "…"
@@ -0,0 +1,293 @@
+"""
+Durable work queue for scoring papers in several processes.
+
+The coordinator (ArxivDaily with a broker) submits one task per paper, keyed
+by (run_id, arXiv_id), and collects results as workers (worker.py) finish
+them. Tasks are leased rather than popped: a worker that dies leaves its task
+to be claimed again once the lease expires, and a result for a task that is
+already done is ignored, so collection is idempotent and a resumed run picks
+up the results of the previous attempt. An expired lease counts as an
+attempt: a task that keeps crashing or hanging its worker ends up failed
+instead of being leased forever. Runs older than the retention period are
+removed together with their tasks.
+
+Each task carries a shard number derived from its arXiv_id, so workers can be
+pinned to a subset of shards (e.g. one worker pool per shard range).
+
+Brokers are pluggable: make_broker() resolves a URL by scheme through
+BROKERS. SQLiteBroker (sqlite:///queue.db, sqlite:////abs/path/queue.db)
+needs nothing but the standard library and is meant for many processes on
+one host: it uses WAL mode, which relies on shared memory between the
+processes and does not work on network filesystems (NFS, SMB). Workers on
+several hosts need a networked backend (e.g. Redis or PostgreSQL), which only
+has to implement the Broker methods and be registered in BROKERS.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+def shard_of(arXiv_id: str, num_shards: int):
+    return zlib.crc32(arXiv_id.encode("utf-8")) % num_shards
+
+
+class Broker:
+    """Broker 接口。所有方法都必须可以被多个进程同时调用。"""
+
+    def submit(self, run_id: str, run_info: dict, papers: list[dict]):
+        """提交一次运行的论文，已存在的任务保持不变。返回新加入的任务数。"""
+        raise NotImplementedError
+
+    def claim(self, worker: str, shards: list[int] = None):
+        """领取一个任务，返回 (run_id, run_info, paper)，没有可领取的任务时返回 None。"""
+        raise NotImplementedError
+
+    def complete(self, run_id: str, arXiv_id: str, result: dict = None, error: str = None):
+        """提交结果；result 为 None 表示处理失败，达到最大尝试次数前会重新排队。"""
+        raise NotImplementedError
+
+    def finished(self, run_id: str, exclude=()):
+        """
+        返回已结束（完成或最终失败）且不在 exclude 中的 [(arXiv_id, result 或 None)]。
+        exclude 应为之前调用已返回的 arXiv_id，结束的任务数没有变化时不必重新读取。
+        """
+        raise NotImplementedError
+
+    def remaining(self, run_id: str):
+        """尚未结束的任务数。"""
+        raise NotImplementedError
+
+    def cancel(self, run_id: str):
+        """取消仍在排队的任务。"""
+        raise NotImplementedError
+
+    def purge(self, older_than: float):
+        """删除创建早于 older_than 秒之前、且没有未结束任务的运行及其任务，返回删除的运行数。"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteBroker(Broker):
+    def __init__(
+        self,
+        path: str,
+        num_shards: int = 16,
+        lease_seconds: float = 600,
+        max_attempts: int = 3,
+        retention: float = 7 * 86400,
+    ):
+        """
+        lease_seconds: 任务被领取后的租期，超时未完成的任务可被其他 worker 重新领取，
+            应大于单篇论文的处理时间上限
+        max_attempts: 单个任务最多尝试次数，租期过期也算一次
+        retention: 提交新运行时删除早于这么多秒、已全部结束的运行；None 表示不删除
+        """
+        self.path = path
+        self.num_shards = num_shards
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                run_id TEXT NOT NULL,
+                arXiv_id TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                paper TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (run_id, arXiv_id)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, shard);
+            """
+        )
+
+    def submit(self, run_id: str, run_info: dict, papers: list[dict]):
+        rows = [
+            (run_id, p["arXiv_id"], shard_of(p["arXiv_id"], self.num_shards), json.dumps(p, ensure_ascii=False))
+            for p in papers
+        ]
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                new_run = self.conn.execute(
+                    "INSERT OR IGNORE INTO runs (run_id, info, created) VALUES (?, ?, ?)",
+                    (run_id, json.dumps(run_info, ensure_ascii=False), time.time()),
+                ).rowcount
+                before = self.conn.total_changes
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO tasks (run_id, arXiv_id, shard, paper) VALUES (?, ?, ?, ?)", rows
+                )
+                added = self.conn.total_changes - before
+                # 上次被取消的任务在重新提交时恢复排队
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'queued' WHERE run_id = ? AND status = 'cancelled'", (run_id,)
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if new_run and self.retention is not None:
+            self.purge(self.retention)
+        return added
+
+    def _expire(self, now: float):
+        """租期已过且尝试次数用完的任务记为失败，不再被领取。调用方持有 self.lock。"""
+        self.conn.execute(
+            "UPDATE tasks SET status = 'failed', error = 'lease expired', lease_until = NULL "
+            "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, self.max_attempts),
+        )
+
+    def claim(self, worker: str, shards: list[int] = None):
+        now = time.time()
+        shard_filter = ""
+        params = [now]
+        if shards:
+            shard_filter = f" AND shard IN ({','.join('?' * len(shards))})"
+            params += list(shards)
+        with self.lock:
+            # BEGIN IMMEDIATE 拿到写锁，保证同一任务不会被两个进程同时领取
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire(now)
+                row = self.conn.execute(
+                    "SELECT run_id, arXiv_id, paper FROM tasks "
+                    "WHERE (status = 'queued' OR (status = 'leased' AND lease_until < ?))"
+                    f"{shard_filter} LIMIT 1",
+                    params,
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                run_id, arXiv_id, paper = row
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE run_id = ? AND arXiv_id = ?",
+                    (worker, now + self.lease_seconds, run_id, arXiv_id),
+                )
+                info = self.conn.execute("SELECT info FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return run_id, json.loads(info), json.loads(paper)
+
+    def complete(self, run_id: str, arXiv_id: str, result: dict = None, error: str = None):
+        with self.lock:
+            if result is not None:
+                # 只有第一个结果生效，重复提交被忽略
+                self.conn.execute(
+                    "UPDATE tasks SET status = 'done', result = ?, lease_until = NULL "
+                    "WHERE run_id = ? AND arXiv_id = ? AND status != 'done'",
+                    (json.dumps(result, ensure_ascii=False), run_id, arXiv_id),
+                )
+            else:
+                self.conn.execute(
+                    "UPDATE tasks SET error = ?, lease_until = NULL, "
+                    "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END "
+                    "WHERE run_id = ? AND arXiv_id = ? AND status = 'leased'",
+                    (error, self.max_attempts, run_id, arXiv_id),
+                )
+
+    def finished(self, run_id: str, exclude=()):
+        with self.lock:
+            # 所有 worker 都崩溃时没有人领取任务，由轮询结果的一方把用完尝试次数的过期任务记为失败
+            self._expire(time.time())
+            # 轮询时大多没有新结果，先只数一下，避免每次读取全部已结束的任务
+            count = self.conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE run_id = ? AND status IN ('done', 'failed')", (run_id,)
+            ).fetchone()[0]
+            if count <= len(exclude):
+                return []
+            rows = self.conn.execute(
+                "SELECT arXiv_id, status FROM tasks WHERE run_id = ? AND status IN ('done', 'failed')",
+                (run_id,),
+            ).fetchall()
+            new = [(arXiv_id, status) for arXiv_id, status in rows if arXiv_id not in exclude]
+            out = []
+            for arXiv_id, status in new:
+                result = None
+                if status == "done":
+                    result = json.loads(
+                        self.conn.execute(
+                            "SELECT result FROM tasks WHERE run_id = ? AND arXiv_id = ?", (run_id, arXiv_id)
+                        ).fetchone()[0]
+                    )
+                out.append((arXiv_id, result))
+        return out
+
+    def remaining(self, run_id: str):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE run_id = ? AND status IN ('queued', 'leased')", (run_id,)
+            ).fetchone()[0]
+
+    def cancel(self, run_id: str):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE tasks SET status = 'cancelled' WHERE run_id = ? AND status = 'queued'", (run_id,)
+            )
+
+    def purge(self, older_than: float):
+        cutoff = time.time() - older_than
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                run_ids = [
+                    row[0]
+                    for row in self.conn.execute(
+                        "SELECT run_id FROM runs WHERE created < ? AND NOT EXISTS ("
+                        "SELECT 1 FROM tasks WHERE tasks.run_id = runs.run_id AND status IN ('queued', 'leased'))",
+                        (cutoff,),
+                    ).fetchall()
+                ]
+                for run_id in run_ids:
+                    self.conn.execute("DELETE FROM tasks WHERE run_id = ?", (run_id,))
+                    self.conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if run_ids:
+            print(f"Removed {len(run_ids)} finished runs from the work queue.")
+        return len(run_ids)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# URL scheme -> Broker 构造函数 (path) -> Broker
+BROKERS = {
+    "sqlite": SQLiteBroker,
+}
+
+
+def make_broker(url: str, **kwargs):
+    """根据 URL 创建 broker，如 sqlite:///queue.db（绝对路径写作 sqlite:////var/queue.db）；不带 scheme 时视为 SQLite 文件路径。"""
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return SQLiteBroker(url, **kwargs)
+    if scheme not in BROKERS:
+        raise ValueError(f"Unsupported broker: {scheme}")
+    path = rest[1:] if rest.startswith("/") else rest
+    return BROKERS[scheme](path, **kwargs)
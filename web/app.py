@@ -1,6 +1,13 @@
-from flask import Flask, request, jsonify, render_template
-import subprocess
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from datetime import datetime
+import hashlib
+import json
 import os
+import sys
+import threading
+import time
+
+from jobs import JobQueue, QueueFullError
 
 app = Flask(__name__)
 
@@ -16,105 +23,236 @@ DEFAULT_SENDER_PASSWORD = ''
 DEFAULT_SMTP_SERVER = 'smtp.qq.com'
 DEFAULT_SMTP_PORT = 465
 
+# 任务队列参数
+NUM_JOB_WORKERS = int(os.environ.get('ARXIV_JOB_WORKERS', 2))
+MAX_PENDING_JOBS = int(os.environ.get('ARXIV_MAX_PENDING_JOBS', 16))
+OUTBOX_RETRY_INTERVAL = 600  # 秒
+RUN_DEADLINE = 600  # 单个任务的时间预算（秒），超时后用已有结果发送
+
 WORKSPACE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKSPACE)
+
+from arxiv_daily import ArxivDaily  # noqa: E402
+from util.mailer import Mailer  # noqa: E402
+from util.request import ArxivFetcher  # noqa: E402
 
 @app.route('/', methods=['GET'])
 def index():
     return render_template('web.html')
 
-@app.route('/run_arxiv_daily', methods=['POST'])
-def run_arxiv_daily():
-    data = request.json
-    receiver = data.get('receiver')
-    categories = data.get('categories')
-    description = data.get('description')
-    language = data.get('language', 'zh')  # 默认中文
-    model = data.get('model', {})
-    zotero_id = data.get('zotero_id')
-    zotero_key = data.get('zotero_key')
-
-    # 校验必填项
-    if not receiver or not categories or not description:
-        return jsonify({'success': False, 'msg': '请填写所有必填项'}), 400
-
-    # 写入 description.txt
+def build_description(description):
+    """
+    基于 description.txt 中的 Zotero 文献库分析，拼接用户本次提交的提示词。
+    只在内存中生成，不写回共享文件，保证并发任务之间互不影响。
+    """
     desc_path = os.path.join(WORKSPACE, 'description.txt')
-    
+
     # 读取现有的 description.txt 内容
     try:
         with open(desc_path, 'r', encoding='utf-8') as f:
             existing_content = f.read()
     except FileNotFoundError:
-        # 如果文件不存在，创建默认结构
+        # 如果文件不存在，使用默认结构
         existing_content = "用户自定义提示词：\n\n\n\n\nZotero文献库分析：\n\n"
-    
+
     # 查找"用户自定义提示词："的位置
     prompt_marker = "用户自定义提示词："
     if prompt_marker in existing_content:
         # 找到标记位置，替换后面的内容
         marker_pos = existing_content.find(prompt_marker)
         marker_end = marker_pos + len(prompt_marker)
-        
+
         # 查找下一个主要标题的位置（如"Zotero文献库分析："）
         next_section_pos = existing_content.find("Zotero文献库分析：", marker_end)
-        
+
         if next_section_pos != -1:
             # 保留"用户自定义提示词："和后面的Zotero分析部分
-            new_content = existing_content[:marker_end] + "\n\n" + description + "\n\n" + existing_content[next_section_pos:]
-        else:
-            # 没有找到下一个标题，直接替换标记后的内容
-            new_content = existing_content[:marker_end] + "\n\n" + description + "\n\n"
-    else:
-        # 没有找到标记，在文件开头添加
-        new_content = f"{prompt_marker}\n\n{description}\n\n\nZotero文献库分析：\n\n"
-    
-    # 写入更新后的内容
-    with open(desc_path, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+            return existing_content[:marker_end] + "\n\n" + description + "\n\n" + existing_content[next_section_pos:]
+        # 没有找到下一个标题，直接替换标记后的内容
+        return existing_content[:marker_end] + "\n\n" + description + "\n\n"
+    # 没有找到标记，在开头添加
+    return f"{prompt_marker}\n\n{description}\n\n\nZotero文献库分析：\n\n"
+
+
+def job_key(params):
+    """
+    相同类别、描述、语言和模型在同一天内的结果完全可以复用，
+    以此作为任务合并与结果缓存的键（不包含收件人和 api_key）。
+    """
+    fields = {
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'categories': sorted(params['categories']),
+        'description': params['description'],
+        'language': params['language'],
+        'provider': params['provider'].lower(),
+        'model': params['model'],
+        'base_url': params['base_url'],
+    }
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# 长期复用的抓取器与推荐引擎：同一天相同类别只抓取一次，相同模型配置共享客户端、线程池和评分缓存
+fetcher = ArxivFetcher()
+engines = {}
+engines_lock = threading.Lock()
+
+
+def get_engine(params):
+    key = (params['provider'].lower(), params['model'], params['base_url'], params['api_key'])
+    with engines_lock:
+        if key not in engines:
+            save_dir = os.path.join(WORKSPACE, 'arxiv_history')
+            os.makedirs(save_dir, exist_ok=True)
+            engines[key] = ArxivDaily(
+                20,   # 减少最大论文数量
+                params['provider'],
+                params['model'],
+                params['base_url'],
+                params['api_key'],
+                2,    # 减少worker数量
+                0.7,
+                save_dir=save_dir,
+                fetcher=fetcher,
+            )
+        return engines[key]
+
+
+def build_email(params, on_event=None, cancel_event=None):
+    """在工作线程中抓取论文并生成邮件 HTML，失败时抛出异常。"""
+    start_time = time.monotonic()
+    engine = get_engine(params)
+    papers = engine.fetch(
+        params['categories'],
+        50,   # 减少每个类别的最大条目数
+        on_event=on_event,
+        cancel_event=cancel_event,
+    )
+    _, html = engine.run(
+        papers,
+        params['description'],
+        language=params['language'],
+        on_event=on_event,
+        cancel_event=cancel_event,
+        deadline=RUN_DEADLINE - (time.monotonic() - start_time),
+    )
+    return html
+
+
+# 共享的邮件发送器：复用 SMTP 会话，发送失败的邮件写入 outbox 由后台线程定期重试
+mailer = Mailer(
+    DEFAULT_SENDER,
+    DEFAULT_SENDER_PASSWORD,
+    DEFAULT_SMTP_SERVER,
+    DEFAULT_SMTP_PORT,
+    title='Daily arXiv',
+    outbox_dir=os.path.join(WORKSPACE, 'outbox'),
+)
+
+
+def retry_outbox():
+    while True:
+        time.sleep(OUTBOX_RETRY_INTERVAL)
+        try:
+            mailer.flush_outbox()
+        except Exception as e:
+            print(f"重试 outbox 出错: {e}")
+
+
+def deliver_email(html, params):
+    if mailer.send(html, [params['receiver']]):
+        raise RuntimeError('邮件发送失败，已加入重试队列')
+    return '邮件发送成功！'
+
+
+job_queue = JobQueue(build_email, deliver_email, max_workers=NUM_JOB_WORKERS, max_pending=MAX_PENDING_JOBS)
+
+
+@app.route('/run_arxiv_daily', methods=['POST'])
+def run_arxiv_daily():
+    data = request.json
+    receiver = data.get('receiver')
+    categories = data.get('categories')
+    description = data.get('description')
+    language = data.get('language', 'zh')  # 默认中文
+    model = data.get('model', {})
+    zotero_id = data.get('zotero_id')
+    zotero_key = data.get('zotero_key')
+
+    # 校验必填项
+    if not receiver or not categories or not description:
+        return jsonify({'success': False, 'msg': '请填写所有必填项'}), 400
 
     # 组装模型参数
     provider = model.get('provider') or DEFAULT_MODEL['provider']
     model_name = model.get('model') or DEFAULT_MODEL['model']
     base_url = model.get('base_url') or DEFAULT_MODEL['base_url']
     api_key = model.get('api_key') or DEFAULT_MODEL['api_key']
+    if provider.lower() != 'ollama' and (not base_url or not api_key):
+        return jsonify({'success': False, 'msg': 'OpenAI/SiliconFlow 需要填写 base_url 和 api_key'}), 400
 
-    # 构造命令
-    cmd = [
-        'python', os.path.join(WORKSPACE, 'main.py'),
-        '--categories', *categories,
-        '--provider', provider,
-        '--model', model_name,
-        '--base_url', base_url,
-        '--api_key', api_key,
-        '--smtp_server', DEFAULT_SMTP_SERVER,
-        '--smtp_port', str(DEFAULT_SMTP_PORT),
-        '--sender', DEFAULT_SENDER,
-        '--receiver', receiver,
-        '--sender_password', DEFAULT_SENDER_PASSWORD,
-        '--title', 'Daily arXiv',
-        '--description', desc_path,
-        '--save',
-        '--language', language,
-        '--max_paper_num', '20',  # 减少最大论文数量
-        '--max_entries', '50',    # 减少每个类别的最大条目数
-        '--num_workers', '2',     # 减少worker数量
-    ]
+    params = {
+        'receiver': receiver,
+        'categories': categories,
+        'description': build_description(description),
+        'language': language,
+        'provider': provider,
+        'model': model_name,
+        'base_url': base_url,
+        'api_key': api_key,
+    }
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)  # 增加到600秒
-        if result.returncode == 0:
-            return jsonify({'success': True, 'msg': '邮件发送成功！'})
-        else:
-            error_msg = result.stderr or result.stdout or '执行失败'
-            print(f"Command failed with return code {result.returncode}")
-            print(f"STDOUT: {result.stdout}")
-            print(f"STDERR: {result.stderr}")
-            return jsonify({'success': False, 'msg': error_msg})
-    except subprocess.TimeoutExpired:
-        return jsonify({'success': False, 'msg': '处理超时，请稍后重试或减少论文数量'})
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())  # 打印完整堆栈
-        return jsonify({'success': False, 'msg': str(e)})
+        job = job_queue.submit(params, key=job_key(params))
+    except QueueFullError:
+        return jsonify({'success': False, 'msg': '当前任务过多，请稍后重试'}), 503
+    return jsonify({'success': True, 'job_id': job.id, 'msg': '任务已提交，正在处理'}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'msg': '任务不存在'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    以 server-sent events 推送任务进度：阶段切换、单篇论文评分、当前 top-K 以及最终状态。
+    """
+    if job_queue.get(job_id) is None:
+        return jsonify({'success': False, 'msg': '任务不存在'}), 404
+
+    def stream():
+        sent = 0
+        while True:
+            events, done = job_queue.events(job_id, sent)
+            for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            sent += len(events)
+            if done:
+                break
+            if not events:
+                # 保持连接，防止被代理断开
+                yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not job_queue.cancel(job_id):
+        return jsonify({'success': False, 'msg': '任务不存在或已结束'}), 404
+    return jsonify({'success': True, 'msg': '任务已取消'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True) 
\ No newline at end of file
+    debug = True
+    # debug 模式下 Werkzeug 的 reloader 会在监视进程和服务进程中各执行一次本段，
+    # 只在真正处理请求的服务进程中重试 outbox，避免两个线程重复发送同一封邮件
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=retry_outbox, daemon=True).start()
+    app.run(host='0.0.0.0', port=8080, debug=debug) 
\ No newline at end of file
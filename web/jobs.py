@@ -0,0 +1,268 @@
+"""
+In-process job queue for the web app.
+
+Each submitted request becomes a Job that is executed by a bounded pool of
+worker threads, so the Flask request returns immediately with a job id and
+the client polls the status endpoint.
+
+A job is split into two steps: ``builder(params)`` produces the (expensive)
+result and ``deliverer(result, params)`` hands it to a single receiver.
+Jobs submitted with the same key while a build is in flight attach to that
+build instead of starting a new one, and finished results are kept in a
+small cache so that later identical jobs only run the delivery step. That
+step runs on a separate small pool, so a cached request never waits behind
+full builds.
+
+The builder also receives an ``on_event`` callback and a ``cancel_event``.
+Progress events are appended to every attached job's event log, which the
+web app streams to the browser; a build is cancelled once every job that
+was waiting on it has been cancelled.
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, params: dict, key: str = None):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.key = key
+        self.status = "queued"  # queued / running / success / failed / cancelled
+        self.msg = ""
+        self.coalesced = False  # 挂靠在其他任务的计算上
+        self.cached = False  # 直接复用了已缓存的结果
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []
+        self.build = None
+
+    @property
+    def done(self):
+        return self.status in ("success", "failed", "cancelled")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "msg": self.msg,
+            "coalesced": self.coalesced,
+            "cached": self.cached,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class _Build:
+    """一次共享的计算，以及所有等待其结果的任务。"""
+
+    def __init__(self, key: str, params: dict):
+        self.key = key
+        self.params = params
+        self.jobs = []
+        self.events = []
+        self.cancel_event = threading.Event()
+
+
+class JobQueue:
+    def __init__(
+        self,
+        builder,
+        deliverer,
+        max_workers: int = 2,
+        max_pending: int = 16,
+        max_history: int = 256,
+        max_results: int = 64,
+        delivery_workers: int = 2,
+    ):
+        """
+        参数：
+            builder: 生成结果的函数，接收 (job.params, on_event, cancel_event)，失败时抛出异常
+            deliverer: 投递结果的函数，接收 (result, job.params)，返回提示信息
+            max_workers: 同时运行的任务数
+            max_pending: 排队中的任务上限，超过时拒绝新任务
+            max_history: 保留的已完成任务数量，供状态查询
+            max_results: 缓存的结果数量（按 key）
+            delivery_workers: 投递缓存结果的线程数，与构建任务的线程池分开
+        """
+        self.builder = builder
+        self.deliverer = deliverer
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.max_results = max_results
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="arxiv-job")
+        # 命中缓存的任务只需投递，不应排在耗时的构建后面
+        self.delivery_executor = ThreadPoolExecutor(delivery_workers, thread_name_prefix="arxiv-deliver")
+        self.jobs = {}
+        self.inflight = {}
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+
+    def submit(self, params: dict, key: str = None) -> Job:
+        with self.cond:
+            job = Job(params, key)
+            if key is not None and key in self.results:
+                self.results.move_to_end(key)
+                job.cached = True
+                self._admit(job)
+                self.delivery_executor.submit(self._deliver, job, self.results[key])
+            elif key is not None and key in self.inflight:
+                job.coalesced = True
+                self.jobs[job.id] = job
+                build = self.inflight[key]
+                build.jobs.append(job)
+                job.build = build
+                job.events.extend(build.events)
+                if build.jobs[0].status == "running":
+                    self._start(job)
+            else:
+                self._admit(job)
+                build = _Build(key, params)
+                build.jobs.append(job)
+                job.build = build
+                if key is not None:
+                    self.inflight[key] = build
+                self.executor.submit(self._run, build)
+            self._prune()
+        return job
+
+    def get(self, job_id: str):
+        with self.cond:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        取消任务。挂靠在共享计算上的任务只会解除挂靠，
+        当所有等待者都取消后才真正终止计算，释放工作线程。
+        """
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.finished_at = time.time()
+            self._set_status(job, "cancelled", "任务已取消")
+            build = job.build
+            if build is not None and job in build.jobs:
+                build.jobs.remove(job)
+                if not build.jobs:
+                    build.cancel_event.set()
+                    if self.inflight.get(build.key) is build:
+                        self.inflight.pop(build.key)
+            return True
+
+    def events(self, job_id: str, start: int = 0, timeout: float = 15.0):
+        """
+        返回任务从 start 开始的新事件；没有新事件时最多阻塞 timeout 秒。
+        返回 (events, done)。
+        """
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return [], True
+            if len(job.events) <= start and not job.done:
+                self.cond.wait(timeout)
+            return job.events[start:], job.done
+
+    def _emit(self, jobs, event: dict):
+        # 调用方需持有 self.cond
+        for job in jobs:
+            job.events.append(event)
+        self.cond.notify_all()
+
+    def _set_status(self, job: Job, status: str, msg: str = ""):
+        # 调用方需持有 self.cond
+        job.status = status
+        job.msg = msg or ""
+        self._emit([job], {"type": "status", "status": status, "msg": job.msg})
+
+    def _admit(self, job: Job):
+        # 挂靠任务不占用工作线程，不计入排队上限
+        pending = sum(
+            1 for j in self.jobs.values() if j.status == "queued" and not j.coalesced
+        )
+        if pending >= self.max_pending:
+            raise QueueFullError(f"Too many pending jobs ({pending}).")
+        self.jobs[job.id] = job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.done]
+        if len(finished) <= self.max_history:
+            return
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[: len(finished) - self.max_history]:
+            del self.jobs[job.id]
+
+    def _start(self, job: Job):
+        # 调用方需持有 self.cond
+        if job.status == "queued":
+            job.started_at = time.time()
+            self._set_status(job, "running")
+
+    def _finish(self, job: Job, status: str, msg: str):
+        with self.cond:
+            if job.done:
+                return
+            job.finished_at = time.time()
+            self._set_status(job, status, msg)
+
+    def _deliver(self, job: Job, result):
+        with self.cond:
+            if job.done:
+                return
+            self._start(job)
+        try:
+            self._finish(job, "success", self.deliverer(result, job.params))
+        except Exception as e:
+            print(traceback.format_exc())
+            self._finish(job, "failed", str(e))
+
+    def _on_event(self, build: _Build, event: dict):
+        with self.cond:
+            build.events.append(event)
+            self._emit(build.jobs, event)
+
+    def _run(self, build: _Build):
+        with self.cond:
+            if build.cancel_event.is_set():
+                return
+            for job in build.jobs:
+                self._start(job)
+        try:
+            result = self.builder(
+                build.params,
+                lambda event: self._on_event(build, event),
+                build.cancel_event,
+            )
+        except Exception as e:
+            if not build.cancel_event.is_set():
+                print(traceback.format_exc())
+            with self.cond:
+                if self.inflight.get(build.key) is build:
+                    self.inflight.pop(build.key)
+                jobs = list(build.jobs)
+            for job in jobs:
+                self._finish(job, "failed", str(e))
+            return
+
+        # 出栈并缓存结果在同一把锁内完成，之后的相同任务会直接命中缓存
+        with self.cond:
+            if self.inflight.get(build.key) is build:
+                self.inflight.pop(build.key)
+            if build.key is not None:
+                self.results[build.key] = result
+                while len(self.results) > self.max_results:
+                    self.results.popitem(last=False)
+            jobs = list(build.jobs)
+        for job in jobs:
+            self._deliver(job, result)
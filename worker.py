@@ -0,0 +1,125 @@
+from arxiv_daily import ArxivDaily, RunContext
+from llm import get_model
+from util.workqueue import make_broker
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, wait
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+
+
+def work(args, worker_id: str):
+    """Claim papers from the broker and score them until idle_exit seconds pass without work."""
+    model = get_model(
+        args.provider,
+        args.model,
+        args.base_url,
+        args.api_key,
+        hedge=not args.no_hedge,
+        timeout=args.call_timeout,
+    )
+    daily = ArxivDaily(
+        0,
+        args.provider,
+        args.model,
+        args.base_url,
+        args.api_key,
+        args.num_workers,
+        args.temperature,
+        llm=model,
+        paper_timeout=args.paper_timeout or None,
+    )
+    broker = make_broker(args.broker, lease_seconds=args.lease_seconds)
+    runs = OrderedDict()  # run_id -> RunContext, the prompt is parsed once per run
+    inflight = {}
+    scored = 0
+    idle_since = time.monotonic()
+    print(f"Worker {worker_id} started.")
+    try:
+        while True:
+            while len(inflight) < args.num_workers:
+                task = broker.claim(worker_id, args.shards)
+                if task is None:
+                    break
+                run_id, info, paper = task
+                if run_id not in runs:
+                    runs[run_id] = RunContext(
+                        info["description"], info.get("language", "zh"), interest=info.get("interest")
+                    )
+                    while len(runs) > 16:
+                        runs.popitem(last=False)
+                runs.move_to_end(run_id)
+                deadline = time.monotonic() + args.paper_timeout if args.paper_timeout else None
+                future = daily.executor.submit(daily.process_paper, paper, runs[run_id], 5, deadline)
+                inflight[future] = (run_id, paper["arXiv_id"])
+            if not inflight:
+                if args.idle_exit and time.monotonic() - idle_since > args.idle_exit:
+                    break
+                time.sleep(args.poll)
+                continue
+            finished, _ = wait(inflight, timeout=args.poll, return_when=FIRST_COMPLETED)
+            for future in finished:
+                run_id, arXiv_id = inflight.pop(future)
+                try:
+                    result = future.result()
+                    error = None if result else "no valid response"
+                except Exception as e:
+                    result, error = None, str(e)
+                broker.complete(run_id, arXiv_id, result, error)
+                scored += result is not None
+            idle_since = time.monotonic()
+    finally:
+        # Unfinished leases expire and are claimed by another worker
+        daily.close()
+        broker.close()
+        if hasattr(model, "close"):
+            model.close()
+    print(f"Worker {worker_id} exits after scoring {scored} papers.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score papers submitted by main.py --broker")
+    parser.add_argument("--broker", type=str, help="Work queue, e.g. sqlite:///queue.db", required=True)
+    parser.add_argument("--provider", type=str, help="provider", required=True)
+    parser.add_argument("--model", type=str, help="model", required=True)
+    parser.add_argument("--base_url", type=str, help="base_url, comma-separated for a pool", default=None)
+    parser.add_argument("--api_key", type=str, help="api_key", default=None)
+    parser.add_argument("--temperature", type=float, help="Temperature", default=0.7)
+    parser.add_argument("--call_timeout", type=float, help="Timeout (s) of a single LLM request", default=60)
+    parser.add_argument(
+        "--paper_timeout", type=float, help="Give up on a paper after this many seconds, 0 for no limit", default=300
+    )
+    parser.add_argument("--no_hedge", action="store_true", help="Do not hedge requests across a pool")
+    parser.add_argument("--num_workers", type=int, help="Papers in flight per process", default=4)
+    parser.add_argument("--processes", type=int, help="Number of worker processes", default=1)
+    parser.add_argument(
+        "--shards", type=int, nargs="+", help="Only claim papers in these shards (0-15)", default=None
+    )
+    parser.add_argument(
+        "--lease_seconds",
+        type=float,
+        help="A claimed paper is handed to another worker if not finished within this time",
+        default=600,
+    )
+    parser.add_argument("--poll", type=float, help="Seconds between polls of an empty queue", default=2)
+    parser.add_argument(
+        "--idle_exit", type=float, help="Exit after this many idle seconds, 0 to run forever", default=0
+    )
+    parser.add_argument("--worker_id", type=str, help="Worker name", default=None)
+    args = parser.parse_args()
+    args.provider = args.provider.lower()
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    if args.processes <= 1:
+        work(args, worker_id)
+    else:
+        processes = [
+            multiprocessing.Process(target=work, args=(args, f"{worker_id}-{i}"))
+            for i in range(args.processes)
+        ]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
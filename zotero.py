@@ -1,63 +1,296 @@
 from pyzotero import zotero
+import hashlib
+import json
 import os
-from llm import GPT, Ollama
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm import PROVIDERS, get_model
+from util.tokens import estimate_tokens, truncate_tokens
+
+ITEM_TYPES = 'conferencePaper || journalArticle || preprint'
+PAGE_SIZE = 100  # Zotero API 单页上限
+CHUNK_TOKENS = 6000  # 每批文献的 token 预算
+REDUCE_TOKENS = 8000  # 每次合并的部分画像 token 预算
+MAX_REDUCE_ROUNDS = 4  # 分组合并的最多轮数，之后截断后一次合并
+
+
+class ZoteroMirror:
+    """
+    Zotero文献库的本地镜像。
+    利用文献库版本号（since=）增量同步，只拉取上次同步后变更的条目，
+    已删除、移入回收站或改成其他类型的条目从镜像中移除；首次同步时多页并发请求。镜像保存在 cache_dir/<library_type>_<library_id>.json。
+    """
+
+    def __init__(self, library_id, api_key, library_type='user', cache_dir='zotero_cache', num_workers=4):
+        self.library_id = str(library_id).strip()
+        self.api_key = str(api_key).strip()
+        self.library_type = library_type
+        self.num_workers = num_workers
+        self.path = os.path.join(cache_dir, f"{library_type}_{self.library_id}.json")
+        self.version = 0
+        self.items = {}  # key -> {"version": ..., "data": {...}}
+        self.meta = {}  # 其他需要持久化的信息，如上次分析的样本哈希
+        self._load()
+
+    def _client(self):
+        return zotero.Zotero(self.library_id, self.library_type, self.api_key)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Zotero缓存损坏，将重新同步: {e}")
+            return
+        self.version = cache.get('version', 0)
+        self.items = cache.get('items', {})
+        self.meta = cache.get('meta', {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'items': self.items, 'meta': self.meta}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _slim(item):
+        data = item['data']
+        return {
+            'version': item.get('version', data.get('version', 0)),
+            'data': {
+                'title': data.get('title', ''),
+                'abstractNote': data.get('abstractNote', ''),
+                'tags': [{'tag': t['tag']} for t in data.get('tags', [])],
+                'date': data.get('date', ''),
+                'dateAdded': data.get('dateAdded', ''),
+                'itemType': data.get('itemType', ''),
+            },
+        }
+
+    def _fetch_changed(self, zot, since):
+        """拉取 since 之后变更的条目。第一页确定总数，其余页并发请求。"""
+        first = zot.items(itemType=ITEM_TYPES, since=since, limit=PAGE_SIZE, start=0)
+        try:
+            total = int(zot.request.headers.get('Total-Results'))
+        except (AttributeError, TypeError, ValueError):
+            # 拿不到总数时退回串行翻页
+            return zot.everything(zot.items(itemType=ITEM_TYPES, since=since))
+        starts = range(PAGE_SIZE, total, PAGE_SIZE)
+        if not starts:
+            return first
+
+        def fetch_page(start):
+            return self._client().items(itemType=ITEM_TYPES, since=since, limit=PAGE_SIZE, start=start)
+
+        with ThreadPoolExecutor(self.num_workers) as executor:
+            pages = list(executor.map(fetch_page, starts))
+        return first + [item for page in pages for item in page]
+
+    def sync(self):
+        """与远端同步，返回本次更新（含删除）的条目数。"""
+        zot = self._client()
+        remote_version = zot.last_modified_version()
+        if remote_version == self.version and self.items:
+            print(f"Zotero文献库无变化（版本 {remote_version}）。")
+            return 0
+        since = self.version if self.items else 0
+
+        changed = [item for item in self._fetch_changed(zot, since) if not item['data'].get('deleted')]
+        for item in changed:
+            self.items[item['key']] = self._slim(item)
+        removed = set()
+        if since:
+            removed.update(zot.deleted(since=since).get('items', []))
+            # 移入回收站或改成其他类型的条目同样有新版本，但不在上面按类型拉取的结果中
+            kept = {item['key'] for item in changed}
+            versions = zot.item_versions(since=since, includeTrashed=1)
+            removed.update(key for key in versions if key not in kept)
+            removed &= set(self.items)
+            for key in removed:
+                del self.items[key]
+
+        self.version = remote_version
+        self.save()
+        print(f"Zotero同步完成：{len(changed)} 篇更新，{len(removed)} 篇移除，共 {len(self.items)} 篇。")
+        return len(changed) + len(removed)
+
+    def recent_items(self, n=None):
+        """有摘要的文献按导入时间从新到旧排序，取前 n 篇（None 表示全部）。返回 [(key, item), ...]。"""
+        items = [(key, item) for key, item in self.items.items() if item['data'].get('abstractNote')]
+        items.sort(key=lambda x: (x[1]['data'].get('dateAdded', ''), x[0]), reverse=True)
+        return items[:n] if n is not None else items
+
+
+def sample_hash(sample_items, provider, model):
+    """样本条目（键与版本）和模型都没变时，分析结果可以直接复用。"""
+    fingerprint = [provider.lower(), model] + [[key, item['version']] for key, item in sample_items]
+    return hashlib.sha256(json.dumps(fingerprint).encode('utf-8')).hexdigest()
+
+
+def format_item(item):
+    data = item['data']
+    tags = ','.join([t['tag'] for t in data.get('tags', [])])
+    return f"标题: {data.get('title', '')}\n年份: {data.get('date', '')}\n标签: {tags}\n摘要: {data.get('abstractNote', '')}"
+
+
+def make_chunks(items, max_tokens=CHUNK_TOKENS):
+    """
+    按导入时间从旧到新把文献装入 token 预算内的批次。
+    旧文献的分批保持稳定，新增文献只会改变最后几批，已分析的批次可以直接命中缓存。
+    items: [(key, item), ...]
+    """
+    items = sorted(items, key=lambda x: (x[1]['data'].get('dateAdded', ''), x[0]))
+    chunks = []
+    current = []
+    current_tokens = 0
+    for key, item in items:
+        tokens = estimate_tokens(format_item(item))
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append((key, item))
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+MAP_PROMPT = """
+以下是某位用户Zotero文献库中的一批文献（导入时间 {start} 至 {end}，共 {count} 篇）。
+请分析这批文献体现的研究方向、感兴趣领域、代表性主题和常用方法，用中文简洁地分条总结：\n\n{papers_text}
+"""
+
+REDUCE_PROMPT = """
+以下是对同一位用户Zotero文献库分批分析得到的部分画像，按导入时间从旧到新排列，越新的批次越能代表当前兴趣。
+请将它们合并为一份完整的用户研究画像，分析该用户的主要研究方向、感兴趣领域、代表性主题、常用方法等，并用中文总结：\n\n{partials}\n\n请用条理清晰的段落进行总结。
+"""
+
+
+def summarize_chunk(llm, chunk):
+    start = chunk[0][1]['data'].get('dateAdded', '')[:10]
+    end = chunk[-1][1]['data'].get('dateAdded', '')[:10]
+    papers_text = '\n---\n'.join(format_item(item) for _, item in chunk)
+    prompt = MAP_PROMPT.format(start=start, end=end, count=len(chunk), papers_text=papers_text)
+    return f"【{start} 至 {end}，{len(chunk)} 篇】\n" + llm.inference(prompt, temperature=0.3).strip()
+
+
+def reduce_partials(llm, partials, max_tokens=REDUCE_TOKENS, num_workers=4, max_rounds=MAX_REDUCE_ROUNDS):
+    """
+    合并部分画像；超出预算时先分组合并，逐层归约。
+    每组至少合并两份（单份超出一半预算时先截断），每轮份数至少减半；
+    max_rounds 轮后仍超出预算时，把每份截断到能放进一次合并为止。
+    """
+    def merge(group):
+        prompt = REDUCE_PROMPT.format(partials='\n\n'.join(group))
+        return llm.inference(prompt, temperature=0.3).strip()
+
+    for _ in range(max_rounds):
+        if len(partials) == 1 or sum(estimate_tokens(p) for p in partials) <= max_tokens:
+            return merge(partials)
+        partials = [truncate_tokens(p, max_tokens // 2) for p in partials]
+        groups = []
+        current = []
+        current_tokens = 0
+        for partial in partials:
+            tokens = estimate_tokens(partial)
+            if len(current) >= 2 and current_tokens + tokens > max_tokens:
+                groups.append(current)
+                current = []
+                current_tokens = 0
+            current.append(partial)
+            current_tokens += tokens
+        if len(current) == 1 and groups:
+            # 最后剩下的一份并入前一组，保证每组至少两份
+            groups[-1].append(current[0])
+        elif current:
+            groups.append(current)
+        with ThreadPoolExecutor(num_workers) as executor:
+            partials = list(executor.map(merge, groups))
+    budget = max(1, max_tokens // len(partials))
+    return merge([truncate_tokens(p, budget) for p in partials])
 
 
 # Zotero文献库分析主函数
-def analyze_zotero_library(library_id, api_key, provider, model, base_url=None, llm_api_key=None, description_path="description.txt"):
+def analyze_zotero_library(library_id, api_key, provider, model, base_url=None, llm_api_key=None, description_path="description.txt", library_type='user', cache_dir='zotero_cache', max_items=None, num_workers=4):
     """
     深度分析用户Zotero文献库，自动总结研究方向和兴趣领域，并写入description.txt。
+    文献按 token 预算分批并行总结（map），再合并为完整画像（reduce）；每批的总结按内容哈希缓存，只有新增或变更的批次需要重新分析。
     参数：
-        library_id: Zotero用户ID
+        library_id: Zotero用户ID（或群组ID）
         api_key: Zotero API密钥
         provider: LLM提供方（如OpenAI、Ollama等）
         model: LLM模型名
         base_url: LLM API base_url（如有）
         llm_api_key: LLM API密钥（如有）
         description_path: description.txt路径
+        library_type: 'user' 或 'group'
+        cache_dir: 本地文献库镜像目录
+        max_items: 只分析导入时间最近的 max_items 篇，None 表示整个文献库
+        num_workers: 并行调用大模型的线程数
     """
     # 参数验证
     if not library_id or not api_key:
         raise ValueError("library_id和api_key不能为空")
-    
-    # 确保参数是字符串类型
-    library_id = str(library_id).strip()
-    api_key = str(api_key).strip()
-    
-    # 1. 连接Zotero，获取全部文献
-    zot = zotero.Zotero(library_id, 'user', api_key)
-    # 获取所有文献（会议论文、期刊论文、预印本）
-    items = zot.everything(zot.items(itemType='conferencePaper || journalArticle || preprint'))
-    # 过滤有摘要的文献
-    items = [item for item in items if item['data'].get('abstractNote')]
-    # 按导入时间排序（新到旧），取最近导入的100篇论文
-    items.sort(key=lambda x: x['data'].get('dateAdded', ''), reverse=True)
-    sample_items = items[:100]  # 取时间离现在最近的100篇论文
-    paper_infos = []
-    for item in sample_items:
-        title = item['data'].get('title', '')
-        abstract = item['data'].get('abstractNote', '')
-        tags = ','.join([t['tag'] for t in item['data'].get('tags', [])])
-        year = item['data'].get('date', '')
-        paper_infos.append(f"标题: {title}\n年份: {year}\n标签: {tags}\n摘要: {abstract}")
-    papers_text = '\n---\n'.join(paper_infos)
-
-    # 3. 构建大模型分析prompt
-    prompt = f"""
-请根据以下Zotero文献库内容，分析该用户的主要研究方向、感兴趣领域、代表性主题、常用方法等，并用中文总结：\n\n{papers_text}\n\n请用条理清晰的段落进行总结。
-"""
-
-    # 4. 调用大模型分析
-    if provider.lower() == 'openai' or provider.lower() == 'siliconflow':
-        llm = GPT(model, base_url, llm_api_key)
-        analysis = llm.inference(prompt, temperature=0.3)
-    elif provider.lower() == 'ollama':
-        llm = Ollama(model)
-        analysis = llm.inference(prompt)
-    else:
+    if provider.lower() not in PROVIDERS:
         raise ValueError(f"暂不支持的provider: {provider}")
 
+    # 1. 增量同步本地镜像（会议论文、期刊论文、预印本）
+    mirror = ZoteroMirror(library_id, api_key, library_type, cache_dir)
+    mirror.sync()
+    # 有摘要的文献，按导入时间从新到旧
+    selected = mirror.recent_items(max_items)
+    if not selected:
+        raise ValueError("Zotero文献库中没有带摘要的文献")
+
+    # 2. 文献集合没有变化时直接复用上次的分析结果
+    digest = sample_hash(selected, provider, model)
+    if digest == mirror.meta.get('analysis_hash') and mirror.meta.get('analysis'):
+        print("Zotero样本未变化，跳过大模型分析。")
+        write_zotero_analysis(mirror.meta['analysis'], description_path)
+        return mirror.meta['analysis']
+
+    # 3. map：分批总结，已缓存的批次跳过
+    llm = get_model(provider, model, base_url, llm_api_key)
+    chunks = make_chunks(selected)
+    chunk_hashes = [sample_hash(chunk, provider, model) for chunk in chunks]
+    # 只保留当前仍在使用的批次
+    old = mirror.meta.get('chunk_summaries', {})
+    cached = {h: old[h] for h in chunk_hashes if h in old}
+    mirror.meta['chunk_summaries'] = cached
+    todo = [(h, chunk) for h, chunk in zip(chunk_hashes, chunks) if h not in cached]
+    print(f"Zotero文献共 {len(selected)} 篇，分为 {len(chunks)} 批，其中 {len(todo)} 批需要分析。")
+    # 每批完成后立即写入缓存：某一批失败时，其余已完成的批次在重新运行时不必再付费
+    errors = []
+    with ThreadPoolExecutor(num_workers) as executor:
+        futures = {executor.submit(summarize_chunk, llm, chunk): h for h, chunk in todo}
+        for future in as_completed(futures):
+            try:
+                cached[futures[future]] = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            mirror.save()
+    if errors:
+        print(f"{len(errors)} 批文献分析失败，已完成的 {len(todo) - len(errors)} 批已缓存。")
+        raise errors[0]
+    mirror.save()
+
+    # 4. reduce：合并部分画像
+    analysis = reduce_partials(llm, [cached[h] for h in chunk_hashes], num_workers=num_workers)
+    mirror.meta['analysis_hash'] = digest
+    mirror.meta['analysis'] = analysis
+    mirror.save()
+
     # 5. 写入description.txt
+    write_zotero_analysis(analysis, description_path)
+    return analysis
+
+
+def write_zotero_analysis(analysis, description_path="description.txt"):
+    """将分析结果写入description.txt的“Zotero文献库分析：”段落。"""
     # 读取原文件内容
     if not os.path.exists(description_path):
         with open(description_path, 'w', encoding='utf-8') as f: